@@ -3,99 +3,94 @@ Library to control MagicSwitchbot devices using BLEAK
 
 @author: ec-blaster
 @since: September 2022
-@license: MIT 
+@license: MIT
 """
 
-import asyncio, logging
-import bleak
-from bleak_retry_connector import BleakClient, establish_connection
-from typing import Any
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
 from .consts import *
-from .device import MagicSwitchbotDevice
-from .discovery import parse_advertisement_data
-from .models import MagicSwitchbotAdvertisement
 
-_LOGGER = logging.getLogger(__name__)
+'''The classes are imported on first use, so importing the package doesn't load
+bleak, bleak_retry_connector or pycryptodome until they are actually needed'''
+_LAZY_IMPORTS = {
+    "MagicSwitchbot": ".switchbot",
+    "MagicSwitchbotDevice": ".device",
+    "MagicSwitchbotDaemon": ".daemon",
+    "MagicSwitchbotDaemonClient": ".daemon",
+    "MagicSwitchbotDaemonError": ".daemon",
+    "GetMagicSwitchbotDevices": ".discovery",
+    "MagicSwitchbotAdvertisementBus": ".discovery",
+    "MagicSwitchbotAdvertisementFilter": ".discovery",
+    "MagicSwitchbotMultiAdapterScanner": ".discovery",
+    "get_advertisement_bus": ".discovery",
+    "parse_advertisement_data": ".discovery",
+    "MagicSwitchbotFleet": ".fleet",
+    "MagicSwitchbotMetrics": ".metrics",
+    "MagicSwitchbotMetricsRegistry": ".metrics",
+    "MagicSwitchbotAdvertisement": ".models",
+    "MagicSwitchbotCommandResult": ".models",
+    "MagicSwitchbotEvent": ".models",
+    "MagicSwitchbotFleetResult": ".models",
+    "MagicSwitchbotObserver": ".observer",
+    "MagicSwitchbotConnectionPool": ".pool",
+    "MagicSwitchbotRegistry": ".registry",
+    "MagicSwitchbotSyncClient": ".sync",
+    "MagicSwitchbotSyncDevice": ".sync",
+    "AdaptiveDisconnectPolicy": ".policy",
+    "AlwaysConnectedPolicy": ".policy",
+    "DisconnectPolicy": ".policy",
+    "FixedDisconnectPolicy": ".policy",
+    "ImmediateDisconnectPolicy": ".policy",
+    "RetryPolicy": ".policy",
+    # Previous versions exposed these through the package
+    "BleakClient": "bleak_retry_connector",
+    "establish_connection": "bleak_retry_connector",
+}
 
-class MagicSwitchbot(MagicSwitchbotDevice):
-    """Representation of a MagicSwitchbot."""
-    
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        """MagicSwitchbot constructor."""
-        super().__init__(*args, **kwargs)
+from . import consts as _consts
 
-    async def update(self, interface: int | None=None) -> None:
-        """Update mode, battery percent and state of device."""
-        await self.get_device_data(retry=self._retry_count, interface=interface)
+__all__ = [name for name in vars(_consts) if not name.startswith("_")] + list(_LAZY_IMPORTS)
 
-    async def turn_on(self) -> bool:
-        """Turns the device on."""
-        result = await self._sendCommand(CMD_SWITCH, PAR_SWITCHON, self._retry_count)
-        
-        if result:
-          self._override_adv_data = {"isOn": True}
-          
-        _LOGGER.debug(
-            "MagicSwitchbot[%s]: Turn on result: %s -> %s", self._device.address, result, self._override_adv_data
-        )
-        self._fire_callbacks()
-        return result
+if TYPE_CHECKING:
+    from bleak_retry_connector import BleakClient, establish_connection
 
-    async def turn_off(self) -> bool:
-        """Turns the device off."""
-        result = await self._sendCommand(CMD_SWITCH, PAR_SWITCHOFF, self._retry_count)
-        
-        if result:
-          self._override_adv_data = {"isOn": False}
-          
-        _LOGGER.debug(
-            "MagicSwitchbot[%s]: Turn off result: %s -> %s", self._device.address, result, self._override_adv_data
-        )
-        self._fire_callbacks()
-        return result
-      
-    async def push(self) -> bool:
-        """Just pushes a button"""
-        result = await self._sendCommand(CMD_SWITCH, PAR_SWITCHPUSH, self._retry_count)
-        
-        _LOGGER.debug(
-            "MagicSwitchbot[%s]: Push result: %s", self._device.address, result
-        )
-        self._fire_callbacks()
-        return result
-      
-    async def get_basic_info(self) -> dict[str, Any] | None:
-        """Get device basic settings."""
-        ok = await self._sendCommand(CMD_GETBAT, "01", self._retry_count)
-        
-        if not ok:
-            return None
-        return {
-            "battery": self._battery,
-            "firmware": f"{self._ver_major}.{self._ver_minor}",
-            "chip_type": self._chip_type,
-            "device_type": self._dev_type,
-            "password_enabled": self._en_pwd
-        }
-        
-    async def get_battery(self) -> int | None:
-        """Gets the device's battery level
-        Return
-            int
-                Level of the device's battery, from 0 to 100
-        """
-        ok = await self._sendCommand(CMD_GETBAT, "01", self._retry_count)
-        if ok:
-            return self._battery
-        else:
-            return None
+    from .daemon import MagicSwitchbotDaemon, MagicSwitchbotDaemonClient, MagicSwitchbotDaemonError
+    from .device import MagicSwitchbotDevice
+    from .discovery import (GetMagicSwitchbotDevices,
+        MagicSwitchbotAdvertisementBus,
+        MagicSwitchbotAdvertisementFilter,
+        MagicSwitchbotMultiAdapterScanner,
+        get_advertisement_bus,
+        parse_advertisement_data)
+    from .fleet import MagicSwitchbotFleet
+    from .metrics import MagicSwitchbotMetrics, MagicSwitchbotMetricsRegistry
+    from .models import (MagicSwitchbotAdvertisement,
+        MagicSwitchbotCommandResult,
+        MagicSwitchbotEvent,
+        MagicSwitchbotFleetResult)
+    from .observer import MagicSwitchbotObserver
+    from .policy import (AdaptiveDisconnectPolicy,
+        AlwaysConnectedPolicy,
+        DisconnectPolicy,
+        FixedDisconnectPolicy,
+        ImmediateDisconnectPolicy,
+        RetryPolicy)
+    from .pool import MagicSwitchbotConnectionPool
+    from .registry import MagicSwitchbotRegistry
+    from .switchbot import MagicSwitchbot
+    from .sync import MagicSwitchbotSyncClient, MagicSwitchbotSyncDevice
 
-    def is_on(self) -> bool | None:
-        """Return switch's latest state"""
-        value = self._get_adv_value("isOn")
-        if value is None:
-            return None
-        return value
-    
 
+def __getattr__(name: str) -> Any:
+    """Imports the public classes of the package on first use (PEP 562)."""
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *_LAZY_IMPORTS})
@@ -0,0 +1,360 @@
+"""Command line tool to discover and drive many MagicSwitchbot devices at once
+
+Usage examples:
+
+    python -m magicswitchbot discover --scan-timeout 10
+    python -m magicswitchbot battery AA:BB:CC:DD:EE:FF 11:22:33:44:55:66
+    python -m magicswitchbot push --file devices.txt --interface 0 --interface 1
+    cat devices.txt | python -m magicswitchbot off --concurrency 5
+    python -m magicswitchbot daemon --socket /run/magicswitchbot.sock --file devices.txt
+    python -m magicswitchbot on AA:BB:CC:DD:EE:FF --socket /run/magicswitchbot.sock
+
+Every result is written to stdout as a line of JSON as soon as it is available.
+Devices are read from the command line, from `--file` or from stdin, one per line
+as `ADDRESS [PASSWORD]`. Blank lines and lines starting with # are ignored.
+
+The `daemon` command keeps the devices connected and serves requests on a Unix
+socket. The other commands send their requests through it when `--socket` is given.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import sys
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Iterable, TextIO
+
+from .consts import (DEFAULT_FLEET_CONCURRENCY,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_RETRY_COUNT,
+    DEFAULT_SCAN_TIMEOUT)
+from .daemon import (MagicSwitchbotDaemon,
+    MagicSwitchbotDaemonClient,
+    MagicSwitchbotDaemonError,
+    default_socket_path)
+from .discovery import GetMagicSwitchbotDevices
+from .fleet import MagicSwitchbotFleet
+from .models import MagicSwitchbotAdvertisement, MagicSwitchbotFleetResult
+from .policy import ImmediateDisconnectPolicy
+from .registry import MagicSwitchbotRegistry
+from .switchbot import MagicSwitchbot
+
+_LOGGER = logging.getLogger(__name__)
+
+'''Device method run by each command of the tool'''
+COMMANDS = {
+    "battery": "get_battery",
+    "info": "get_basic_info",
+    "on": "turn_on",
+    "off": "turn_off",
+    "push": "push",
+}
+
+'''Daemon request sent by each command of the tool'''
+DAEMON_REQUESTS = {
+    "battery": ("battery", {}),
+    "info": ("info", {}),
+    "on": ("switch", {"on": True}),
+    "off": ("switch", {"on": False}),
+    "push": ("push", {}),
+}
+
+
+def _emit(record: dict[str, Any]) -> None:
+    """Writes a result as a line of JSON."""
+    sys.stdout.write(json.dumps(record, default=str) + "\n")
+    sys.stdout.flush()
+
+
+def _read_targets(lines: Iterable[str], password: str | None) -> dict[str, str | None]:
+    """Reads `ADDRESS [PASSWORD]` lines and returns the passwords indexed by address."""
+    targets: dict[str, str | None] = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        address, _, device_password = line.partition(" ")
+        targets[address.upper()] = device_password.strip() or password
+    return targets
+
+
+def _get_targets(args: argparse.Namespace, stdin: TextIO) -> dict[str, str | None]:
+    """Returns the devices to drive, from the arguments, the file or stdin."""
+    targets = _read_targets(args.addresses, args.password)
+    if args.file == "-" or (args.file is None and not targets and not stdin.isatty()):
+        targets.update(_read_targets(stdin, args.password))
+    elif args.file is not None:
+        with open(args.file, encoding="utf-8") as f:
+            targets.update(_read_targets(f, args.password))
+    return targets
+
+
+async def _scan(
+    interfaces: list[int], scan_timeout: float
+) -> AsyncIterator[tuple[int, MagicSwitchbotAdvertisement]]:
+    """Scans on several adapters at once, yielding the advertisements as they arrive."""
+    queue: asyncio.Queue[tuple[int, MagicSwitchbotAdvertisement] | None] = asyncio.Queue()
+
+    async def scan_adapter(interface: int) -> None:
+        try:
+            async with aclosing(GetMagicSwitchbotDevices(interface).discover_iter(scan_timeout)) as advertisements:
+                async for advertisement in advertisements:
+                    queue.put_nowait((interface, advertisement))
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.error("Can't scan for MagicSwitchbot devices on hci%d: %s", interface, ex)
+
+    async def scan_all() -> None:
+        await asyncio.gather(*(scan_adapter(interface) for interface in interfaces))
+        queue.put_nowait(None)
+
+    task = asyncio.create_task(scan_all())
+    try:
+        while (item := await queue.get()) is not None:
+            yield item
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def discover(args: argparse.Namespace) -> int:
+    """Writes every device found as soon as its first advertisement arrives."""
+    start = time.monotonic()
+    seen: set[str] = set()
+    async with aclosing(_scan(args.interface, args.scan_timeout)) as advertisements:
+        async for interface, advertisement in advertisements:
+            if advertisement.address in seen:
+                continue
+            seen.add(advertisement.address)
+            _emit({
+                "address": advertisement.address,
+                "interface": f"hci{interface}",
+                "rssi": advertisement.rssi,
+                "battery": advertisement.battery,
+                "is_encrypted": advertisement.is_encrypted,
+                "found_after": round(time.monotonic() - start, 3),
+            })
+    print(f"{len(seen)} devices found in {time.monotonic() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+async def run_command(args: argparse.Namespace, targets: dict[str, str | None]) -> int:
+    """Runs a command on every target, starting each device as soon as it is found
+
+    Devices known by the registry are started right away, the rest as soon as one of
+    the adapters hears them. Each adapter drives at most `--concurrency` devices at once.
+    """
+    start = time.monotonic()
+    method = COMMANDS[args.command]
+    registry = None if args.registry is None else MagicSwitchbotRegistry(args.registry, autosave_delay=None)
+    fleet = MagicSwitchbotFleet(max_concurrency=args.concurrency)
+    pending = dict(targets)
+    tasks: list[asyncio.Task[bool]] = []
+
+    async def run_one(address: str, interface: int, found_after: float) -> bool:
+        result: MagicSwitchbotFleetResult = (await fleet.run(method, addresses=[address]))[address]
+        _emit({
+            "address": address,
+            "command": args.command,
+            "interface": f"hci{interface}",
+            "success": result.success,
+            "result": result.result,
+            "error": None if result.error is None else str(result.error) or type(result.error).__name__,
+            "found_after": round(found_after, 3),
+            "elapsed": round(result.elapsed, 3),
+        })
+        return result.success
+
+    def launch(address: str, ble_device: Any, interface: int) -> None:
+        password = pending.pop(address)
+        fleet.add(MagicSwitchbot(
+            ble_device,
+            password,
+            interface,
+            retry_count=args.retries,
+            disconnect_policy=ImmediateDisconnectPolicy(),
+            registry=registry,
+        ))
+        tasks.append(asyncio.create_task(run_one(address, interface, time.monotonic() - start)))
+
+    if registry is not None:
+        for address in list(pending):
+            ble_device = registry.ble_device(address)
+            if ble_device is not None:
+                known_interface = (registry.get(address) or {}).get("interface") or f"hci{args.interface[0]}"
+                launch(address, ble_device, int(known_interface.removeprefix("hci")))
+
+    if pending:
+        async with aclosing(_scan(args.interface, args.scan_timeout)) as advertisements:
+            async for interface, advertisement in advertisements:
+                address = advertisement.address.upper()
+                if address in pending:
+                    launch(address, advertisement.device, interface)
+                    if not pending:
+                        break
+
+    for address in pending:
+        _emit({
+            "address": address,
+            "command": args.command,
+            "interface": None,
+            "success": False,
+            "result": None,
+            "error": "Device not found",
+            "found_after": None,
+            "elapsed": None,
+        })
+
+    results = await asyncio.gather(*tasks)
+    await asyncio.gather(
+        *(device.disconnect() for device in fleet.devices.values()), return_exceptions=True
+    )
+    if registry is not None:
+        registry.save()
+
+    failed = len(pending) + results.count(False)
+    print(
+        f"{len(targets)} devices, {failed} failed, {time.monotonic() - start:.1f}s",
+        file=sys.stderr,
+    )
+    return 0 if failed == 0 else 1
+
+
+async def run_through_daemon(args: argparse.Namespace, targets: dict[str, str | None]) -> int:
+    """Runs a command on every target through the daemon, all of them at once."""
+    start = time.monotonic()
+    method, params = DAEMON_REQUESTS[args.command]
+
+    async def run_one(client: MagicSwitchbotDaemonClient, address: str, password: str | None) -> bool:
+        request_start = time.monotonic()
+        result = error = None
+        try:
+            result = await client.request(method, address=address, password=password, **params)
+        except MagicSwitchbotDaemonError as ex:
+            error = str(ex)
+        _emit({
+            "address": address,
+            "command": args.command,
+            "interface": None,
+            "success": error is None,
+            "result": result,
+            "error": error,
+            "found_after": None,
+            "elapsed": round(time.monotonic() - request_start, 3),
+        })
+        return error is None
+
+    try:
+        async with MagicSwitchbotDaemonClient(args.socket) as client:
+            results = await asyncio.gather(
+                *(run_one(client, address, password) for address, password in targets.items())
+            )
+    except OSError as ex:
+        print(f"Can't reach the MagicSwitchbot daemon at {args.socket}: {ex}", file=sys.stderr)
+        return 1
+
+    failed = results.count(False)
+    print(
+        f"{len(targets)} devices, {failed} failed, {time.monotonic() - start:.1f}s",
+        file=sys.stderr,
+    )
+    return 0 if failed == 0 else 1
+
+
+async def run_daemon(args: argparse.Namespace, targets: dict[str, str | None]) -> int:
+    """Runs the control daemon until it gets SIGINT or SIGTERM."""
+    daemon = MagicSwitchbotDaemon(
+        args.socket,
+        interfaces=args.interface,
+        passwords=targets,
+        registry=None if args.registry is None else MagicSwitchbotRegistry(args.registry),
+        max_connections=args.max_connections,
+        scan_timeout=args.scan_timeout,
+        retry_count=args.retries,
+    )
+    task = asyncio.create_task(daemon.serve_forever())
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return 0
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m magicswitchbot",
+        description="Discover and drive MagicSwitchbot devices, writing the results as JSON lines",
+    )
+    parser.add_argument("command", choices=["discover", "daemon", *COMMANDS], help="what to do")
+    parser.add_argument("addresses", nargs="*", metavar="ADDRESS", help="MAC addresses of the devices")
+    parser.add_argument("-f", "--file", help="file with a device per line (ADDRESS [PASSWORD]), - for stdin")
+    parser.add_argument("-p", "--password", help="password of the devices that don't have one in the file")
+    parser.add_argument(
+        "-i", "--interface", type=int, action="append",
+        help="bluetooth adapter to use, 0 for hci0. Repeat it to use several adapters (default 0)",
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=DEFAULT_FLEET_CONCURRENCY,
+        help=f"max devices driven at the same time on each adapter (default {DEFAULT_FLEET_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "-t", "--scan-timeout", type=float, default=DEFAULT_SCAN_TIMEOUT,
+        help=f"max seconds to scan for the devices (default {DEFAULT_SCAN_TIMEOUT})",
+    )
+    parser.add_argument(
+        "-r", "--retries", type=int, default=DEFAULT_RETRY_COUNT,
+        help=f"max attempts of each command, the first one included (default {DEFAULT_RETRY_COUNT})",
+    )
+    parser.add_argument("--registry", help="device registry file, to connect to known devices without scanning")
+    parser.add_argument(
+        "-s", "--socket", nargs="?", const="",
+        help="Unix socket of the daemon: the daemon listens on it and the other commands send their "
+             "requests through it. Without a path, the socket in the runtime directory "
+             f"({default_socket_path()}) is used",
+    )
+    parser.add_argument(
+        "--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS,
+        help=f"max devices kept connected on each adapter by the daemon (default {DEFAULT_MAX_CONNECTIONS})",
+    )
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log to stderr (-vv for debug)")
+    return parser
+
+
+def main(argv: list[str] | None=None) -> int:
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    args.interface = args.interface or [0]
+    if args.socket == "":
+        args.socket = default_socket_path()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    logging.basicConfig(
+        level=(logging.WARNING, logging.INFO, logging.DEBUG)[min(args.verbose, 2)],
+        stream=sys.stderr,
+    )
+
+    if args.command == "discover":
+        return asyncio.run(discover(args))
+
+    targets = _get_targets(args, sys.stdin)
+    if args.command == "daemon":
+        return asyncio.run(run_daemon(args, targets))
+    if not targets:
+        parser.error("no devices given")
+    if args.socket is not None:
+        return asyncio.run(run_through_daemon(args, targets))
+    return asyncio.run(run_command(args, targets))
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
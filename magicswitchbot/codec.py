@@ -0,0 +1,125 @@
+"""Encoding and decoding of MagicSwitchbot protocol frames.
+
+Every frame exchanged with the device is a 16 byte block encrypted with AES128 ECB:
+
+    CMD1 CMD2 LEN DATA[LEN] TOKEN[4] RANDOM-FILL
+
+Responses use the same layout, where the second byte is the return code.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+from .consts import CRYPT_KEY
+
+FRAME_LENGTH = 16  # Every command and response has 16 bytes
+TOKEN_LENGTH = 4  # Length of the token the device gives us on connect
+HEADER_LENGTH = 3  # CMD1 + CMD2 + LEN (RC instead of CMD2 on responses)
+
+
+class FrameError(ValueError):
+    """Custom exception raised when a frame can't be encoded or decoded."""
+
+
+@dataclass(frozen=True, slots=True)
+class MagicSwitchbotResponse:
+    """Decoded response from a MagicSwitchbot device."""
+    command: int
+    ret_code: int
+    param: bytes
+
+    def __str__(self) -> str:
+        return (
+            f"Command = {self.command:02x}, Return Code = {self.ret_code:02x}, "
+            f"Length = {len(self.param)}, Params = {self.param.hex()}"
+        )
+
+
+@lru_cache(maxsize=1)
+def _get_cipher():
+    """Returns the AES128 ECB cipher for the protocol key.
+
+    ECB mode doesn't chain blocks, so the same cipher object can be reused for every frame.
+    """
+    # Imported here so that pycryptodome is only loaded when a frame is first encrypted
+    from Crypto.Cipher import AES
+
+    return AES.new(bytes(CRYPT_KEY), AES.MODE_ECB)
+
+
+@lru_cache(maxsize=64)
+def hex_to_bytes(value: str) -> bytes:
+    """Returns the bytes of a hexadecimal constant, such as a command or a parameter."""
+    return bytes.fromhex(value)
+
+
+def encrypt(data: bytes | bytearray | memoryview) -> bytes:
+    """Encrypts a frame using AES128 ECB."""
+    return _get_cipher().encrypt(data)
+
+
+def decrypt(data: bytes | bytearray | memoryview) -> bytes:
+    """Decrypts a frame using AES128 ECB."""
+    return _get_cipher().decrypt(data)
+
+
+def build_frame(command: bytes, parameter: bytes=b"", token: bytes | None=None) -> bytes:
+    """Builds the plain (unencrypted) frame for a command
+
+    Parameters
+    ----------
+        command : bytes
+            The 2 bytes of the command (and subcommand) to execute
+        parameter : bytes
+            Parameters of the command (variable length)
+        token : bytes
+            Token for the current connection, or None if we don't have one yet
+
+    Returns
+    -------
+        bytes
+            The 16 bytes of the frame, filled with random data
+    """
+    if token is None:
+        token = b""
+    fill = FRAME_LENGTH - HEADER_LENGTH - len(parameter) - len(token)
+    if len(command) != 2 or fill < 0:
+        raise FrameError(
+            f"Can't fit command {command.hex()} with {len(parameter)} parameter bytes in a frame"
+        )
+    return b"".join((command, bytes((len(parameter),)), parameter, token, os.urandom(fill)))
+
+
+def encode_frame(command: bytes, parameter: bytes=b"", token: bytes | None=None) -> bytes:
+    """Builds and encrypts the frame for a command, ready to be sent to the device."""
+    return encrypt(build_frame(command, parameter, token))
+
+
+def parse_frame(data: bytes | bytearray | memoryview) -> MagicSwitchbotResponse:
+    """Parses a plain (decrypted) response frame
+
+    Parameters
+    ----------
+        data : bytes
+            The 16 bytes of the decrypted response
+
+    Returns
+    -------
+        MagicSwitchbotResponse
+            The decoded response
+    """
+    view = memoryview(data)
+    if len(view) != FRAME_LENGTH:
+        raise FrameError(f"Invalid frame length: {len(view)}")
+    param_length = min(view[2], FRAME_LENGTH - HEADER_LENGTH)
+    return MagicSwitchbotResponse(view[0], view[1], bytes(view[HEADER_LENGTH:HEADER_LENGTH + param_length]))
+
+
+def decode_frame(data: bytes | bytearray | memoryview) -> MagicSwitchbotResponse:
+    """Decrypts and parses a response frame received from the device."""
+    if len(data) != FRAME_LENGTH:
+        raise FrameError(f"Invalid frame length: {len(data)}")
+    return parse_frame(decrypt(data))
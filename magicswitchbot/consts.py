@@ -2,15 +2,26 @@
 
 """Connection constants"""
 DEFAULT_RETRY_COUNT = 3  # Max number of iterations to try when sending commands to the device
-DEFAULT_RETRY_TIMEOUT = 1  # Number of seconds between retries
+DEFAULT_RETRY_TIMEOUT = 1  # Max number of seconds between retries
 DEFAULT_SCAN_TIMEOUT = 5  # Max timeout when looking for devices
 NOTIFY_TIMEOUT = 5 # Max seconds to wait before the device sends back the response to a command
+DEFAULT_COMMAND_DEADLINE = 30  # Max seconds a command can take, retries included
 DISCONNECT_DELAY = 49  # How long to hold the connection to wait for additional commands before disconnecting the device.
+ARM_SETTLE_TIME = 2.25  # Seconds the mechanical arm needs to stop after a switch command
+DEFAULT_MAX_CONNECTIONS = 5  # Max number of devices connected at the same time on each adapter when using a connection pool
+DEFAULT_FLEET_CONCURRENCY = 3  # Max number of devices driven at the same time on each bluetooth adapter
+TIMEDSWITCH_UNIT = 5  # Minutes of each time unit of the timed switch command
+TIMEDSWITCH_MAX_UNITS = 48  # Max time units of the timed switch command (4 hours)
+ADVERTISEMENT_TTL = 60  # Max age in seconds of an advertisement to read the device state from it instead of connecting
+ADVERTISEMENT_KEEPALIVE = 10  # Seconds after which an unchanged advertisement is delivered again to keep it fresh
+DAEMON_SOCKET_NAME = "magicswitchbot.sock"  # Name of the Unix socket of the control daemon, in the runtime directory of the user
 
 """Constants definition for BLE communication"""    
 #UUID_SERVICE = "0000fee7-0000-1000-8000-00805f9b34fb"
 UUID_USERWRITE_CHAR = "000036f5-0000-1000-8000-00805f9b34fb"
 UUID_USERREAD_CHAR = "000036f6-0000-1000-8000-00805f9b34fb"
+MANUFACTURER_ID = 0x0502  # Manufacturer id of the advertisement data
+ADV_PAYLOAD_LENGTH = 8  # Minimum length of the advertised data: MAC address, battery and EnPSW
 
 """Symmetric encryption key used for AES"""
 CRYPT_KEY = [42, 97, 57, 92, 64, 85, 73, 81, 58, 90, 75, 98, 27, 109, 55, 53]
@@ -0,0 +1,549 @@
+"""Local control daemon that keeps MagicSwitchbot devices connected
+
+The daemon holds the device objects, so their connections and tokens outlive the
+programs that send the commands. Programs talk to it through a Unix socket, sending
+one JSON request per line:
+
+    {"id": 1, "method": "switch", "address": "AA:BB:CC:DD:EE:FF", "on": true}
+
+and getting one JSON response per line, in completion order:
+
+    {"id": 1, "ok": true, "result": true, "elapsed": 0.112}
+    {"id": 2, "ok": false, "error": "Device not found"}
+
+The methods are `switch` (`on`, `wait_settled`), `push` (`wait_settled`), `battery`
+(`max_age`), `info` (`refresh`), `subscribe` / `unsubscribe` (`address`, all the
+devices if missing) and `devices`. The first request for a device may carry its
+`password`. After subscribing, the state changes of the devices, after a command or
+heard in their advertisements, are sent as
+`{"event": "state", "address": ..., "is_on": ..., "battery": ...}` lines.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import stat
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Iterable, Mapping
+
+from .consts import DAEMON_SOCKET_NAME, DEFAULT_MAX_CONNECTIONS, DEFAULT_SCAN_TIMEOUT
+from .discovery import MagicSwitchbotAdvertisementBus
+from .policy import AlwaysConnectedPolicy
+from .pool import MagicSwitchbotConnectionPool
+from .switchbot import MagicSwitchbot
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+
+    from .models import MagicSwitchbotAdvertisement
+    from .registry import MagicSwitchbotRegistry
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MagicSwitchbotDaemonError(Exception):
+    """Error reported by the daemon for a request."""
+
+
+def default_socket_path() -> str:
+    """Returns the default path of the daemon socket
+
+    The socket lives in the runtime directory of the user (`$XDG_RUNTIME_DIR`), which
+    only they can write to, or in /run when running as root.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        uid = os.getuid()
+        runtime_dir = "/run" if uid == 0 else f"/run/user/{uid}"
+    return os.path.join(runtime_dir, DAEMON_SOCKET_NAME)
+
+
+class _Session:
+    """Connection of a client to the daemon."""
+
+    __slots__ = ("writer", "subscriptions")
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        '''Addresses the client is subscribed to. None stands for all the devices'''
+        self.subscriptions: set[str | None] = set()
+
+    def send(self, message: dict[str, Any]) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message, default=str).encode() + b"\n")
+
+
+class MagicSwitchbotDaemon:
+    """Serves commands for MagicSwitchbot devices on a Unix socket
+
+    Devices are created on their first request, from the registry or from the
+    advertisements heard by the daemon on its adapters, and are kept connected
+    (`AlwaysConnectedPolicy`) so the next commands skip the connection and
+    authentication. A connection pool limits the devices connected on each adapter,
+    disconnecting the least recently used ones when it is full.
+
+    Parameters
+    ----------
+        path : str
+            Path of the Unix socket. Defaults to `default_socket_path()`
+        interfaces : list
+            Adapters to listen on for advertisements, 0 for hci0
+        passwords : dict
+            Passwords of the devices, indexed by address. The devices in it are
+            connected as soon as the daemon starts
+        registry : MagicSwitchbotRegistry
+            Registry to find known devices without waiting for their advertisements
+        max_connections : int
+            Max number of devices connected at the same time on each adapter
+        scan_timeout : float
+            Max seconds to wait for the advertisement of an unknown device
+        **device_kwargs
+            Other keyword arguments for the devices (see the `MagicSwitchbot` constructor)
+    """
+
+    def __init__(
+        self,
+        path: str | None=None,
+        interfaces: Iterable[int]=(0,),
+        passwords: Mapping[str, str | None] | None=None,
+        registry: MagicSwitchbotRegistry | None=None,
+        max_connections: int=DEFAULT_MAX_CONNECTIONS,
+        scan_timeout: float=DEFAULT_SCAN_TIMEOUT,
+        **device_kwargs: Any,
+    ) -> None:
+        """Control daemon constructor."""
+        self._path = path or default_socket_path()
+        self._buses = {interface: MagicSwitchbotAdvertisementBus(interface) for interface in interfaces}
+        for bus in self._buses.values():
+            bus.add_listener(self._on_advertisement)
+        self._passwords = {address.upper(): password for address, password in (passwords or {}).items()}
+        self._registry = registry
+        self._scan_timeout = scan_timeout
+        device_kwargs.setdefault("disconnect_policy", AlwaysConnectedPolicy())
+        device_kwargs.setdefault("connection_pool", MagicSwitchbotConnectionPool(max_connections))
+        self._device_kwargs = device_kwargs
+        self._devices: dict[str, MagicSwitchbot] = {}
+        self._creating: dict[str, asyncio.Task[MagicSwitchbot]] = {}
+        self._sessions: set[_Session] = set()
+        '''Last state sent of each device, so unchanged advertisements aren't sent'''
+        self._published: dict[str, tuple[Any, Any]] = {}
+        '''Requests being run. They aren't tied to the client that sent them, so a
+        command already sent to a device isn't cut halfway when the client goes away'''
+        self._requests: set[asyncio.Task[None]] = set()
+        self._server: asyncio.AbstractServer | None = None
+        self._warm_up_task: asyncio.Task[None] | None = None
+        self._methods: dict[str, Callable[[_Session, dict[str, Any]], Awaitable[Any]]] = {
+            "switch": self._switch,
+            "push": self._push,
+            "battery": self._battery,
+            "info": self._info,
+            "subscribe": self._subscribe,
+            "unsubscribe": self._unsubscribe,
+            "devices": self._list_devices,
+        }
+
+    @property
+    def path(self) -> str:
+        """Returns the path of the Unix socket."""
+        return self._path
+
+    @property
+    def devices(self) -> dict[str, MagicSwitchbot]:
+        """Returns the devices held by the daemon, indexed by address."""
+        return dict(self._devices)
+
+    async def start(self) -> None:
+        """Starts listening to advertisements and to requests."""
+        await self._remove_stale_socket()
+        for bus in self._buses.values():
+            await bus.start()
+        # Create the socket with its final permissions, so there is no window where
+        # other users can connect to it
+        umask = os.umask(0o117)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle_connection, self._path)
+        finally:
+            os.umask(umask)
+        if self._passwords:
+            self._warm_up_task = asyncio.create_task(self._warm_up(list(self._passwords)))
+        _LOGGER.info("MagicSwitchbot daemon listening on %s", self._path)
+
+    async def _remove_stale_socket(self) -> None:
+        """Removes the socket left behind by a daemon that didn't stop cleanly
+
+        Raises
+        ------
+            MagicSwitchbotDaemonError
+                If another daemon is listening on the path, or the path isn't a socket
+        """
+        try:
+            mode = os.lstat(self._path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise MagicSwitchbotDaemonError(f"{self._path} exists and isn't a socket")
+        try:
+            _, writer = await asyncio.open_unix_connection(self._path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            _LOGGER.debug("MagicSwitchbot daemon: Removing stale socket %s", self._path)
+            os.unlink(self._path)
+            return
+        writer.close()
+        raise MagicSwitchbotDaemonError(f"Another daemon is listening on {self._path}")
+
+    async def stop(self) -> None:
+        """Stops serving requests and disconnects all the devices."""
+        listening = self._server is not None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for session in list(self._sessions):
+            session.writer.close()
+        tasks = [
+            *self._requests,
+            *self._creating.values(),
+            *([self._warm_up_task] if self._warm_up_task else []),
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for device in self._devices.values():
+            device._cancel_disconnect_timer()
+        await asyncio.gather(
+            *(device._execute_disconnect() for device in self._devices.values()), return_exceptions=True
+        )
+        for bus in self._buses.values():
+            await bus.stop()
+        if self._registry is not None:
+            self._registry.save()
+        if listening and os.path.exists(self._path):
+            # Only the socket of this daemon, never the one of a daemon that made start() fail
+            os.unlink(self._path)
+        _LOGGER.info("MagicSwitchbot daemon stopped")
+
+    async def serve_forever(self) -> None:
+        """Runs the daemon until the task is cancelled."""
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    async def _warm_up(self, addresses: list[str]) -> None:
+        """Connects and authenticates the configured devices ahead of their first command."""
+        async def prepare(address: str) -> None:
+            try:
+                await (await self.get_device(address)).prepare()
+            except Exception as ex:  # pylint: disable=broad-except
+                _LOGGER.warning("MagicSwitchbot[%s]: Can't prepare the device: %s", address, ex)
+
+        await asyncio.gather(*(prepare(address) for address in addresses))
+
+    async def get_device(self, address: str, password: str | None=None) -> MagicSwitchbot:
+        """Returns the device with an address, creating it on its first use
+
+        Raises
+        ------
+            MagicSwitchbotDaemonError
+                If the device isn't known and isn't heard within the scan timeout
+        """
+        address = address.upper()
+        device = self._devices.get(address)
+        if device is not None:
+            return device
+        task = self._creating.get(address)
+        if task is None:
+            task = self._creating[address] = asyncio.create_task(self._create_device(address, password))
+            task.add_done_callback(lambda _: self._creating.pop(address, None))
+        return await asyncio.shield(task)
+
+    async def _create_device(self, address: str, password: str | None) -> MagicSwitchbot:
+        found = await self._find(address)
+        if found is None:
+            raise MagicSwitchbotDaemonError("Device not found")
+        ble_device, interface = found
+        device = MagicSwitchbot(
+            ble_device,
+            password if password is not None else self._passwords.get(address),
+            interface,
+            advertisement_bus=self._buses.get(interface),
+            registry=self._registry,
+            **self._device_kwargs,
+        )
+        device.subscribe(lambda: self._publish(device))
+        self._devices[address] = device
+        self._published[address] = (device.is_on(), device.get_battery_percent())
+        _LOGGER.debug("MagicSwitchbot[%s]: Device added to the daemon on hci%d", address, interface)
+        return device
+
+    async def _find(self, address: str) -> tuple[BLEDevice, int] | None:
+        """Returns the BLEDevice of an address and the adapter to reach it."""
+        if self._registry is not None and (ble_device := self._registry.ble_device(address)) is not None:
+            interface = (self._registry.get(address) or {}).get("interface")
+            if interface is not None and int(interface.removeprefix("hci")) in self._buses:
+                return ble_device, int(interface.removeprefix("hci"))
+
+        heard = [
+            (advertisement, interface) for interface, bus in self._buses.items()
+            if (advertisement := bus.get_advertisement(address)) is not None
+        ]
+        if heard:
+            advertisement, interface = max(heard, key=lambda item: item[0].rssi)
+            return advertisement.device, interface
+
+        future: asyncio.Future[tuple[BLEDevice, int]] = asyncio.get_running_loop().create_future()
+
+        def listener(interface: int, advertisement: MagicSwitchbotAdvertisement) -> None:
+            if advertisement.address.upper() == address and not future.done():
+                future.set_result((advertisement.device, interface))
+
+        removers = [
+            bus.add_listener(lambda advertisement, interface=interface: listener(interface, advertisement))
+            for interface, bus in self._buses.items()
+        ]
+        try:
+            return await asyncio.wait_for(future, self._scan_timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            for remove in removers:
+                remove()
+
+    def _on_advertisement(self, advertisement: MagicSwitchbotAdvertisement) -> None:
+        """Sends the state of a device when its advertisements change it."""
+        device = self._devices.get(advertisement.address.upper())
+        if device is not None:
+            self._publish(device, changed_only=True)
+
+    def _publish(self, device: MagicSwitchbot, changed_only: bool=False) -> None:
+        """Sends the state of a device to the clients subscribed to it
+
+        After a command the state is always sent. With `changed_only`, it is only sent
+        if it differs from the last one sent.
+        """
+        address = device.get_address().upper()
+        state = (device.is_on(), device.get_battery_percent())
+        if changed_only and self._published.get(address) == state:
+            return
+        self._published[address] = state
+        event = None
+        for session in self._sessions:
+            if None in session.subscriptions or address in session.subscriptions:
+                if event is None:
+                    event = {"event": "state", "address": address, "is_on": state[0], "battery": state[1]}
+                session.send(event)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves the requests of a client, running them concurrently."""
+        session = _Session(writer)
+        self._sessions.add(session)
+        tasks: set[asyncio.Task[None]] = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._handle_request(session, line))
+                for running in (tasks, self._requests):
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as ex:
+            _LOGGER.debug("MagicSwitchbot daemon: Client connection lost: %s", ex)
+        finally:
+            # The requests still running finish on their own, their responses are
+            # dropped by the closed session
+            self._sessions.discard(session)
+            writer.close()
+
+    async def _handle_request(self, session: _Session, line: bytes) -> None:
+        """Runs a request and sends its response."""
+        start = time.monotonic()
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise MagicSwitchbotDaemonError("Invalid request")
+            request_id = request.get("id")
+            handler = self._methods.get(request.get("method"))
+            if handler is None:
+                raise MagicSwitchbotDaemonError(f"Unknown method: {request.get('method')}")
+            result = await handler(session, request)
+        except (MagicSwitchbotDaemonError, ValueError) as ex:
+            session.send({"id": request_id, "ok": False, "error": str(ex)})
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.exception("MagicSwitchbot daemon: Request failed")
+            session.send({"id": request_id, "ok": False, "error": str(ex) or type(ex).__name__})
+        else:
+            session.send({"id": request_id, "ok": True, "result": result, "elapsed": round(time.monotonic() - start, 3)})
+        try:
+            await session.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _device_of(self, request: dict[str, Any]) -> MagicSwitchbot:
+        address = request.get("address")
+        if not isinstance(address, str):
+            raise MagicSwitchbotDaemonError("Missing address")
+        return await self.get_device(address, request.get("password"))
+
+    @staticmethod
+    def _check(result: Any) -> Any:
+        """The commands return None or False when they fail."""
+        if result is None or result is False:
+            raise MagicSwitchbotDaemonError("Command failed")
+        return result
+
+    async def _switch(self, session: _Session, request: dict[str, Any]) -> bool:
+        device = await self._device_of(request)
+        if not isinstance(request.get("on"), bool):
+            raise MagicSwitchbotDaemonError("Missing on")
+        wait_settled = bool(request.get("wait_settled", False))
+        if request["on"]:
+            return self._check(await device.turn_on(wait_settled))
+        return self._check(await device.turn_off(wait_settled))
+
+    async def _push(self, session: _Session, request: dict[str, Any]) -> bool:
+        device = await self._device_of(request)
+        return self._check(await device.push(bool(request.get("wait_settled", False))))
+
+    async def _battery(self, session: _Session, request: dict[str, Any]) -> int:
+        device = await self._device_of(request)
+        return self._check(await device.get_battery(request.get("max_age")))
+
+    async def _info(self, session: _Session, request: dict[str, Any]) -> dict[str, Any]:
+        device = await self._device_of(request)
+        return self._check(await device.get_basic_info(bool(request.get("refresh", False))))
+
+    async def _subscribe(self, session: _Session, request: dict[str, Any]) -> str:
+        address = request.get("address")
+        session.subscriptions.add(None if address is None else str(address).upper())
+        return address or "*"
+
+    async def _unsubscribe(self, session: _Session, request: dict[str, Any]) -> str:
+        address = request.get("address")
+        session.subscriptions.discard(None if address is None else str(address).upper())
+        return address or "*"
+
+    async def _list_devices(self, session: _Session, request: dict[str, Any]) -> list[dict[str, Any]]:
+        return [
+            {
+                "address": address,
+                "interface": device._interface,
+                "connected": bool(device._client and device._client.is_connected),
+                "is_on": device.is_on(),
+                "battery": device.get_battery_percent(),
+            }
+            for address, device in self._devices.items()
+        ]
+
+
+class MagicSwitchbotDaemonClient:
+    """Client of the MagicSwitchbot control daemon
+
+    Requests can be sent concurrently on the same connection. Use it as an async
+    context manager, or call `connect()` and `close()`.
+
+    Parameters
+    ----------
+        path : str
+            Path of the Unix socket of the daemon. Defaults to `default_socket_path()`
+    """
+
+    def __init__(self, path: str | None=None) -> None:
+        """Daemon client constructor."""
+        self._path = path or default_socket_path()
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task[None] | None = None
+        self._pending: dict[int, asyncio.Future[Any]] = {}
+        self._events: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        self._next_id = 0
+
+    async def __aenter__(self) -> MagicSwitchbotDaemonClient:
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def connect(self) -> None:
+        """Connects to the daemon."""
+        reader, self._writer = await asyncio.open_unix_connection(self._path)
+        self._reader_task = asyncio.create_task(self._read(reader))
+
+    async def close(self) -> None:
+        """Closes the connection to the daemon."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        """Delivers the responses to their requests and queues the events."""
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if "event" in message:
+                    self._events.put_nowait(message)
+                elif (future := self._pending.pop(message.get("id"), None)) is not None and not future.done():
+                    future.set_result(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the MagicSwitchbot daemon lost"))
+            self._pending.clear()
+            self._events.put_nowait(None)
+
+    async def request(self, method: str, **params: Any) -> Any:
+        """Sends a request and returns its result
+
+        Raises
+        ------
+            MagicSwitchbotDaemonError
+                If the daemon reports an error
+        """
+        if self._writer is None:
+            raise ConnectionError("Not connected to the MagicSwitchbot daemon")
+        self._next_id += 1
+        request_id = self._next_id
+        future: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(json.dumps({"id": request_id, "method": method, **params}).encode() + b"\n")
+        await self._writer.drain()
+        response = await future
+        if not response.get("ok"):
+            raise MagicSwitchbotDaemonError(response.get("error"))
+        return response.get("result")
+
+    async def switch(self, address: str, on: bool, wait_settled: bool=False, password: str | None=None) -> bool:
+        """Turns a device on or off."""
+        return await self.request("switch", address=address, on=on, wait_settled=wait_settled, password=password)
+
+    async def push(self, address: str, wait_settled: bool=False, password: str | None=None) -> bool:
+        """Pushes the button of a device."""
+        return await self.request("push", address=address, wait_settled=wait_settled, password=password)
+
+    async def battery(self, address: str, max_age: float | None=None, password: str | None=None) -> int:
+        """Returns the battery level of a device."""
+        return await self.request("battery", address=address, max_age=max_age, password=password)
+
+    async def info(self, address: str, refresh: bool=False, password: str | None=None) -> dict[str, Any]:
+        """Returns the information of a device."""
+        return await self.request("info", address=address, refresh=refresh, password=password)
+
+    async def devices(self) -> list[dict[str, Any]]:
+        """Returns the devices held by the daemon."""
+        return await self.request("devices")
+
+    async def subscribe(self, address: str | None=None) -> AsyncIterator[dict[str, Any]]:
+        """Subscribes to the state changes of a device (or all of them) and yields them
+
+        The events of every subscription of the client are yielded, until the
+        connection is closed.
+        """
+        await self.request("subscribe", address=address)
+        while (event := await self._events.get()) is not None:
+            yield event
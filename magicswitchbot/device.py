@@ -1,16 +1,14 @@
 import asyncio
 import logging
-import random
-import binascii
-from typing import Any, Callable
+import time
+from time import perf_counter
+from typing import Any, Callable, Iterable
 from binascii import hexlify
-from Crypto.Cipher import AES
 
 import async_timeout
 from bleak import BleakError
 from bleak.backends.device import BLEDevice
 from bleak.backends.service import BleakGATTCharacteristic, BleakGATTServiceCollection
-from bleak.exc import BleakDBusError
 from bleak_retry_connector import (
     BleakClientWithServiceCache,
     BleakNotFoundError,
@@ -18,29 +16,60 @@ from bleak_retry_connector import (
     establish_connection,
 )
 
-from .models import MagicSwitchbotAdvertisement
+from .codec import (TOKEN_LENGTH,
+    FrameError,
+    MagicSwitchbotResponse,
+    decode_frame,
+    decrypt,
+    encode_frame,
+    encrypt,
+    hex_to_bytes,
+    parse_frame)
+from .models import MagicSwitchbotAdvertisement, MagicSwitchbotCommandResult, MagicSwitchbotEvent
+from .observer import MagicSwitchbotObserver
 # from .consts import *
-from .consts import (DEFAULT_SCAN_TIMEOUT,
+from .consts import (ADVERTISEMENT_TTL,
+    ARM_SETTLE_TIME,
+    DEFAULT_SCAN_TIMEOUT,
     DEFAULT_RETRY_COUNT,
-    DISCONNECT_DELAY,
     NOTIFY_TIMEOUT,
-    CRYPT_KEY,
     COMMANDS,
     CMD_GETTOKEN,
     CMD_GETBAT,
     CMD_SWITCH,
+    CMD_TIMEDSWITCH,
     RC_TOKENOK,
     RC_GETBAT,
     RC_SWITCH,
+    RC_TIMEDSWITCH,
     STA_OK,
     UUID_USERREAD_CHAR,
     UUID_USERWRITE_CHAR)
-from .discovery import GetMagicSwitchbotDevices
+from .metrics import MagicSwitchbotMetrics, MagicSwitchbotMetricsRegistry
+from .discovery import (GetMagicSwitchbotDevices,
+    MagicSwitchbotAdvertisementBus,
+    MagicSwitchbotMultiAdapterScanner)
+from .policy import DisconnectPolicy, FixedDisconnectPolicy, RetryPolicy
+from .pool import MagicSwitchbotConnectionPool
+from .registry import MagicSwitchbotRegistry
 
 _LOGGER = logging.getLogger(__name__)
 
 BLEAK_EXCEPTIONS = (AttributeError, BleakError, asyncio.exceptions.TimeoutError)
 
+'''Command identifiers and codes as they come in a decoded response'''
+_RESP_GETTOKEN = hex_to_bytes(CMD_GETTOKEN)[0]
+_RESP_GETBAT = hex_to_bytes(CMD_GETBAT)[0]
+_RESP_SWITCH = hex_to_bytes(CMD_SWITCH)[0]
+_RC_TOKENOK = hex_to_bytes(RC_TOKENOK)[0]
+_RC_GETBAT = hex_to_bytes(RC_GETBAT)[0]
+_RC_SWITCH = hex_to_bytes(RC_SWITCH)[0]
+_RC_TIMEDSWITCH = hex_to_bytes(RC_TIMEDSWITCH)[0]
+_STA_OK_BYTES = hex_to_bytes(STA_OK)
+
+'''Commands that can't be sent while the mechanical arm is moving'''
+ARM_COMMANDS = frozenset((CMD_SWITCH, CMD_TIMEDSWITCH))
+
     
 class CharacteristicMissingError(Exception):
     """Custom exception raised when a characteristic is missing."""
@@ -67,6 +96,18 @@ class MagicSwitchbotDevice:
         self._override_adv_data: dict[str, Any] | None = None
         self._scan_timeout: int = kwargs.pop("scan_timeout", DEFAULT_SCAN_TIMEOUT)
         self._retry_count: int = kwargs.pop("retry_count", DEFAULT_RETRY_COUNT)
+        self._notify_timeout: float = kwargs.pop("notify_timeout", NOTIFY_TIMEOUT)
+        self._advertisement_ttl: float = kwargs.pop("advertisement_ttl", ADVERTISEMENT_TTL)
+        self._establish_connection = kwargs.pop("establish_connection", establish_connection)
+        self._client_class = kwargs.pop("client_class", BleakClientWithServiceCache)
+        self._disconnect_policy: DisconnectPolicy = kwargs.pop("disconnect_policy", None) or FixedDisconnectPolicy()
+        self._retry_policy: RetryPolicy = kwargs.pop("retry_policy", None) or RetryPolicy()
+        self._connection_pool: MagicSwitchbotConnectionPool | None = kwargs.pop("connection_pool", None)
+        self._adapter_selector: MagicSwitchbotMultiAdapterScanner | None = kwargs.pop("adapter_selector", None)
+        metrics_registry: MagicSwitchbotMetricsRegistry | None = kwargs.pop("metrics", None)
+        self._metrics: MagicSwitchbotMetrics | None = (
+            None if metrics_registry is None else metrics_registry.get_metrics(device.address)
+        )
         self._connect_lock = asyncio.Lock()
         self._operation_lock = asyncio.Lock()
         if password is None or password == "":
@@ -80,13 +121,29 @@ class MagicSwitchbotDevice:
         self._expected_disconnect = False
         self.loop = asyncio.get_event_loop()
         self._callbacks: list[Callable[[], None]] = []
-        self._token = None
+        self._observers: list[MagicSwitchbotObserver] = list(kwargs.pop("observers", ()))
+        '''Command and attempt reported to the observers'''
+        self._trace_command: str | None = None
+        self._trace_attempt = 0
+        self._token: bytes | None = None
+        self._battery: int | None = None
+        '''When the battery level was read from the device (monotonic clock)'''
+        self._battery_time = 0.0
         self._chip_type = None
         self._ver_major = None
         self._ver_minor = None
         self._dev_type = None
         self._en_pwd = False if password is None else True
         self._notify_future: asyncio.Future[bytearray] | None = None
+        self._arm_busy_until = 0.0
+        self._adv_bus: MagicSwitchbotAdvertisementBus | None = None
+        if (adv_bus := kwargs.pop("advertisement_bus", None)) is not None:
+            adv_bus.register(self)
+        # Handles of the read and write characteristics, from a previous connection
+        self._char_handles: tuple[int, int] | None = None
+        self._registry: MagicSwitchbotRegistry | None = kwargs.pop("registry", None)
+        if self._registry is not None:
+            self._registry.restore(self)
       
     async def _sendCommand(self, command: str, parameter: str, retries: int | None=None) -> bool | None:
         """Sends a command to the device and waits for its response
@@ -112,78 +169,218 @@ class MagicSwitchbotDevice:
         
         _LOGGER.debug("MagicSwitchbot[%s]: Sending command %s with parameter %s and %d retries", self._device.address, command, parameter, retries)
         
-        '''First of all we check if there is a token to retrieve'''
-        if command != CMD_GETTOKEN and self._token is None:
-            '''If the command is NOT CMD_GETTOKEN, we'll issue a CMD_GETTOKEN before sending the actual command'''
-            _LOGGER.debug("MagicSwitchbot[%s]: The device hasn't got a token yet. Let's get one...")
-            go = await self._auth()
-        else:
-            if self._token:
-              _LOGGER.debug("MagicSwitchbot[%s]: We've got a token. Go on...", self._device.address)
-            go = True
-            
-        if go:
-          if self._operation_lock.locked():
-              _LOGGER.debug(
-                  "MagicSwitchbot[%s]: Operation already in progress, waiting for it to complete; RSSI: %s",
-                  self._device.address,
-                  self.rssi,
-              )
-  
-          max_attempts = retries
-          if self._operation_lock.locked():
-              _LOGGER.debug(
-                  "MagicSwitchbot[%s]: Operation already in progress, waiting for it to complete; RSSI: %s",
-                  self._device.address,
-                  self.rssi,
-              )
-          async with self._operation_lock:
-              for attempt in range(max_attempts):
-                  try:
-                      _LOGGER.debug("MagicSwitchbot[%s]: - Attempt #%d -", self._device.address, attempt + 1)
-                      encrypted_command = self._prepareCommand(command, parameter)
-                      return await self._send_command_locked(encrypted_command)
-                  except BleakNotFoundError:
-                      _LOGGER.error(
-                          "MagicSwitchbot[%s]: device not found, no longer in range, or poor RSSI: %s",
-                          self.name,
-                          self.rssi,
-                          exc_info=True,
-                      )
-                      return None
-                  except CharacteristicMissingError as ex:
-                      if attempt == retries:
-                          _LOGGER.error(
-                              "MagicSwitchbot[%s]: characteristic missing: %s; Stopping trying; RSSI: %s",
-                              self.name,
-                              ex,
-                              self.rssi,
-                              exc_info=True,
-                          )
-                          return None
-  
-                      _LOGGER.debug(
-                          "MagicSwitchbot[%s]: characteristic missing: %s; RSSI: %s",
-                          self.name,
-                          ex,
-                          self.rssi,
-                          exc_info=True,
-                      )
-                  except BLEAK_EXCEPTIONS:
-                      if attempt == retries:
-                          _LOGGER.error(
-                              "MagicSwitchbot[%s]: communication failed; Stopping trying; RSSI: %s",
-                              self.name,
-                              self.rssi,
-                              exc_info=True,
-                          )
-                          return None
-  
-                      _LOGGER.debug(
-                          "MagicSwitchbot[%s]: communication failed with:", self._device.address, exc_info=True
-                      )
-
-          raise RuntimeError("Unreachable")
+        if command in ARM_COMMANDS:
+            await self.wait_until_settled()
+        if self._operation_lock.locked():
+            _LOGGER.debug(
+                "MagicSwitchbot[%s]: Operation already in progress, waiting for it to complete; RSSI: %s",
+                self._device.address,
+                self.rssi,
+            )
+        async with self._operation_lock:
+            if command in ARM_COMMANDS:
+                # Another arm command could have got the lock while we were waiting
+                await self.wait_until_settled()
+            self._disconnect_policy.record_command(
+                self._device.address, self.loop.time(), bool(self._client and self._client.is_connected)
+            )
+            try:
+                return await self._run_command_locked(command, parameter, retries)
+            finally:
+                self._release_connection_locked()
+
+    async def send_batch(
+        self,
+        commands: Iterable[tuple[str, str]],
+        stop_on_failure: bool=False,
+        retries: int | None=None,
+    ) -> list[MagicSwitchbotCommandResult]:
+        """Sends several commands back-to-back in a single transaction
+        
+        The operation lock is taken once for the whole batch, so the connection is
+        established and the token retrieved (if needed) only once, and no other command
+        can get in between. Every command is still retried on its own.
+        
+        Parameters
+        ----------
+            commands : list
+                Tuples (command, parameter) of hexadecimal strings, for example
+                `[(CMD_GETBAT, "01"), (CMD_SWITCH, PAR_SWITCHON)]`
+            stop_on_failure : bool
+                Don't send the rest of the commands after one fails
+            retries : int
+                Max number of attempts of each command
+
+        Returns
+        -------
+            list
+                A MagicSwitchbotCommandResult for each command sent, in the same order
+        """
+        if retries is None:
+            retries = self._retry_count
+        commands = list(commands)
+        for command, _parameter in commands:
+            if command not in COMMANDS:
+                raise ValueError(f"Unknown command: {command}")
+        
+        _LOGGER.debug("MagicSwitchbot[%s]: Sending a batch of %d commands", self._device.address, len(commands))
+        
+        results: list[MagicSwitchbotCommandResult] = []
+        async with self._operation_lock:
+            self._disconnect_policy.record_command(
+                self._device.address, self.loop.time(), bool(self._client and self._client.is_connected)
+            )
+            try:
+                for command, parameter in commands:
+                    if command in ARM_COMMANDS:
+                        await self.wait_until_settled()
+                    start = perf_counter()
+                    result = None
+                    error = None
+                    try:
+                        result = await self._run_command_locked(command, parameter, retries)
+                    except Exception as ex:  # pylint: disable=broad-except
+                        _LOGGER.debug(
+                            "MagicSwitchbot[%s]: Batch command %s failed: %s", self._device.address, command, ex
+                        )
+                        error = ex
+                    results.append(MagicSwitchbotCommandResult(
+                        command,
+                        parameter,
+                        result,
+                        self._battery if result and command == CMD_GETBAT else None,
+                        error,
+                        perf_counter() - start,
+                    ))
+                    if stop_on_failure and not results[-1].success:
+                        break
+            finally:
+                self._release_connection_locked()
+        return results
+
+    async def _run_command_locked(self, command: str, parameter: str, retries: int) -> bool | None:
+        """Sends a command with retries and records its metrics. The operation lock must be held."""
+        metrics = self._metrics
+        start = perf_counter() if metrics is not None else 0.0
+        result = None
+        try:
+            result = await self._send_command_with_retries(command, parameter, retries)
+            return result
+        finally:
+            if metrics is not None:
+                metrics.observe("command", perf_counter() - start)
+                metrics.increment("commands")
+                if not result:
+                    metrics.increment("failures")
+            if self._observers:
+                self._trace_command = None
+                self._trace_attempt = 0
+
+    def _release_connection_locked(self) -> None:
+        """Schedules the disconnection after a command, as the disconnect policy says."""
+        if self._client and self._client.is_connected:
+            self._reset_disconnect_timer()
+            if self._connection_pool is not None:
+                self._connection_pool.touch(self)
+
+    async def _send_command_with_retries(self, command: str, parameter: str, retries: int) -> bool | None:
+        """Sends a command retrying on transient errors. The operation lock must be held.
+
+        The retry policy decides which errors are retried, how long to back off between
+        attempts and the deadline of the whole command.
+
+        Parameters
+        ----------
+            command: str
+                Hexadecimal string with the command to execute
+            parameter: str
+                Hexadecimal string with the parameter of the command
+            retries : int
+                Max number of attempts
+
+        Returns
+        -------
+            bool
+                The result of the command, or None if it failed
+        """
+        policy = self._retry_policy
+        deadline = None if policy.deadline is None else self.loop.time() + policy.deadline
+        last_error: BaseException | None = None
+        attempts = 0
+        for attempt in range(max(retries, 1)):
+            if attempt:
+                delay = policy.get_delay(attempt)
+                if deadline is not None and self.loop.time() + delay >= deadline:
+                    break
+                _LOGGER.debug(
+                    "MagicSwitchbot[%s]: Backing off %.3fs before retrying", self._device.address, delay
+                )
+                await asyncio.sleep(delay)
+                if self._metrics is not None:
+                    self._metrics.increment("retries")
+            if self._observers:
+                self._trace_command = COMMANDS.get(command, command)
+                self._trace_attempt = attempt + 1
+                if attempt:
+                    self._emit("retry", error=last_error)
+            _LOGGER.debug("MagicSwitchbot[%s]: - Attempt #%d -", self._device.address, attempt + 1)
+            attempts += 1
+            try:
+                async with async_timeout.timeout_at(deadline):
+                    return await self._send_command_locked(command, parameter)
+            except (CharacteristicMissingError, *BLEAK_EXCEPTIONS, FrameError) as ex:
+                last_error = ex
+            if deadline is not None and self.loop.time() >= deadline:
+                break
+            if isinstance(last_error, BleakNotFoundError) and self._adapter_selector is not None:
+                # The next attempt may use another adapter
+                _LOGGER.debug("MagicSwitchbot[%s]: device not found on %s", self._device.address, self._interface)
+            elif isinstance(last_error, BleakNotFoundError):
+                _LOGGER.error(
+                    "MagicSwitchbot[%s]: device not found, no longer in range, or poor RSSI: %s",
+                    self.name,
+                    self.rssi,
+                    exc_info=last_error,
+                )
+                return None
+            elif not isinstance(last_error, CharacteristicMissingError) and not policy.is_transient(last_error):
+                _LOGGER.error(
+                    "MagicSwitchbot[%s]: communication failed with a fatal error; RSSI: %s",
+                    self.name,
+                    self.rssi,
+                    exc_info=last_error,
+                )
+                return None
+            else:
+                _LOGGER.debug(
+                    "MagicSwitchbot[%s]: communication failed with:", self._device.address, exc_info=last_error
+                )
+
+        _LOGGER.error(
+            "MagicSwitchbot[%s]: communication failed after %d attempts; Stopping trying; RSSI: %s",
+            self.name,
+            attempts,
+            self.rssi,
+            exc_info=last_error,
+        )
+        return None
+
+    @property
+    def is_arm_moving(self) -> bool:
+        """Returns True while the mechanical arm may still be moving after a switch command."""
+        return self._arm_busy_until > self.loop.time()
+
+    async def wait_until_settled(self) -> None:
+        """Waits until the mechanical arm has stopped moving."""
+        remaining = self._arm_busy_until - self.loop.time()
+        if remaining <= 0:
+            return
+        start = perf_counter()
+        while remaining > 0:
+            await asyncio.sleep(remaining)
+            remaining = self._arm_busy_until - self.loop.time()
+        if self._metrics is not None:
+            self._metrics.observe("settle", perf_counter() - start)
 
     @property
     def name(self) -> str:
@@ -204,49 +401,158 @@ class MagicSwitchbotDevice:
                 self.rssi,
             )
         if self._client and self._client.is_connected:
-            self._reset_disconnect_timer()
+            self._cancel_disconnect_timer()
             return
         async with self._connect_lock:
             # Check again while holding the lock
             if self._client and self._client.is_connected:
-                self._reset_disconnect_timer()
+                self._cancel_disconnect_timer()
                 return
+            if self._adapter_selector is not None:
+                self._select_adapter()
+            if self._connection_pool is not None:
+                await self._connection_pool.acquire(self)
             _LOGGER.debug("MagicSwitchbot[%s]: Connecting; RSSI: %s", self._device.address, self.rssi)
-            client = await establish_connection(
-                BleakClientWithServiceCache,
-                self._device,
-                self.name,
-                self._disconnected,
-                use_services_cache=True,
-                ble_device_callback=lambda: self._device
-            )
+            metrics = self._metrics
+            # Decided once, so observers added while connecting don't find connect_end
+            # without a start time
+            traced = bool(self._observers)
+            start = perf_counter() if metrics is not None else 0.0
+            connect_start = perf_counter()
+            if traced:
+                self._emit("connect_start")
+            try:
+                client = await self._establish_connection(
+                    self._client_class,
+                    self._device,
+                    self.name,
+                    self._disconnected,
+                    use_services_cache=True,
+                    ble_device_callback=lambda: self._device
+                )
+            except BaseException as ex:
+                if self._connection_pool is not None:
+                    self._connection_pool.release(self)
+                if self._adapter_selector is not None and isinstance(ex, BleakNotFoundError):
+                    self._adapter_selector.report_failure(self._device.address, self._interface)
+                if traced:
+                    self._emit("connect_end", duration=perf_counter() - connect_start, success=False, error=ex)
+                raise
+            if metrics is not None:
+                metrics.observe("connect", perf_counter() - start)
+                metrics.increment("connects")
+                start = perf_counter()
+            if self._connection_pool is not None:
+                self._connection_pool.connected(self)
+            if self._adapter_selector is not None:
+                self._adapter_selector.report_success(self._device.address, self._interface)
             _LOGGER.debug("MagicSwitchbot[%s]: Connected; RSSI: %s", self._device.address, self.rssi)
-            resolved = self._resolve_characteristics(client.services)
-            if not resolved:
-                # Try to handle services failing to load
-                resolved = self._resolve_characteristics(await client.get_services())
-            self._cached_services = client.services if resolved else None
-            self._client = client
-            self._reset_disconnect_timer()
-            await self._start_notify()
+            try:
+                resolved = self._resolve_characteristics(client.services)
+                if not resolved:
+                    # Try to handle services failing to load
+                    resolved = self._resolve_characteristics(await client.get_services())
+                self._cached_services = client.services if resolved else None
+                self._client = client
+                self._cancel_disconnect_timer()
+                if metrics is not None:
+                    metrics.observe("resolve_services", perf_counter() - start)
+                    start = perf_counter()
+                await self._start_notify()
+            except BaseException:
+                # Without notifications the connection would never get a response, so drop it
+                self._abort_connection(client)
+                raise
+            if metrics is not None:
+                metrics.observe("start_notify", perf_counter() - start)
+            if traced:
+                self._emit("connect_end", duration=perf_counter() - connect_start, success=True)
+            if self._registry is not None:
+                self._registry.record(self)
+
+    def _abort_connection(self, client: BleakClientWithServiceCache) -> None:
+        """Drops a connection that failed or was cancelled while being set up."""
+        self._expected_disconnect = True
+        if self._client is client:
+            self._client = None
+        if self._connection_pool is not None:
+            self._connection_pool.release(self)
+        # We may be cancelled, so the disconnection can't be awaited here
+        self.loop.create_task(client.disconnect())
+
+    def _select_adapter(self) -> None:
+        """Switches to the best adapter to connect to the device."""
+        selection = self._adapter_selector.select_adapter(self._device.address)
+        if selection is None:
+            return
+        adapter, ble_device = selection
+        if adapter != self._interface:
+            _LOGGER.debug(
+                "MagicSwitchbot[%s]: Switching from adapter %s to %s", self._device.address, self._interface, adapter
+            )
+            self._interface = adapter
+        if ble_device is not None:
+            self._device = ble_device
 
     def _resolve_characteristics(self, services: BleakGATTServiceCollection) -> bool:
-        """Initialize characteristics handles to the device"""
+        """Initialize characteristics handles to the device
+        
+        The handles known from a previous connection are tried first, as getting a
+        characteristic by handle is cheaper than looking for its UUID.
+        """
+        if self._char_handles is not None:
+            read_char = services.get_characteristic(self._char_handles[0])
+            write_char = services.get_characteristic(self._char_handles[1])
+            if (read_char and write_char
+                    and read_char.uuid == UUID_USERREAD_CHAR and write_char.uuid == UUID_USERWRITE_CHAR):
+                self._read_char = read_char
+                self._write_char = write_char
+                return True
         self._read_char = services.get_characteristic(UUID_USERREAD_CHAR)
         self._write_char = services.get_characteristic(UUID_USERWRITE_CHAR)
-        return bool(self._read_char and self._write_char)
+        if self._read_char and self._write_char:
+            self._char_handles = (self._read_char.handle, self._write_char.handle)
+            return True
+        return False
 
-    def _reset_disconnect_timer(self):
-        """Reset disconnect timer."""
+    @property
+    def metrics(self) -> MagicSwitchbotMetrics | None:
+        """Returns the latency metrics and counters of the device, if enabled."""
+        return self._metrics
+
+    @property
+    def disconnect_policy(self) -> DisconnectPolicy:
+        """Returns the policy that decides when to disconnect from the device."""
+        return self._disconnect_policy
+
+    def _cancel_disconnect_timer(self):
+        """Keep the connection while a command is running."""
         if self._disconnect_timer:
             self._disconnect_timer.cancel()
+            self._disconnect_timer = None
         self._expected_disconnect = False
+
+    def _reset_disconnect_timer(self):
+        """Reset disconnect timer."""
+        self._cancel_disconnect_timer()
+        delay = self._disconnect_policy.get_delay(self._device.address)
+        if delay is None:
+            return
         self._disconnect_timer = self.loop.call_later(
-            DISCONNECT_DELAY, self._disconnect
+            delay, self._disconnect
         )
 
     def _disconnected(self, client: BleakClientWithServiceCache) -> None:
         """Disconnected callback."""
+        if client is self._client:
+            # The token is only valid on the connection it was issued on
+            self._token = None
+            if self._notify_future is not None and not self._notify_future.done():
+                self._notify_future.set_exception(BleakError("Disconnected while waiting for the response"))
+            if self._connection_pool is not None:
+                self._connection_pool.release(self)
+        if self._observers:
+            self._emit("disconnect", success=self._expected_disconnect)
         if self._expected_disconnect:
             _LOGGER.debug(
                 "MagicSwitchbot[%s]: Disconnected from device; RSSI: %s", self._device.address, self.rssi
@@ -257,6 +563,8 @@ class MagicSwitchbotDevice:
             self.name,
             self.rssi,
         )
+        if self._metrics is not None:
+            self._metrics.increment("unexpected_disconnects")
 
     def _disconnect(self):
         """Disconnects from the device."""
@@ -265,13 +573,23 @@ class MagicSwitchbotDevice:
 
     async def _execute_timed_disconnect(self):
         """Execute timed disconnection."""
+        if self._operation_lock.locked():
+            # A command is running. It will set the timer again when it finishes
+            return
         _LOGGER.debug(
-            "MagicSwitchbot[%s]: Disconnecting after timeout of %s",
+            "MagicSwitchbot[%s]: Disconnecting after idle timeout",
             self.name,
-            DISCONNECT_DELAY,
         )
         await self._execute_disconnect()
 
+    async def disconnect(self) -> None:
+        """Disconnects from the device right away, unless a command is running."""
+        self._cancel_disconnect_timer()
+        if self._operation_lock.locked():
+            # The command will set the timer again when it finishes
+            return
+        await self._execute_disconnect()
+
     async def _execute_disconnect(self):
         """Execute disconnection."""
         async with self._connect_lock:
@@ -281,28 +599,30 @@ class MagicSwitchbotDevice:
             self._read_char = None
             self._write_char = None
             self._token = None
-            if client and client.is_connected:
-                await client.disconnect()
+            try:
+                if client and client.is_connected:
+                    await client.disconnect()
+            finally:
+                if self._connection_pool is not None:
+                    self._connection_pool.release(self)
 
-    async def _send_command_locked(self, command: bytes) -> bool:
-        """Sends an encrypted command to the device and reads the response."""
+    async def _send_command_locked(self, command: str, parameter: str) -> bool | None:
+        """Sends a command to the device and reads the response
+
+        The connection is established if needed, and on a fresh connection the token is
+        retrieved before the command, all of it while holding the operation lock.
+        """
         await self._ensure_connected()
         try:
-            return await self._execute_command_locked(command)
-        except BleakDBusError as ex:
-            # Disconnect so we can reset state and try again
-            await asyncio.sleep(0.25)
-            _LOGGER.debug(
-                "MagicSwitchbot[%s]: RSSI: %s; Backing off %ss; Disconnecting due to error: %s",
-                self.name,
-                self.rssi,
-                0.25,
-                ex,
-            )
-            await self._execute_disconnect()
-            raise
+            if command == CMD_GETTOKEN:
+                return await self._auth_locked(parameter)
+            if self._token is None:
+                _LOGGER.debug("MagicSwitchbot[%s]: The device hasn't got a token yet. Let's get one...", self._device.address)
+                if not await self._auth_locked():
+                    return None
+            return await self._execute_command_locked(self._encodeCommand(command, parameter))
         except BleakError as ex:
-            # Disconnect so we can reset state and try again
+            # Disconnect so we can reset state and try again, after the backoff of the retry policy
             _LOGGER.debug(
                 "MagicSwitchbot[%s]: RSSI: %s; Disconnecting due to error: %s", self._device.address, self.rssi, ex
             )
@@ -311,7 +631,9 @@ class MagicSwitchbotDevice:
 
     def _notification_handler(self, _sender: int, data: bytearray) -> None:
         """Internal routine to handle BLE notification responses."""
-        _LOGGER.info("MagicSwitchbot[%s] Notification received. Data: %s", self._device.address, data)
+        _LOGGER.debug("MagicSwitchbot[%s]: Notification received. Data: %s", self._device.address, data)
+        if self._observers:
+            self._emit("notification", data=bytes(data))
         
         if self._notify_future and not self._notify_future.done():
             self._notify_future.set_result(data)
@@ -333,22 +655,39 @@ class MagicSwitchbotDevice:
         self._notify_future = asyncio.Future()
         client = self._client
         
+        metrics = self._metrics
+        
         _LOGGER.debug("MagicSwitchbot[%s]: Sending command: %s", self._device.address, command)
-        await client.write_gatt_char(self._write_char, binascii.a2b_hex(command), True)
+        if metrics is None:
+            await client.write_gatt_char(self._write_char, command, True)
+        else:
+            start = perf_counter()
+            await client.write_gatt_char(self._write_char, command, True)
+            metrics.observe("write", perf_counter() - start)
+            start = perf_counter()
+        if self._observers:
+            self._emit("write", data=command)
 
         _LOGGER.debug("MagicSwitchbot[%s]: Waiting for notifications...", self._device.address)
 
-        async with async_timeout.timeout(NOTIFY_TIMEOUT):
-            notify_msg = await self._notify_future
+        try:
+            async with async_timeout.timeout(self._notify_timeout):
+                notify_msg = await self._notify_future
+        except asyncio.TimeoutError:
+            if metrics is not None:
+                metrics.increment("timeouts")
+            raise
+        if metrics is not None:
+            metrics.observe("response", perf_counter() - start)
         _LOGGER.debug("MagicSwitchbot[%s]: Notification received: %s", self._device.address, notify_msg)
         self._notify_future = None
 
 #        '''This sleep is important. Otherwise, it will freeze on next start_notify'''
 #        await asyncio.sleep(0.25)
         
-        plain_response = self._decrypt(notify_msg.hex())
-        _LOGGER.debug("MagicSwitchbot[%s] Unencrypted result: %s", self._device.address, plain_response)
-        return await self._processResponse(plain_response)
+        response = decode_frame(notify_msg)
+        _LOGGER.debug("MagicSwitchbot[%s] Unencrypted result: %s", self._device.address, response)
+        return await self._processFrame(response)
 
     def get_address(self) -> str:
         """Returns the address of the device."""
@@ -364,14 +703,51 @@ class MagicSwitchbotDevice:
                 self._override_adv_data[key],
             )
             return self._override_adv_data[key]
-        if not self._sb_adv_data:
+        advertisement = self._sb_adv_data
+        if advertisement is None:
             return None
-        return self._sb_adv_data.data["data"].get(key)
+        if key == "battery":
+            return advertisement.battery
+        if key == "rssi":
+            return advertisement.rssi
+        return None
 
     def get_battery_percent(self) -> Any:
         """Returns the device battery level in percent."""
         return self._get_adv_value("battery")
 
+    def get_fresh_advertisement(self, max_age: float | None=None) -> MagicSwitchbotAdvertisement | None:
+        """Returns the last advertisement of the device if it is recent enough
+
+        Parameters
+        ----------
+            max_age : float
+                Max age of the advertisement in seconds. Defaults to the `advertisement_ttl` of the device
+
+        Returns
+        -------
+            MagicSwitchbotAdvertisement
+                The advertisement, or None if there is none or it is too old
+        """
+        if max_age is None:
+            max_age = self._advertisement_ttl
+        advertisement = self._sb_adv_data
+        if advertisement is None or advertisement.age > max_age:
+            return None
+        return advertisement
+
+    async def is_reachable(self, max_age: float | None=None) -> bool:
+        """Tells if the device can be reached
+        
+        A device that is connected, or that has advertised in the last `max_age` seconds,
+        is reachable without connecting to it. Otherwise, we try to connect and authenticate.
+        """
+        if self._client and self._client.is_connected:
+            return True
+        if self.get_fresh_advertisement(max_age) is not None:
+            return True
+        return await self.prepare()
+
     def update_from_advertisement(self, advertisement: MagicSwitchbotAdvertisement) -> None:
         """Updates the device data from advertisement."""
         # Only accept advertisements if the data is not missing
@@ -385,6 +761,10 @@ class MagicSwitchbotDevice:
         self, retry: int | None=None, interface: int | None=None
     ) -> MagicSwitchbotAdvertisement | None:
         """Finds MagicSwitchbot devices and their advertisement data."""
+        if self._adv_bus is not None and self._adv_bus.running:
+            # The advertisement bus keeps our data up to date, so there's no need to scan
+            return self._sb_adv_data
+
         if retry is None:
             retry = self._retry_count
 
@@ -418,13 +798,33 @@ class MagicSwitchbotDevice:
 
         return _unsub
 
+    def add_observer(self, observer: MagicSwitchbotObserver) -> Callable[[], None]:
+        """Adds an observer of the command lifecycle and returns a function that removes it."""
+        self._observers.append(observer)
+
+        def _remove() -> None:
+            """Remove the observer."""
+            self._observers.remove(observer)
+
+        return _remove
+
+    def _emit(self, kind: str, **fields: Any) -> None:
+        """Delivers an event to the observers. Callers check first that there are observers."""
+        event = MagicSwitchbotEvent(
+            kind, self._device.address, self._trace_command, self._trace_attempt, time.time(), **fields
+        )
+        for observer in tuple(self._observers):
+            try:
+                getattr(observer, f"on_{kind}")(event)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("MagicSwitchbot[%s]: Observer failed handling %s", self._device.address, kind)
+
     async def update(self) -> None:
         """Update state of device."""
 
     def _set_advertisement_data(self, advertisement: MagicSwitchbotAdvertisement) -> None:
         """Set advertisement data."""
-        if advertisement.data.get("data") or not self._sb_adv_data.data.get("data"):
-            self._sb_adv_data = advertisement
+        self._sb_adv_data = advertisement
         self._override_adv_data = None
 
     def switch_mode(self) -> bool | None:
@@ -432,6 +832,61 @@ class MagicSwitchbotDevice:
         # To get actual position call update() first.
         return self._get_adv_value("switchMode")
       
+    async def prepare(self) -> bool:
+        """Gets the device ready to receive commands
+
+        Connects to the device, subscribes to its notifications and gets the token in one go,
+        so the first command doesn't have to pay for it. It also retrieves the device
+        information (chip type, firmware and device type).
+
+        Returns
+        -------
+            bool
+                Returns True if the device is connected and authenticated
+        """
+        if self._token is not None and self._client and self._client.is_connected:
+            self._reset_disconnect_timer()
+            return True
+        return bool(await self._auth())
+
+    async def _auth_locked(self, parameter: str | None=None) -> bool:
+        """Gets the token for the current connection. The operation lock must be held
+
+        Parameters
+        ----------
+            parameter : str
+                Parameter of CMD_GETTOKEN. The encoded password of the device by default
+        """
+        if parameter is None:
+            parameter = self._password_encoded
+        metrics = self._metrics
+        traced = bool(self._observers)
+        if metrics is None and not traced:
+            return await self._execute_command_locked(self._encodeCommand(CMD_GETTOKEN, parameter))
+        # The frames of the authentication belong to it, not to the command that needed it
+        traced_command = self._trace_command
+        self._trace_command = COMMANDS[CMD_GETTOKEN]
+        try:
+            if traced:
+                self._emit("auth_start")
+            start = perf_counter()
+            try:
+                ok = await self._execute_command_locked(self._encodeCommand(CMD_GETTOKEN, parameter))
+            except BaseException as ex:
+                if traced:
+                    self._emit("auth_end", duration=perf_counter() - start, success=False, error=ex)
+                raise
+            duration = perf_counter() - start
+            if metrics is not None:
+                metrics.observe("auth", duration)
+                if not ok:
+                    metrics.increment("auth_failures")
+            if traced:
+                self._emit("auth_end", duration=duration, success=bool(ok))
+            return ok
+        finally:
+            self._trace_command = traced_command
+
     async def _auth(self) -> bool:
         """Validates the password set on the device
         
@@ -475,9 +930,7 @@ class MagicSwitchbotDevice:
             str
                 Hexadecimal representation of encrypted data
         """
-        cipher = AES.new(bytes(bytearray(CRYPT_KEY)), AES.MODE_ECB)
-        encrypted = cipher.encrypt(bytes.fromhex(data)).hex()
-        return encrypted
+        return encrypt(bytes.fromhex(data)).hex()
       
     def _decrypt(self, data) -> str:
         """Decrypts data using AES128 ECB
@@ -491,11 +944,26 @@ class MagicSwitchbotDevice:
             str
                 Hexadecimal representation of decrypted data
         """
-        
-        '''We need a byte string as the key to decrypt or encrypt'''
-        decipher = AES.new(bytes(bytearray(CRYPT_KEY)), AES.MODE_ECB)
-        return decipher.decrypt(bytes.fromhex(data)).hex()
+        return decrypt(bytes.fromhex(data)).hex()
     
+    def _encodeCommand(self, command: str, parameter: str) -> bytes:
+        """Prepare the encrypted frame to send to the device
+        
+        Parameters
+        ----------
+            command : str
+                Hexadecimal representation of the command to send (usually 2 hex bytes, len 4)
+            parameter: str
+                Hexadecimal representation of the parameter(s) to send (variable length)
+
+        Returns
+        -------
+            bytes
+                The 16 encrypted bytes to send to the device
+        """
+        _LOGGER.debug("MagicSwitchbot[%s] Sending %s command with parameter %s", self._device.address, COMMANDS[command], parameter)
+        return encode_frame(hex_to_bytes(command), bytes.fromhex(parameter), self._token)
+
     def _prepareCommand(self, command, parameter):
         """Prepare the command to send to the device
         
@@ -513,27 +981,7 @@ class MagicSwitchbotDevice:
             str
                 Hexadecimal representation of the 16 encrypted bytes to send to the device
         """
-        
-        '''Hex form of the parameter length:'''
-        parmLen = "{:02X}".format(int(len(parameter) / 2))
-        
-        if self._token is None:
-            tok = ""
-        else:
-            tok = self._token
-
-        '''
-        We calculate how long must be the random tail of the command.
-        Each hex byte has a length of 2 characters, so the complete payload has 32 chars. The length byte also counts
-        '''
-        rndLen = 32 - len(command) - len(parameter) - len(tok) - 2
-        rndTail = ''.join([str(y) for _ in range(rndLen) for y in random.choice('0123456789abcdef')])
-        
-        fullCommand = command + parmLen + parameter + tok + rndTail
-        
-        _LOGGER.info("MagicSwitchbot[%s] Sending %s command: %s", self._device.address, COMMANDS[command], fullCommand)
-
-        return self._encrypt(fullCommand)
+        return self._encodeCommand(command, parameter).hex()
 
     async def _processResponse(self, response) -> bool:
         """Process the response from the device
@@ -546,30 +994,47 @@ class MagicSwitchbotDevice:
             response : str
                 Hexadecimal representation of the 16 byte response
                 
+        Return
+        ------
+            bool
+                Returns True if the command result is succesfull
+        """
+        return await self._processFrame(parse_frame(bytes.fromhex(response)))
+
+    async def _processFrame(self, response: MagicSwitchbotResponse) -> bool:
+        """Process a decoded response from the device
+      
+        Parameters
+        ----------
+            response : MagicSwitchbotResponse
+                Decrypted and decoded response
+                
         Return
         ------
             bool
                 Returns True if the command result is succesfull
         """
         success = False
-        command = response[0:2]
-        ret_code = response[2:4]
-        param_length = int(response[4:6])
-        param = response[6:(6 + 2 * param_length)]
+        command = response.command
+        ret_code = response.ret_code
+        param = response.param
       
-        _LOGGER.info("MagicSwitchbot[%s] Response: (Command = %s, Return Code = %s, Length = %d, Params = %s)", self._device.address, command, ret_code, param_length, param)
+        _LOGGER.debug("MagicSwitchbot[%s] Response: (%s)", self._device.address, response)
       
-        if command == CMD_GETTOKEN[0:2]:
-            if ret_code == RC_TOKENOK:
-                token = param[0:8]
-                self._chip_type = param[8:10]
-                self._ver_major = int(param[10:12])
-                self._ver_minor = int(param[12:14])
-                self._dev_type = param[14:16]
-                self._en_pwd = "False" if param[16:18] == '00' else "True"
+        if command == _RESP_GETTOKEN:
+            if ret_code == _RC_TOKENOK and len(param) >= TOKEN_LENGTH:
+                token = param[0:TOKEN_LENGTH]
+                if len(param) >= 9:
+                    self._chip_type = f"{param[4]:02x}"
+                    self._ver_major = param[5]
+                    self._ver_minor = param[6]
+                    self._dev_type = f"{param[7]:02x}"
+                    self._en_pwd = param[8] != 0
                 self._token = token 
-                _LOGGER.info("MagicSwitchbot[%s] The current connection token is %s", self._device.address, token)
-                _LOGGER.info("MagicSwitchbot[%s] Chip type: %s, Firmware version: %d.%d, Device type: %s, Password enabled: %s",
+                if self._registry is not None:
+                    self._registry.record(self)
+                _LOGGER.debug("MagicSwitchbot[%s] The current connection token is %s", self._device.address, token.hex())
+                _LOGGER.debug("MagicSwitchbot[%s] Chip type: %s, Firmware version: %s.%s, Device type: %s, Password enabled: %s",
                              self._device.address,
                              self._chip_type,
                              self._ver_major,
@@ -579,21 +1044,30 @@ class MagicSwitchbotDevice:
                 success = True
             else:
                 _LOGGER.error("MagicSwitchbot[%s] Error retrieving token. Please check password", self._device.address)
-        elif command == CMD_GETBAT[0:2]:
-            if ret_code == RC_GETBAT and param.upper() != "FF":
-                self._battery = int("0x" + param, 16)
-                _LOGGER.info("MagicSwitchbot[%s] Battery level: %d%%", self._device.address, self._battery)
+        elif command == _RESP_GETBAT:
+            if ret_code == _RC_GETBAT and param and param[0] != 0xFF:
+                self._battery = param[0]
+                self._battery_time = time.monotonic()
+                _LOGGER.debug("MagicSwitchbot[%s] Battery level: %d%%", self._device.address, self._battery)
                 success = True
             else:
                 self._battery = None
-        elif command == CMD_SWITCH[0:2]:
-            if ret_code == RC_SWITCH and param == STA_OK:
-                # We get a little more for the mechanical arm to stop. Otherwise, the user could send
-                # another command when it is moving yet, so the program would freeze
-                await asyncio.sleep(2.25)
-                _LOGGER.info("MagicSwitchbot[%s] Switch state changed successfully", self._device.address)
+        elif command == _RESP_SWITCH and ret_code == _RC_TIMEDSWITCH:
+            # Timed switch commands share the command byte with the switch ones
+            if param[:1] == _STA_OK_BYTES:
+                _LOGGER.debug("MagicSwitchbot[%s] Timed switch programmed successfully", self._device.address)
+                success = True
+            else:
+                _LOGGER.error("MagicSwitchbot[%s] Error programming the timed switch", self._device.address)
+        elif command == _RESP_SWITCH:
+            if ret_code == _RC_SWITCH and param[:1] == _STA_OK_BYTES:
+                # The mechanical arm needs a little more time to stop. Otherwise, the user could send
+                # another arm command when it is moving yet, so the program would freeze.
+                # We don't wait here: only arm commands will wait for this deadline
+                self._arm_busy_until = self.loop.time() + ARM_SETTLE_TIME
+                _LOGGER.debug("MagicSwitchbot[%s] Switch state changed successfully", self._device.address)
                 success = True
             else:
                 _LOGGER.error("MagicSwitchbot[%s] Error changing switch state", self._device.address)
                 
-        return success 
+        return success
@@ -4,25 +4,122 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
+from contextlib import aclosing
+from functools import partial
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable
 
-import bleak
-from bleak.backends.device import BLEDevice
-from bleak.backends.scanner import AdvertisementData
-
-from .consts import DEFAULT_RETRY_COUNT, DEFAULT_RETRY_TIMEOUT, DEFAULT_SCAN_TIMEOUT
+from .consts import (ADV_PAYLOAD_LENGTH,
+    ADVERTISEMENT_KEEPALIVE,
+    DEFAULT_RETRY_COUNT,
+    DEFAULT_RETRY_TIMEOUT,
+    DEFAULT_SCAN_TIMEOUT,
+    MANUFACTURER_ID)
 from .models import MagicSwitchbotAdvertisement
 
+if TYPE_CHECKING:
+    import bleak
+    from bleak.backends.device import BLEDevice
+    from bleak.backends.scanner import AdvertisementData
+
+    from .device import MagicSwitchbotDevice
+
 _LOGGER = logging.getLogger(__name__)
 CONNECT_LOCK = asyncio.Lock()
 
 
+def _scanner_class() -> type[bleak.BleakScanner]:
+    """Returns bleak's scanner, importing bleak on first use."""
+    from bleak import BleakScanner
+
+    return BleakScanner
+
+
+class MagicSwitchbotAdvertisementFilter:
+    """Cheap checks that drop the advertisements that bring nothing new
+
+    The adapters report the advertisements of every nearby device many times per second,
+    so before parsing them we drop:
+
+    - Devices that aren't MagicSwitchbots (no manufacturer data 0x0502 or too short)
+    - Advertisements with the same payload as the last one delivered for the address,
+      unless it was delivered more than `keepalive` seconds ago, so the cached
+      advertisements stay fresh
+    - Advertisements arriving less than `min_interval` seconds after the last one
+      delivered for the address, when rate limiting is enabled
+
+    Parameters
+    ----------
+        min_interval : float
+            Min seconds between advertisements delivered for a device. 0 disables rate limiting
+        keepalive : float
+            Seconds after which an unchanged advertisement is delivered again
+    """
+
+    __slots__ = ("min_interval", "keepalive", "_seen", "accepted", "foreign", "duplicates", "rate_limited")
+
+    def __init__(self, min_interval: float=0, keepalive: float=ADVERTISEMENT_KEEPALIVE) -> None:
+        """Advertisement filter constructor."""
+        self.min_interval = min_interval
+        self.keepalive = keepalive
+        '''address -> (last payload delivered, when it was delivered)'''
+        self._seen: dict[str, tuple[bytes, float]] = {}
+        self.accepted = 0
+        self.foreign = 0
+        self.duplicates = 0
+        self.rate_limited = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Returns the counters of the filter."""
+        return {
+            "accepted": self.accepted,
+            "foreign": self.foreign,
+            "duplicates": self.duplicates,
+            "rate_limited": self.rate_limited,
+        }
+
+    def accept(self, address: str, advertisement_data: AdvertisementData) -> bool:
+        """Returns True if the advertisement must be parsed and delivered."""
+        payload = advertisement_data.manufacturer_data.get(MANUFACTURER_ID)
+        if payload is None or len(payload) < ADV_PAYLOAD_LENGTH:
+            self.foreign += 1
+            return False
+        now = time.monotonic()
+        last = self._seen.get(address)
+        if last is not None:
+            elapsed = now - last[1]
+            if elapsed < self.min_interval:
+                self.rate_limited += 1
+                return False
+            if elapsed < self.keepalive and payload == last[0]:
+                self.duplicates += 1
+                return False
+        self._seen[address] = (payload, now)
+        self.accepted += 1
+        return True
+
+    def clear(self) -> None:
+        """Forgets the advertisements delivered, so the next ones are accepted."""
+        self._seen.clear()
+
+
 class GetMagicSwitchbotDevices:
     """Scan for all MagicSwitchbot devices and return by type."""
 
-    def __init__(self, interface: int=0) -> None:
+    def __init__(
+        self, interface: int=0, min_interval: float=0, keepalive: float=ADVERTISEMENT_KEEPALIVE
+    ) -> None:
         """Get MagicSwitchbot devices class constructor."""
         self._interface = f"hci{interface}"
+        self._filter = MagicSwitchbotAdvertisementFilter(min_interval, keepalive)
         self._adv_data: dict[str, MagicSwitchbotAdvertisement] = {}
+        self._queues: list[asyncio.Queue[MagicSwitchbotAdvertisement]] = []
+
+    @property
+    def filter(self) -> MagicSwitchbotAdvertisementFilter:
+        """Returns the filter of the advertisements."""
+        return self._filter
 
     def detection_callback(
         self,
@@ -30,9 +127,13 @@ class GetMagicSwitchbotDevices:
         advertisement_data: AdvertisementData,
     ) -> None:
         """Callback for device detection."""
+        if not self._filter.accept(device.address, advertisement_data):
+            return
         discovery = parse_advertisement_data(device, advertisement_data)
         if discovery:
             self._adv_data[discovery.address] = discovery
+            for queue in self._queues:
+                queue.put_nowait(discovery)
 
     async def discover(
         self, retry: int=DEFAULT_RETRY_COUNT, scan_timeout: int=DEFAULT_SCAN_TIMEOUT
@@ -40,7 +141,9 @@ class GetMagicSwitchbotDevices:
         """Find MagicSwitchbot devices and their advertisement data."""
 
         devices = None
-        devices = bleak.BleakScanner(
+        # A new scan must report the devices again, even if they haven't changed
+        self._filter.clear()
+        devices = _scanner_class()(
             # TODO: Find new UUIDs to filter on. For example, see
             # https://github.com/OpenWonderLabs/SwitchBotAPI-BLE/blob/4ad138bb09f0fbbfa41b152ca327a78c1d0b6ba9/devicetypes/meter.md
             adapter=self._interface,
@@ -68,6 +171,78 @@ class GetMagicSwitchbotDevices:
 
         return self._adv_data
 
+    async def discover_iter(
+        self, scan_timeout: float=DEFAULT_SCAN_TIMEOUT
+    ) -> AsyncIterator[MagicSwitchbotAdvertisement]:
+        """Find MagicSwitchbot devices yielding their advertisements as they arrive
+
+        The scanner is stopped when `scan_timeout` expires or as soon as the caller
+        stops iterating, so it can be used to leave the scan early.
+
+        Parameters
+        ----------
+            scan_timeout : float
+                Max number of seconds to scan for
+
+        Yields
+        ------
+            MagicSwitchbotAdvertisement
+                Every advertisement parsed while scanning
+        """
+        queue: asyncio.Queue[MagicSwitchbotAdvertisement] = asyncio.Queue()
+        self._queues.append(queue)
+        # A new scan must report the devices again, even if they haven't changed
+        self._filter.clear()
+        scanner = _scanner_class()(
+            detection_callback=self.detection_callback,
+            adapter=self._interface,
+        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + scan_timeout
+        try:
+            async with CONNECT_LOCK:
+                await scanner.start()
+            try:
+                while (remaining := deadline - loop.time()) > 0:
+                    try:
+                        advertisement = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    yield advertisement
+            finally:
+                await scanner.stop()
+        finally:
+            self._queues.remove(queue)
+
+    async def find(
+        self, addresses: Iterable[str], timeout: float=DEFAULT_SCAN_TIMEOUT
+    ) -> dict[str, MagicSwitchbotAdvertisement]:
+        """Scan until all the requested devices are found or the timeout expires
+
+        Parameters
+        ----------
+            addresses : list
+                Addresses of the devices to look for (case insensitive)
+            timeout : float
+                Max number of seconds to scan for
+
+        Returns
+        -------
+            dict
+                Advertisements of the devices found, indexed by address
+        """
+        wanted = {address.upper() for address in addresses}
+        found: dict[str, MagicSwitchbotAdvertisement] = {}
+        if not wanted:
+            return found
+        async with aclosing(self.discover_iter(timeout)) as advertisements:
+            async for advertisement in advertisements:
+                if advertisement.address.upper() in wanted:
+                    found[advertisement.address] = advertisement
+                    if len(found) == len(wanted):
+                        break
+        return found
+
     '''async def _get_devices_by_model(
         self,
         model: str,
@@ -116,6 +291,289 @@ class GetMagicSwitchbotDevices:
     '''
 
 
+class MagicSwitchbotAdvertisementBus:
+    """Long-lived passive scanner that shares an adapter's advertisements.
+
+    Instead of running a full scan every time a device is updated, a single scanner
+    keeps running on the adapter and every parsed advertisement is delivered to the
+    devices registered for its address through `update_from_advertisement()`.
+    Advertisements that bring nothing new are dropped by a
+    `MagicSwitchbotAdvertisementFilter` before being parsed.
+
+    The bus of an adapter is shared (see `get_advertisement_bus()`), so `start()` and
+    `stop()` are counted: the scanner keeps running until every `start()` has been
+    matched by a `stop()`.
+    """
+
+    def __init__(
+        self, interface: int=0, min_interval: float=0, keepalive: float=ADVERTISEMENT_KEEPALIVE
+    ) -> None:
+        """Advertisement bus constructor."""
+        self._interface = f"hci{interface}"
+        self._filter = MagicSwitchbotAdvertisementFilter(min_interval, keepalive)
+        self._scanner: bleak.BleakScanner | None = None
+        '''Number of start() calls not matched by a stop() yet'''
+        self._users = 0
+        self._adv_data: dict[str, MagicSwitchbotAdvertisement] = {}
+        self._devices: dict[str, list[MagicSwitchbotDevice]] = {}
+        self._listeners: list[Callable[[MagicSwitchbotAdvertisement], None]] = []
+
+    @property
+    def interface(self) -> str:
+        """Returns the name of the adapter the bus listens on."""
+        return self._interface
+
+    @property
+    def running(self) -> bool:
+        """Returns True while the scanner is running."""
+        return self._scanner is not None
+
+    @property
+    def filter(self) -> MagicSwitchbotAdvertisementFilter:
+        """Returns the filter of the advertisements."""
+        return self._filter
+
+    def get_advertisement(self, address: str) -> MagicSwitchbotAdvertisement | None:
+        """Returns the last advertisement received from an address."""
+        return self._adv_data.get(address)
+
+    def register(self, device: MagicSwitchbotDevice) -> Callable[[], None]:
+        """Registers a device to receive its advertisements and returns a function to unregister it."""
+        address = device.get_address()
+        self._devices.setdefault(address, []).append(device)
+        device._adv_bus = self
+        if (advertisement := self._adv_data.get(address)) is not None:
+            device.update_from_advertisement(advertisement)
+
+        def _unregister() -> None:
+            """Unregisters the device from the bus."""
+            self.unregister(device)
+
+        return _unregister
+
+    def unregister(self, device: MagicSwitchbotDevice) -> None:
+        """Stops delivering advertisements to a device."""
+        address = device.get_address()
+        devices = self._devices.get(address)
+        if devices and device in devices:
+            devices.remove(device)
+            if not devices:
+                del self._devices[address]
+        if device._adv_bus is self:
+            device._adv_bus = None
+
+    def add_listener(
+        self, callback: Callable[[MagicSwitchbotAdvertisement], None]
+    ) -> Callable[[], None]:
+        """Adds a callback that receives every parsed advertisement."""
+        self._listeners.append(callback)
+
+        def _remove() -> None:
+            """Removes the listener from the bus."""
+            self._listeners.remove(callback)
+
+        return _remove
+
+    def detection_callback(
+        self,
+        device: BLEDevice,
+        advertisement_data: AdvertisementData,
+    ) -> None:
+        """Callback for device detection."""
+        if not self._filter.accept(device.address, advertisement_data):
+            return
+        advertisement = parse_advertisement_data(device, advertisement_data)
+        if not advertisement:
+            return
+        self._adv_data[advertisement.address] = advertisement
+        for registered in self._devices.get(advertisement.address, ()):
+            registered.update_from_advertisement(advertisement)
+        for listener in self._listeners:
+            listener(advertisement)
+
+    async def start(self) -> None:
+        """Starts listening to advertisements, if no one else started the bus yet."""
+        self._users += 1
+        if self._scanner is not None:
+            return
+        self._filter.clear()
+        scanner = _scanner_class()(
+            detection_callback=self.detection_callback,
+            adapter=self._interface,
+        )
+        try:
+            async with CONNECT_LOCK:
+                await scanner.start()
+        except BaseException:
+            self._users -= 1
+            raise
+        self._scanner = scanner
+        _LOGGER.debug("Advertisement bus started on %s", self._interface)
+
+    async def stop(self) -> None:
+        """Stops listening to advertisements once every user of the bus has stopped it."""
+        self._users = max(self._users - 1, 0)
+        scanner = self._scanner
+        if scanner is None or self._users:
+            return
+        self._scanner = None
+        await scanner.stop()
+        _LOGGER.debug("Advertisement bus stopped on %s", self._interface)
+
+
+_ADVERTISEMENT_BUSES: dict[int, MagicSwitchbotAdvertisementBus] = {}
+
+
+def get_advertisement_bus(interface: int=0) -> MagicSwitchbotAdvertisementBus:
+    """Returns the shared advertisement bus of an adapter, creating it if needed."""
+    bus = _ADVERTISEMENT_BUSES.get(interface)
+    if bus is None:
+        bus = _ADVERTISEMENT_BUSES[interface] = MagicSwitchbotAdvertisementBus(interface)
+    return bus
+
+
+class MagicSwitchbotMultiAdapterScanner:
+    """Listens to advertisements on several adapters to pick the best one for each device
+
+    Every device is assigned to the adapter that heard it with the best recent RSSI,
+    with a penalty for adapters that already have many devices assigned. An adapter
+    that fails to find a device several times in a row isn't used for it any more
+    until it succeeds again or no other adapter is available.
+
+    Parameters
+    ----------
+        interfaces : list
+            Order of the bluetooth adapters to use (0 for hci0, 1 for hci1...)
+        rssi_max_age : float
+            Seconds after which an RSSI reading is considered stale
+        max_failures : int
+            Failures in a row after which an adapter is skipped for a device
+        load_penalty : float
+            dBm subtracted from the RSSI of an adapter for each device assigned to it
+    """
+
+    def __init__(
+        self,
+        interfaces: Iterable[int],
+        rssi_max_age: float=60,
+        max_failures: int=2,
+        load_penalty: float=3,
+    ) -> None:
+        """Multi-adapter scanner constructor."""
+        self._buses = {f"hci{interface}": get_advertisement_bus(interface) for interface in interfaces}
+        self._rssi_max_age = rssi_max_age
+        self._max_failures = max_failures
+        self._load_penalty = load_penalty
+        '''address -> adapter -> (rssi, time seen, BLEDevice as seen by that adapter)'''
+        self._sightings: dict[str, dict[str, tuple[int, float, BLEDevice]]] = {}
+        self._failures: dict[str, dict[str, int]] = {}
+        self._assignments: dict[str, str] = {}
+        '''Buses started by this scanner, to stop only those'''
+        self._started: list[MagicSwitchbotAdvertisementBus] = []
+        self._unsubscribes = [
+            bus.add_listener(partial(self._on_advertisement, adapter))
+            for adapter, bus in self._buses.items()
+        ]
+
+    @property
+    def adapters(self) -> list[str]:
+        """Returns the names of the adapters in use."""
+        return list(self._buses)
+
+    @property
+    def assignments(self) -> dict[str, str]:
+        """Returns the adapter assigned to each device address."""
+        return dict(self._assignments)
+
+    async def start(self) -> None:
+        """Starts listening on every adapter."""
+        for bus in self._buses.values():
+            if bus not in self._started:
+                await bus.start()
+                self._started.append(bus)
+
+    async def stop(self) -> None:
+        """Stops listening and detaches from the adapters' advertisement buses
+
+        The buses are shared, so they keep running while other users have them started.
+        """
+        for unsubscribe in self._unsubscribes:
+            unsubscribe()
+        self._unsubscribes = []
+        started, self._started = self._started, []
+        for bus in started:
+            await bus.stop()
+
+    def _on_advertisement(self, adapter: str, advertisement: MagicSwitchbotAdvertisement) -> None:
+        """Records the RSSI of an advertisement heard on an adapter."""
+        rssi = advertisement.rssi
+        if rssi is None:
+            return
+        self._sightings.setdefault(advertisement.address, {})[adapter] = (
+            rssi, time.monotonic(), advertisement.device
+        )
+
+    def get_rssi(self, address: str) -> dict[str, int]:
+        """Returns the recent RSSI of a device on each adapter that heard it."""
+        oldest = time.monotonic() - self._rssi_max_age
+        return {
+            adapter: rssi
+            for adapter, (rssi, seen, _) in self._sightings.get(address, {}).items()
+            if seen >= oldest
+        }
+
+    def _load(self, adapter: str, address: str) -> int:
+        """Returns the number of other devices assigned to an adapter."""
+        return sum(1 for other, assigned in self._assignments.items() if assigned == adapter and other != address)
+
+    def select_adapter(self, address: str) -> tuple[str, BLEDevice | None] | None:
+        """Chooses the adapter to connect to a device
+
+        Returns
+        -------
+            tuple
+                The adapter name and the BLEDevice as seen by it, or None if no adapter heard the device
+        """
+        oldest = time.monotonic() - self._rssi_max_age
+        failures = self._failures.get(address, {})
+        candidates = [
+            (adapter, rssi, device)
+            for adapter, (rssi, seen, device) in self._sightings.get(address, {}).items()
+            if seen >= oldest
+        ]
+        healthy = [c for c in candidates if failures.get(c[0], 0) < self._max_failures]
+        if healthy:
+            candidates = healthy
+        elif candidates:
+            # Every adapter is failing: try the one that failed the least
+            least = min(failures.get(c[0], 0) for c in candidates)
+            candidates = [c for c in candidates if failures.get(c[0], 0) == least]
+        if not candidates:
+            adapter = self._assignments.get(address)
+            return (adapter, None) if adapter is not None else None
+
+        adapter, _, device = max(
+            candidates, key=lambda c: c[1] - self._load_penalty * self._load(c[0], address)
+        )
+        if self._assignments.get(address) != adapter:
+            _LOGGER.debug("MagicSwitchbot[%s]: Assigned to adapter %s", address, adapter)
+        self._assignments[address] = adapter
+        return adapter, device
+
+    def report_failure(self, address: str, adapter: str) -> None:
+        """Records that an adapter couldn't find a device."""
+        failures = self._failures.setdefault(address, {})
+        failures[adapter] = failures.get(adapter, 0) + 1
+
+    def report_success(self, address: str, adapter: str) -> None:
+        """Records that an adapter connected to a device."""
+        self._failures.get(address, {}).pop(adapter, None)
+
+    def release(self, address: str) -> None:
+        """Forgets the adapter assigned to a device."""
+        self._assignments.pop(address, None)
+
+
 """Parses the data that the device advertises when scanning for it"""
 
 
@@ -128,28 +586,33 @@ def parse_advertisement_data(
     """The data format is:
         - 6 bytes for the device's MAC address
         - 1 byte for the battery level (0-100 deccimal)
-        - 1 byte for EnPSW (password enabled). 00 is for no password and 01 for password enabled"""
-    _mgr_datas = list(advertisement_data.manufacturer_data.values())
+        - 1 byte for EnPSW (password enabled). 00 is for no password and 01 for password enabled
+        - 2 reserved bytes"""
+    _mgr_data = advertisement_data.manufacturer_data.get(MANUFACTURER_ID)
+    if _mgr_data is None and advertisement_data.manufacturer_data:
+        _mgr_data = next(iter(advertisement_data.manufacturer_data.values()))
     
-    if len(_mgr_datas) > 16:
-      _data = _mgr_datas[0].hex()
-      _LOGGER.debug("MagicSwitchbot data: %s", _data)
-      _battery = int("0x" + _data[12:14], 16)
-      _enPsw = int ("0x" + _data[14:16], 16)
+    if _mgr_data is not None and len(_mgr_data) >= ADV_PAYLOAD_LENGTH:
+        _data = bytes(_mgr_data)
+        _battery = _data[6] if _data[6] <= 100 else None
+        _enPsw = _data[7]
     else:
-      _data = ""
-      _battery = 0
-      _enPsw = 0
+        _data = b""
+        _battery = None
+        _enPsw = 0
 
-    _LOGGER.debug("Parsing MagicSwitchbot advertising data. Battery level: %d. Password enabled: %d", _battery, _enPsw)
+    _LOGGER.debug(
+        "Parsing MagicSwitchbot advertising data %s. Battery level: %s. Password enabled: %d",
+        _data, _battery, _enPsw
+    )
     
-    data = {
-        "address": device.address,  # MacOS uses UUIDs
-        "rawAdvData": _data,
-        "data": { "battery": _battery, "rssi": device.rssi },
-        "model": "MagicSwitchbot",
-        "isEncrypted": True if _enPsw == 1 else False
-    }
-
-    return MagicSwitchbotAdvertisement(device.address, data, device)
+    _rssi = getattr(advertisement_data, "rssi", None)
+    return MagicSwitchbotAdvertisement(
+        device.address,  # MacOS uses UUIDs
+        _battery,
+        device.rssi if _rssi is None else _rssi,
+        _enPsw == 1,
+        _data,
+        device,
+    )
   
@@ -0,0 +1,183 @@
+"""Drive many MagicSwitchbot devices at once."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Iterable, Mapping
+
+from .consts import DEFAULT_FLEET_CONCURRENCY
+from .device import MagicSwitchbotDevice
+from .models import MagicSwitchbotFleetResult
+
+_LOGGER = logging.getLogger(__name__)
+
+FLEET_COMMANDS = ("prepare", "turn_on", "turn_off", "push", "get_battery", "get_basic_info", "timed_switch")
+
+
+class MagicSwitchbotFleet:
+    """Group of MagicSwitchbot devices driven with a bounded concurrency per adapter.
+
+    Every adapter (hci interface) gets its own semaphore, so no more than
+    `max_concurrency` devices are talking to the same adapter at the same time.
+    """
+
+    def __init__(
+        self,
+        devices: Iterable[MagicSwitchbotDevice]=(),
+        max_concurrency: int=DEFAULT_FLEET_CONCURRENCY,
+    ) -> None:
+        """MagicSwitchbot fleet constructor."""
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self._max_concurrency = max_concurrency
+        self._devices: dict[str, MagicSwitchbotDevice] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        for device in devices:
+            self.add(device)
+
+    def add(self, device: MagicSwitchbotDevice) -> None:
+        """Adds a device to the fleet."""
+        self._devices[device.get_address()] = device
+
+    def remove(self, address: str) -> MagicSwitchbotDevice | None:
+        """Removes a device from the fleet and returns it."""
+        return self._devices.pop(address, None)
+
+    @property
+    def devices(self) -> dict[str, MagicSwitchbotDevice]:
+        """Returns the devices of the fleet indexed by address."""
+        return dict(self._devices)
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def _get_semaphore(self, device: MagicSwitchbotDevice) -> asyncio.Semaphore:
+        """Returns the semaphore that limits the concurrency of the device's adapter."""
+        adapter = device._interface
+        semaphore = self._semaphores.get(adapter)
+        if semaphore is None:
+            semaphore = self._semaphores[adapter] = asyncio.Semaphore(self._max_concurrency)
+        return semaphore
+
+    def _select(self, addresses: Iterable[str] | None) -> list[MagicSwitchbotDevice]:
+        """Returns the devices to run a command on."""
+        if addresses is None:
+            return list(self._devices.values())
+        return [self._devices[address] for address in addresses]
+
+    async def _run_one(
+        self, device: MagicSwitchbotDevice, command: str, args: tuple[Any, ...]
+    ) -> MagicSwitchbotFleetResult:
+        """Runs a command on a single device once there is a free slot on its adapter."""
+        async with self._get_semaphore(device):
+            start = time.monotonic()
+            result = None
+            error = None
+            try:
+                result = await getattr(device, command)(*args)
+            except Exception as ex:  # pylint: disable=broad-except
+                _LOGGER.debug(
+                    "MagicSwitchbot[%s]: Fleet command %s failed: %s", device.get_address(), command, ex
+                )
+                error = ex
+            return MagicSwitchbotFleetResult(
+                device.get_address(), command, result, error, time.monotonic() - start
+            )
+
+    async def as_completed(
+        self, command: str, *args: Any, addresses: Iterable[str] | None=None
+    ) -> AsyncIterator[MagicSwitchbotFleetResult]:
+        """Runs a command on the fleet and yields every result as soon as it is available
+
+        Parameters
+        ----------
+            command : str
+                Name of the device method to run (for example "turn_on")
+            addresses : list
+                Addresses of the devices to run the command on. All the devices by default
+
+        Yields
+        ------
+            MagicSwitchbotFleetResult
+                Result of the command for a device, in completion order
+        """
+        if command not in FLEET_COMMANDS:
+            raise ValueError(f"Unsupported fleet command: {command}")
+        tasks = [
+            asyncio.create_task(self._run_one(device, command, args))
+            for device in self._select(addresses)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(
+        self, command: str, *args: Any, addresses: Iterable[str] | None=None
+    ) -> dict[str, MagicSwitchbotFleetResult]:
+        """Runs a command on the fleet and returns the results indexed by address."""
+        return {
+            result.address: result
+            async for result in self.as_completed(command, *args, addresses=addresses)
+        }
+
+    async def prepare(self, addresses: Iterable[str] | None=None) -> dict[str, MagicSwitchbotFleetResult]:
+        """Connects and authenticates the devices of the fleet ahead of the commands."""
+        return await self.run("prepare", addresses=addresses)
+
+    async def turn_on(self, addresses: Iterable[str] | None=None) -> dict[str, MagicSwitchbotFleetResult]:
+        """Turns on the devices of the fleet."""
+        return await self.run("turn_on", addresses=addresses)
+
+    async def turn_off(self, addresses: Iterable[str] | None=None) -> dict[str, MagicSwitchbotFleetResult]:
+        """Turns off the devices of the fleet."""
+        return await self.run("turn_off", addresses=addresses)
+
+    async def push(self, addresses: Iterable[str] | None=None) -> dict[str, MagicSwitchbotFleetResult]:
+        """Pushes the devices of the fleet."""
+        return await self.run("push", addresses=addresses)
+
+    async def get_battery(self, addresses: Iterable[str] | None=None) -> dict[str, MagicSwitchbotFleetResult]:
+        """Gets the battery level of the devices of the fleet."""
+        return await self.run("get_battery", addresses=addresses)
+
+    async def timed_switch(
+        self,
+        minutes: float,
+        turn_on: bool,
+        addresses: Iterable[str] | None=None,
+        disconnect: bool=True,
+    ) -> dict[str, MagicSwitchbotFleetResult]:
+        """Programs the devices of the fleet to switch on or off after some minutes
+        
+        The devices keep the timers themselves and, by default, are disconnected as soon as
+        they are programmed, so the host holds no timers or connections afterwards.
+        """
+        return await self.run("timed_switch", minutes, turn_on, disconnect, addresses=addresses)
+
+    async def schedule(
+        self, plan: Mapping[str, tuple[float, bool]], disconnect: bool=True
+    ) -> dict[str, MagicSwitchbotFleetResult]:
+        """Programs a different timed switch on each device
+        
+        Parameters
+        ----------
+            plan : dict
+                Tuples (minutes, turn_on) indexed by device address
+            disconnect : bool
+                Disconnect every device as soon as it is programmed
+
+        Returns
+        -------
+            dict
+                MagicSwitchbotFleetResult indexed by address
+        """
+        results = await asyncio.gather(*(
+            self._run_one(self._devices[address], "timed_switch", (minutes, turn_on, disconnect))
+            for address, (minutes, turn_on) in plan.items()
+        ))
+        return {result.address: result for result in results}
@@ -0,0 +1,165 @@
+"""Latency histograms and counters of the MagicSwitchbot device layer.
+
+Metrics are disabled unless a `MagicSwitchbotMetricsRegistry` is passed to the devices:
+
+    registry = MagicSwitchbotMetricsRegistry()
+    device = MagicSwitchbot(ble_device, metrics=registry)
+    ...
+    print(registry.snapshot())
+    print(registry.to_prometheus())
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Any
+
+'''Upper bounds (in seconds) of the latency histogram buckets'''
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+'''Phases of a command whose latency is measured'''
+PHASES = (
+    "connect",  # establish_connection
+    "resolve_services",  # Looking for the characteristics
+    "start_notify",  # Subscribing to notifications
+    "auth",  # Getting the token
+    "write",  # Writing the command
+    "response",  # Waiting for the response notification
+    "settle",  # Waiting for the mechanical arm to stop
+    "command",  # The whole command, including all of the above and retries
+)
+
+'''Events that are counted'''
+COUNTERS = (
+    "commands",
+    "failures",
+    "connects",
+    "retries",
+    "timeouts",
+    "unexpected_disconnects",
+    "auth_failures",
+)
+
+
+class LatencyHistogram:
+    """Histogram of latencies with fixed buckets."""
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Adds a measure to the histogram."""
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other: LatencyHistogram) -> None:
+        """Adds the measures of another histogram to this one."""
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> float | None:
+        """Returns an estimation (the bucket upper bound) of a quantile, from 0 to 1."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, value in enumerate(self.counts):
+            seen += value
+            if seen >= rank and value:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict[str, Any]:
+        """Returns the histogram as a dictionary."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.counts)),
+        }
+
+
+class MagicSwitchbotMetrics:
+    """Latency histograms and counters of a single device."""
+
+    def __init__(self, address: str) -> None:
+        self.address = address
+        self.histograms = {phase: LatencyHistogram() for phase in PHASES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def observe(self, phase: str, seconds: float) -> None:
+        """Records the latency of a phase."""
+        self.histograms[phase].observe(seconds)
+
+    def increment(self, counter: str, value: int=1) -> None:
+        """Increments a counter."""
+        self.counters[counter] += value
+
+    def snapshot(self) -> dict[str, Any]:
+        """Returns the metrics as a dictionary."""
+        return {
+            "counters": dict(self.counters),
+            "latency": {phase: histogram.snapshot() for phase, histogram in self.histograms.items()},
+        }
+
+
+class MagicSwitchbotMetricsRegistry:
+    """Collects the metrics of many devices."""
+
+    def __init__(self) -> None:
+        self._devices: dict[str, MagicSwitchbotMetrics] = {}
+
+    def get_metrics(self, address: str) -> MagicSwitchbotMetrics:
+        """Returns the metrics of a device, creating them if needed."""
+        metrics = self._devices.get(address)
+        if metrics is None:
+            metrics = self._devices[address] = MagicSwitchbotMetrics(address)
+        return metrics
+
+    def aggregate(self) -> MagicSwitchbotMetrics:
+        """Returns the metrics of all the devices added together."""
+        total = MagicSwitchbotMetrics("*")
+        for metrics in self._devices.values():
+            for phase, histogram in metrics.histograms.items():
+                total.histograms[phase].merge(histogram)
+            for counter, value in metrics.counters.items():
+                total.counters[counter] += value
+        return total
+
+    def snapshot(self) -> dict[str, Any]:
+        """Returns the metrics of every device and their aggregation."""
+        return {
+            "devices": {address: metrics.snapshot() for address, metrics in self._devices.items()},
+            "total": self.aggregate().snapshot(),
+        }
+
+    def to_prometheus(self, prefix: str="magicswitchbot") -> str:
+        """Returns the metrics of every device in Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_phase_seconds Latency of the phases of the commands",
+            f"# TYPE {prefix}_phase_seconds histogram",
+        ]
+        for address, metrics in self._devices.items():
+            for phase, histogram in metrics.histograms.items():
+                labels = f'address="{address}",phase="{phase}"'
+                cumulative = 0
+                for bound, value in zip([*map(str, LATENCY_BUCKETS), "+Inf"], histogram.counts):
+                    cumulative += value
+                    lines.append(f'{prefix}_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{prefix}_phase_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{prefix}_phase_seconds_count{{{labels}}} {histogram.count}")
+        for counter in COUNTERS:
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            for address, metrics in self._devices.items():
+                lines.append(f'{prefix}_{counter}_total{{address="{address}"}} {metrics.counters[counter]}')
+        return "\n".join(lines) + "\n"
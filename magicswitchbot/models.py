@@ -1,10 +1,124 @@
-from typing import Any
-from dataclasses import dataclass
-from bleak.backends.device import BLEDevice
+from __future__ import annotations
 
-@dataclass
+import time
+from typing import TYPE_CHECKING, Any
+from dataclasses import dataclass, field
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+
+from .consts import COMMANDS
+
+@dataclass(slots=True)
 class MagicSwitchbotAdvertisement:
-    """MagicSwitchbot advertisement."""
+    """MagicSwitchbot advertisement
+    
+    The decoded fields of the manufacturer data, the RSSI and when it was received.
+    The `data` property returns the dictionary of previous versions of the library.
+    The same advertisement is shared by every device and listener, so treat it as read-only.
+    """
+    address: str
+    battery: int | None
+    rssi: int | None
+    is_encrypted: bool
+    raw: bytes
+    device: BLEDevice
+    timestamp: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_dict(
+        cls, address: str, data: dict[str, Any], device: BLEDevice, timestamp: float | None=None
+    ) -> MagicSwitchbotAdvertisement:
+        """Creates an advertisement from the dictionary of previous versions
+        
+        Previous versions were built as `MagicSwitchbotAdvertisement(address, data, device)`,
+        which no longer works since the fields are stored one by one. This takes the same
+        arguments.
+
+        Parameters
+        ----------
+            address : str
+                MAC address of the device
+            data : dict
+                Advertisement as returned by the `data` property
+            device : BLEDevice
+                Device that sent the advertisement
+            timestamp : float
+                Monotonic time when the advertisement was received. Defaults to now
+        """
+        values = data.get("data", {})
+        return cls(
+            address,
+            values.get("battery"),
+            values.get("rssi"),
+            bool(data.get("isEncrypted", False)),
+            bytes.fromhex(data.get("rawAdvData", "")),
+            device,
+            time.monotonic() if timestamp is None else timestamp,
+        )
+
+    @property
+    def age(self) -> float:
+        """Returns the seconds since the advertisement was received."""
+        return time.monotonic() - self.timestamp
+
+    @property
+    def data(self) -> dict[str, Any]:
+        """Returns the advertisement as a dictionary, as previous versions did."""
+        return {
+            "address": self.address,
+            "rawAdvData": self.raw.hex(),
+            "data": {"battery": self.battery, "rssi": self.rssi},
+            "model": "MagicSwitchbot",
+            "isEncrypted": self.is_encrypted,
+        }
+
+
+@dataclass
+class MagicSwitchbotFleetResult:
+    """Result of running a command on one device of a fleet."""
+    address: str
+    command: str
+    result: Any
+    error: Exception | None
+    elapsed: float
+
+    @property
+    def success(self) -> bool:
+        """Returns True if the command didn't raise and didn't report a failure."""
+        return self.error is None and self.result is not None and self.result is not False
+
+
+@dataclass(slots=True)
+class MagicSwitchbotCommandResult:
+    """Result of a command sent in a batch."""
+    command: str
+    parameter: str
+    result: bool | None
+    value: Any
+    error: Exception | None
+    elapsed: float
+
+    @property
+    def name(self) -> str:
+        """Returns the name of the command, as in COMMANDS."""
+        return COMMANDS.get(self.command, self.command)
+
+    @property
+    def success(self) -> bool:
+        """Returns True if the command didn't raise and the device reported no error."""
+        return self.error is None and bool(self.result)
+
+
+@dataclass(slots=True)
+class MagicSwitchbotEvent:
+    """Event of the lifecycle of a command, delivered to the observers of a device."""
+    kind: str
     address: str
-    data: dict[str, Any]
-    device: BLEDevice
\ No newline at end of file
+    command: str | None
+    attempt: int
+    timestamp: float
+    duration: float | None = None
+    success: bool | None = None
+    error: BaseException | None = None
+    data: bytes | None = None
@@ -0,0 +1,54 @@
+"""Hooks to trace the lifecycle of the commands sent to a MagicSwitchbot device."""
+
+from __future__ import annotations
+
+from .models import MagicSwitchbotEvent
+
+'''Kinds of events. Each one is delivered to the `on_<kind>` method of the observers'''
+EVENTS = (
+    "connect_start",
+    "connect_end",
+    "auth_start",
+    "auth_end",
+    "write",
+    "notification",
+    "retry",
+    "disconnect",
+)
+
+
+class MagicSwitchbotObserver:
+    """Receives the events of the commands sent to a device
+    
+    Subclass it and override the methods you are interested in, then add it with
+    `MagicSwitchbotDevice.add_observer()`. Every method gets a `MagicSwitchbotEvent` with
+    the device address, the name of the command being sent (as in `COMMANDS`), the
+    attempt number (starting at 1) and the wall clock `timestamp` of the event. The
+    events that close a phase also carry its `duration` in seconds.
+    
+    The methods are called synchronously from the device, so they should return quickly.
+    """
+
+    def on_connect_start(self, event: MagicSwitchbotEvent) -> None:
+        """The device starts connecting."""
+
+    def on_connect_end(self, event: MagicSwitchbotEvent) -> None:
+        """The connection finished. `success` and `error` tell how it went."""
+
+    def on_auth_start(self, event: MagicSwitchbotEvent) -> None:
+        """The device is asked for a token."""
+
+    def on_auth_end(self, event: MagicSwitchbotEvent) -> None:
+        """The token request finished. `success` is True if we got a token."""
+
+    def on_write(self, event: MagicSwitchbotEvent) -> None:
+        """A command frame was written. `data` has the encrypted frame."""
+
+    def on_notification(self, event: MagicSwitchbotEvent) -> None:
+        """A notification was received. `data` has the encrypted frame."""
+
+    def on_retry(self, event: MagicSwitchbotEvent) -> None:
+        """A command is retried. `error` has the error of the previous attempt."""
+
+    def on_disconnect(self, event: MagicSwitchbotEvent) -> None:
+        """The device disconnected. `success` is False when the disconnection was unexpected."""
@@ -0,0 +1,204 @@
+"""Policies that tune how the library manages connections."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+from abc import ABC, abstractmethod
+from typing import Any
+
+from bleak import BleakError
+from bleak_retry_connector import BleakNotFoundError
+
+from .codec import FrameError
+from .consts import DEFAULT_COMMAND_DEADLINE, DEFAULT_RETRY_TIMEOUT, DISCONNECT_DELAY
+
+
+class DisconnectPolicy(ABC):
+    """Decides how long to keep the connection to a device after a command
+
+    A policy can be shared by many devices: its state is kept by device address.
+    Subclasses implement `get_delay()`.
+    """
+
+    def __init__(self) -> None:
+        """Disconnect policy constructor."""
+        self.connects = 0
+        self.reconnects_avoided = 0
+
+    def record_command(self, address: str, now: float, reused: bool) -> None:
+        """Records that a command is about to be sent to a device
+
+        Parameters
+        ----------
+            address : str
+                Address of the device
+            now : float
+                Current time of the event loop
+            reused : bool
+                True if the command found the connection already established
+        """
+        if reused:
+            self.reconnects_avoided += 1
+        else:
+            self.connects += 1
+
+    @abstractmethod
+    def get_delay(self, address: str) -> float | None:
+        """Returns the seconds to wait after a command before disconnecting, or None to stay connected."""
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """Returns the counters of the policy."""
+        return {"connects": self.connects, "reconnects_avoided": self.reconnects_avoided}
+
+
+class FixedDisconnectPolicy(DisconnectPolicy):
+    """Disconnects always after the same delay. This is the default policy."""
+
+    def __init__(self, delay: float=DISCONNECT_DELAY) -> None:
+        super().__init__()
+        self.delay = delay
+
+    def get_delay(self, address: str) -> float | None:
+        return self.delay
+
+
+class AlwaysConnectedPolicy(DisconnectPolicy):
+    """Never disconnects on purpose."""
+
+    def get_delay(self, address: str) -> float | None:
+        return None
+
+
+class ImmediateDisconnectPolicy(DisconnectPolicy):
+    """Disconnects as soon as a command finishes."""
+
+    def get_delay(self, address: str) -> float | None:
+        return 0
+
+
+class AdaptiveDisconnectPolicy(DisconnectPolicy):
+    """Learns how often each device receives commands
+
+    The policy keeps an exponentially weighted average of the time between commands of
+    every device. The connection is kept long enough to catch the next command when it is
+    likely to arrive within `max_delay`, and released right away otherwise.
+
+    Parameters
+    ----------
+        min_delay : float
+            Minimum seconds to keep the connection when it's worth keeping it
+        max_delay : float
+            Max seconds to keep an idle connection
+        initial_delay : float
+            Seconds to keep the connection until the device has some history
+        factor : float
+            How many average intervals to wait for the next command
+        smoothing : float
+            Weight (0 to 1) of the last interval in the average
+    """
+
+    def __init__(
+        self,
+        min_delay: float=2,
+        max_delay: float=DISCONNECT_DELAY,
+        initial_delay: float=10,
+        factor: float=1.5,
+        smoothing: float=0.3,
+    ) -> None:
+        super().__init__()
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.factor = factor
+        self.smoothing = smoothing
+        self._last_command: dict[str, float] = {}
+        self._intervals: dict[str, float] = {}
+
+    def record_command(self, address: str, now: float, reused: bool) -> None:
+        super().record_command(address, now, reused)
+        last = self._last_command.get(address)
+        self._last_command[address] = now
+        if last is None:
+            return
+        interval = now - last
+        average = self._intervals.get(address)
+        if average is None:
+            self._intervals[address] = interval
+        else:
+            self._intervals[address] = average + self.smoothing * (interval - average)
+
+    def get_interval(self, address: str) -> float | None:
+        """Returns the average seconds between commands of a device."""
+        return self._intervals.get(address)
+
+    def get_delay(self, address: str) -> float | None:
+        average = self._intervals.get(address)
+        if average is None:
+            return self.initial_delay
+        expected = average * self.factor
+        if expected > self.max_delay:
+            # The next command is unlikely to arrive while we are connected
+            return 0
+        return max(self.min_delay, expected)
+
+
+class RetryPolicy:
+    """Decides which failed commands are retried and how long to wait before retrying
+
+    Errors are either transient (the adapter is busy, the device didn't answer in time,
+    a corrupted frame...) and worth retrying, or fatal (the device can't be found) and
+    reported right away. Failed authentications are never retried. Retries wait for an
+    exponential backoff with random jitter, so devices failing together don't retry in
+    sync, and the whole command, retries included, must finish before a deadline.
+
+    A policy has no state and can be shared by many devices.
+
+    Parameters
+    ----------
+        base_delay : float
+            Seconds to wait before the first retry. It doubles on each retry
+        max_delay : float
+            Max seconds to wait between retries
+        jitter : float
+            Fraction (0 to 1) of the delay that is randomized. 1 waits anything from 0 to the delay
+        deadline : float
+            Max seconds a command can take, retries included. None means no limit
+    """
+
+    '''Errors that are never retried'''
+    fatal_errors: tuple[type[BaseException], ...] = (BleakNotFoundError,)
+    '''Errors that are retried'''
+    transient_errors: tuple[type[BaseException], ...] = (
+        BleakError,
+        asyncio.TimeoutError,
+        AttributeError,
+        FrameError,
+    )
+
+    def __init__(
+        self,
+        base_delay: float=0.25,
+        max_delay: float=DEFAULT_RETRY_TIMEOUT,
+        jitter: float=1.0,
+        deadline: float | None=DEFAULT_COMMAND_DEADLINE,
+    ) -> None:
+        """Retry policy constructor."""
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def is_transient(self, error: BaseException) -> bool:
+        """Returns True if the command failed with an error worth retrying."""
+        if isinstance(error, self.fatal_errors):
+            return False
+        return isinstance(error, self.transient_errors)
+
+    def get_delay(self, retry: int) -> float:
+        """Returns the seconds to wait before a retry, starting at 1 for the first one."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay * (1 - self.jitter * random.random())
@@ -0,0 +1,147 @@
+"""Connection slots shared by the MagicSwitchbot devices of each adapter."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any
+
+from .consts import DEFAULT_MAX_CONNECTIONS
+
+if TYPE_CHECKING:
+    from .device import MagicSwitchbotDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MagicSwitchbotConnectionPool:
+    """Limits how many devices are connected at once on each bluetooth adapter
+
+    A device asks for a slot before connecting. When its adapter is full, the least
+    recently used idle connection is closed to make room, and the devices that have to
+    wait are served in order of arrival.
+
+    Parameters
+    ----------
+        max_connections : int
+            Max number of devices connected at the same time on each adapter
+    """
+
+    def __init__(self, max_connections: int=DEFAULT_MAX_CONNECTIONS) -> None:
+        """Connection pool constructor."""
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        self._max_connections = max_connections
+        '''Connected devices of each adapter, from least to most recently used'''
+        self._connected: dict[str, OrderedDict[MagicSwitchbotDevice, None]] = {}
+        '''Devices of each adapter that have a slot and are connecting'''
+        self._reserved: dict[str, set[MagicSwitchbotDevice]] = {}
+        self._waiters: dict[str, deque[tuple[MagicSwitchbotDevice, asyncio.Future[None]]]] = {}
+        self._adapters: dict[MagicSwitchbotDevice, str] = {}
+        self._evicting: set[MagicSwitchbotDevice] = set()
+        self.evictions = 0
+        self.waits = 0
+
+    @property
+    def max_connections(self) -> int:
+        """Returns the max number of connections on each adapter."""
+        return self._max_connections
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        """Returns the usage of the pool."""
+        return {
+            "connected": {adapter: len(devices) for adapter, devices in self._connected.items()},
+            "waiting": {adapter: len(waiters) for adapter, waiters in self._waiters.items()},
+            "evictions": self.evictions,
+            "waits": self.waits,
+        }
+
+    def _used(self, adapter: str) -> int:
+        return len(self._connected.get(adapter, ())) + len(self._reserved.get(adapter, ()))
+
+    async def acquire(self, device: MagicSwitchbotDevice) -> None:
+        """Waits until there is a free slot for the device to connect on its adapter."""
+        adapter = device._interface
+        if device in self._connected.get(adapter, ()) or device in self._reserved.get(adapter, ()):
+            return
+        waiters = self._waiters.setdefault(adapter, deque())
+        if not waiters and self._used(adapter) < self._max_connections:
+            self._reserve(adapter, device)
+            return
+
+        self.waits += 1
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        waiters.append((device, future))
+        _LOGGER.debug(
+            "MagicSwitchbot[%s]: Waiting for a connection slot on %s (%d waiting)",
+            device.get_address(), adapter, len(waiters)
+        )
+        self._evict_idle(adapter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We got the slot just when we were cancelled, so we pass it on
+                self.release(device)
+            else:
+                waiters.remove((device, future))
+            raise
+
+    def connected(self, device: MagicSwitchbotDevice) -> None:
+        """Marks the slot of a device as connected."""
+        adapter = self._adapters.get(device, device._interface)
+        self._reserved.get(adapter, set()).discard(device)
+        self._adapters[device] = adapter
+        self._connected.setdefault(adapter, OrderedDict())[device] = None
+
+    def touch(self, device: MagicSwitchbotDevice) -> None:
+        """Marks a device as recently used. If there are devices waiting, idle devices are evicted."""
+        adapter = self._adapters.get(device)
+        if adapter is None:
+            return
+        connected = self._connected.get(adapter)
+        if connected and device in connected:
+            connected.move_to_end(device)
+        if self._waiters.get(adapter):
+            # Let the device release its locks before checking if it is idle
+            asyncio.get_running_loop().call_soon(self._evict_idle, adapter)
+
+    def release(self, device: MagicSwitchbotDevice) -> None:
+        """Frees the slot of a device, when it disconnects or fails to connect."""
+        adapter = self._adapters.pop(device, None)
+        if adapter is None:
+            return
+        self._evicting.discard(device)
+        self._connected.get(adapter, OrderedDict()).pop(device, None)
+        self._reserved.get(adapter, set()).discard(device)
+        waiters = self._waiters.get(adapter)
+        while waiters and self._used(adapter) < self._max_connections:
+            waiter, future = waiters.popleft()
+            if not future.done():
+                self._reserve(adapter, waiter)
+                future.set_result(None)
+
+    def _reserve(self, adapter: str, device: MagicSwitchbotDevice) -> None:
+        self._reserved.setdefault(adapter, set()).add(device)
+        self._adapters[device] = adapter
+
+    def _evict_idle(self, adapter: str) -> None:
+        """Disconnects the least recently used idle devices to serve the waiting ones."""
+        waiters = self._waiters.get(adapter)
+        if not waiters:
+            return
+        needed = len(waiters) - len([d for d in self._evicting if self._adapters.get(d) == adapter])
+        for device in list(self._connected.get(adapter, ())):
+            if needed <= 0:
+                break
+            if device in self._evicting or device._operation_lock.locked() or device._connect_lock.locked():
+                continue
+            _LOGGER.debug(
+                "MagicSwitchbot[%s]: Disconnecting to free a connection slot on %s", device.get_address(), adapter
+            )
+            self._evicting.add(device)
+            self.evictions += 1
+            needed -= 1
+            asyncio.get_running_loop().create_task(device._execute_disconnect())
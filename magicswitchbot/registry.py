@@ -0,0 +1,210 @@
+"""File-backed registry of the MagicSwitchbot devices known by the library."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+
+    from .device import MagicSwitchbotDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+REGISTRY_VERSION = 1
+'''RSSI reported by BlueZ when it's unknown'''
+_UNKNOWN_RSSI = -127
+
+
+def _to_json(value: Any) -> Any:
+    """Returns a copy of a value without the parts that can't be stored as JSON."""
+    if isinstance(value, dict):
+        return {
+            str(key): item for key, item in ((key, _to_json(item)) for key, item in value.items())
+            if item is not None
+        }
+    if isinstance(value, (list, tuple)):
+        return [item for item in map(_to_json, value) if item is not None]
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return None
+
+
+class MagicSwitchbotRegistry:
+    """Keeps what the library learns about each device in a JSON file
+
+    For every device it stores the last `BLEDevice` details (so it can be connected
+    without scanning after a restart), the handles of its characteristics and the
+    information that comes with the token (chip type, firmware, device type and whether
+    it has a password). Passwords and tokens are never stored.
+
+    Devices created with `registry=` restore their data when they are built and record
+    it whenever they connect or authenticate. Changes are written to disk `autosave_delay`
+    seconds after they happen, or when `save()` is called.
+
+    Parameters
+    ----------
+        path : str
+            Path of the JSON file. It is created if it doesn't exist
+        autosave_delay : float
+            Seconds to wait before writing the changes, so several changes are written
+            at once. None disables autosaving
+    """
+
+    def __init__(self, path: str, autosave_delay: float | None=5) -> None:
+        """Device registry constructor."""
+        self._path = path
+        self._autosave_delay = autosave_delay
+        self._devices: dict[str, dict[str, Any]] = {}
+        self._save_handle: asyncio.TimerHandle | None = None
+        self.load()
+
+    @property
+    def path(self) -> str:
+        """Returns the path of the registry file."""
+        return self._path
+
+    @property
+    def addresses(self) -> list[str]:
+        """Returns the addresses of the known devices."""
+        return list(self._devices)
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def get(self, address: str) -> dict[str, Any] | None:
+        """Returns the data stored for a device."""
+        entry = self._devices.get(address)
+        return None if entry is None else dict(entry)
+
+    def ble_device(self, address: str) -> BLEDevice | None:
+        """Returns a BLEDevice built from the last details known of a device, to connect without scanning."""
+        from bleak.backends.device import BLEDevice
+
+        entry = self._devices.get(address)
+        if entry is None:
+            return None
+        return BLEDevice(address, entry.get("name"), entry.get("details"), _UNKNOWN_RSSI)
+
+    def ble_devices(self) -> dict[str, BLEDevice]:
+        """Returns a BLEDevice for every known device, indexed by address."""
+        return {address: self.ble_device(address) for address in self._devices}
+
+    def forget(self, address: str) -> None:
+        """Removes a device from the registry."""
+        if self._devices.pop(address, None) is not None:
+            self._schedule_save()
+
+    def restore(self, device: MagicSwitchbotDevice) -> bool:
+        """Loads the stored data of a device into it. Returns False if the device is unknown."""
+        entry = self._devices.get(device.get_address())
+        if entry is None:
+            return False
+        handles = entry.get("handles")
+        if handles and len(handles) == 2:
+            device._char_handles = (handles[0], handles[1])
+        if entry.get("chip_type") is not None:
+            device._chip_type = entry["chip_type"]
+            device._ver_major = entry.get("firmware_major")
+            device._ver_minor = entry.get("firmware_minor")
+            device._dev_type = entry.get("device_type")
+            device._en_pwd = bool(entry.get("password_enabled"))
+        return True
+
+    def record(self, device: MagicSwitchbotDevice) -> None:
+        """Stores the current data of a device."""
+        address = device.get_address()
+        ble_device = device._device
+        entry = {
+            "name": ble_device.name,
+            "details": _to_json(ble_device.details),
+            "interface": device._interface,
+        }
+        if device._char_handles is not None:
+            entry["handles"] = list(device._char_handles)
+        if device._chip_type is not None:
+            entry.update({
+                "chip_type": device._chip_type,
+                "firmware_major": device._ver_major,
+                "firmware_minor": device._ver_minor,
+                "device_type": device._dev_type,
+                "password_enabled": device._en_pwd,
+            })
+        previous = self._devices.get(address)
+        if previous is not None:
+            entry = {**previous, **entry}
+        if entry != previous:
+            self._devices[address] = entry
+            self._schedule_save()
+
+    def load(self) -> None:
+        """Reads the registry file, discarding the data in memory."""
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            self._devices = {}
+            return
+        except (OSError, ValueError) as ex:
+            _LOGGER.warning("Can't read the MagicSwitchbot registry %s: %s", self._path, ex)
+            self._devices = {}
+            return
+        if not isinstance(content, dict) or content.get("version") != REGISTRY_VERSION:
+            _LOGGER.warning("Ignoring the MagicSwitchbot registry %s: unknown format", self._path)
+            self._devices = {}
+            return
+        self._devices = {
+            address: entry for address, entry in content.get("devices", {}).items() if isinstance(entry, dict)
+        }
+        _LOGGER.debug("Loaded %d devices from the MagicSwitchbot registry %s", len(self._devices), self._path)
+
+    def save(self) -> None:
+        """Writes the registry file now."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._write(self._dumps())
+
+    def _dumps(self) -> str:
+        return json.dumps({"version": REGISTRY_VERSION, "devices": self._devices}, indent=1, sort_keys=True)
+
+    def _write(self, content: str) -> None:
+        """Replaces the registry file atomically, so a crash never leaves it half written."""
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".magicswitchbot-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temp_path, self._path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _schedule_save(self) -> None:
+        """Writes the changes after the autosave delay."""
+        if self._autosave_delay is None or self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not in the event loop: there's no hurry to write
+            return
+        self._save_handle = loop.call_later(self._autosave_delay, self._autosave, loop)
+
+    def _autosave(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Writes the changes in a worker thread."""
+        self._save_handle = None
+        future = loop.run_in_executor(None, self._write, self._dumps())
+        future.add_done_callback(self._autosave_done)
+
+    def _autosave_done(self, future: asyncio.Future[None]) -> None:
+        if not future.cancelled() and (ex := future.exception()) is not None:
+            _LOGGER.error("Can't write the MagicSwitchbot registry %s: %s", self._path, ex)
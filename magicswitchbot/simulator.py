@@ -0,0 +1,363 @@
+"""In-process simulation of MagicSwitchbot devices.
+
+`SimulatedMagicSwitchbot` implements the device side of the protocol and
+`SimulatedTransport` replaces `establish_connection` so a `MagicSwitchbotDevice`
+can talk to simulated devices without any bluetooth hardware:
+
+    transport = SimulatedTransport(latency=0.02, packet_loss=0.01)
+    ble_device = transport.add_device(SimulatedMagicSwitchbot("AA:BB:CC:DD:EE:FF"))
+    device = MagicSwitchbot(ble_device, establish_connection=transport.establish_connection,
+                            notify_timeout=1)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+from typing import Any, Callable
+
+from bleak import BleakError
+from bleak.backends.device import BLEDevice
+from bleak_retry_connector import BleakNotFoundError
+
+from .codec import FRAME_LENGTH, HEADER_LENGTH, TOKEN_LENGTH, decrypt, encrypt, hex_to_bytes
+from .consts import (CMD_GETBAT,
+    CMD_GETTOKEN,
+    CMD_MODIFYPWD,
+    CMD_SWITCH,
+    CMD_TIMEDSWITCH,
+    PAR_SWITCHOFF,
+    PAR_SWITCHON,
+    RC_GETBAT,
+    RC_MODIFYPWD,
+    RC_SWITCH,
+    RC_TIMEDSWITCH,
+    RC_TOKENERR,
+    RC_TOKENOK,
+    STA_ERR,
+    STA_OK,
+    UUID_USERREAD_CHAR,
+    UUID_USERWRITE_CHAR)
+
+_LOGGER = logging.getLogger(__name__)
+
+_CMD_GETTOKEN = hex_to_bytes(CMD_GETTOKEN)
+_CMD_GETBAT = hex_to_bytes(CMD_GETBAT)
+_CMD_SWITCH = hex_to_bytes(CMD_SWITCH)
+_CMD_MODIFYPWD = hex_to_bytes(CMD_MODIFYPWD)
+_CMD_TIMEDSWITCH = hex_to_bytes(CMD_TIMEDSWITCH)
+_STA_OK = hex_to_bytes(STA_OK)
+_STA_ERR = hex_to_bytes(STA_ERR)
+
+'''Handles of the simulated characteristics'''
+WRITE_CHAR_HANDLE = 0x24
+READ_CHAR_HANDLE = 0x27
+
+
+class SimulatedMagicSwitchbot:
+    """Device side of the MagicSwitchbot protocol."""
+
+    def __init__(
+        self,
+        address: str="00:00:00:00:00:00",
+        password: str | None=None,
+        battery: int=100,
+        name: str="MagicSwitchbot",
+        chip_type: int=0x01,
+        firmware: tuple[int, int]=(1, 2),
+        device_type: int=0x07,
+    ) -> None:
+        """Simulated MagicSwitchbot constructor."""
+        self.address = address
+        self.name = name
+        self.password = password or None
+        self.battery = battery
+        self.chip_type = chip_type
+        self.firmware = firmware
+        self.device_type = device_type
+        self.is_on = False
+        self.pushes = 0
+        self.scheduled: tuple[int, int] | None = None
+        self.token: bytes | None = None
+        self.commands_received = 0
+
+    def ble_device(self, rssi: int=-60) -> BLEDevice:
+        """Returns a BLEDevice that represents this simulated device."""
+        return BLEDevice(self.address, self.name, {"simulated": True}, rssi)
+
+    def reset_connection(self) -> None:
+        """Forgets the token of the current connection."""
+        self.token = None
+
+    def handle_frame(self, frame: bytes) -> bytes | None:
+        """Processes an encrypted command and returns the encrypted response
+
+        Parameters
+        ----------
+            frame : bytes
+                The 16 encrypted bytes written by the client
+
+        Returns
+        -------
+            bytes
+                The 16 encrypted bytes of the response, or None if the device doesn't answer
+        """
+        if len(frame) != FRAME_LENGTH:
+            return None
+        plain = decrypt(frame)
+        self.commands_received += 1
+        command = plain[0:2]
+        length = plain[2]
+        if HEADER_LENGTH + length > FRAME_LENGTH:
+            return None
+        param = plain[HEADER_LENGTH:HEADER_LENGTH + length]
+        token = plain[HEADER_LENGTH + length:HEADER_LENGTH + length + TOKEN_LENGTH]
+
+        if command == _CMD_GETTOKEN:
+            expected = self.password.encode() if self.password else b""
+            if param != expected:
+                return self._response(command[0], RC_TOKENERR, _STA_ERR)
+            self.token = os.urandom(TOKEN_LENGTH)
+            info = bytes((
+                self.chip_type,
+                self.firmware[0],
+                self.firmware[1],
+                self.device_type,
+                1 if self.password else 0,
+            ))
+            return self._response(command[0], RC_TOKENOK, self.token + info)
+
+        valid_token = self.token is not None and token == self.token
+        if command == _CMD_GETBAT:
+            value = bytes((self.battery,)) if valid_token else b"\xff"
+            return self._response(command[0], RC_GETBAT, value)
+        if command == _CMD_SWITCH:
+            if not valid_token or param not in (b"\x00", b"\x01", b"\x02"):
+                return self._response(command[0], RC_SWITCH, _STA_ERR)
+            if param == hex_to_bytes(PAR_SWITCHON):
+                self.is_on = True
+            elif param == hex_to_bytes(PAR_SWITCHOFF):
+                self.is_on = False
+            else:
+                self.pushes += 1
+            return self._response(command[0], RC_SWITCH, _STA_OK)
+        if command == _CMD_TIMEDSWITCH:
+            if not valid_token or len(param) != 2 or not 1 <= param[0] <= 48:
+                return self._response(command[0], RC_TIMEDSWITCH, _STA_ERR)
+            self.scheduled = (param[0], param[1])
+            return self._response(command[0], RC_TIMEDSWITCH, _STA_OK)
+        if command == _CMD_MODIFYPWD:
+            if not valid_token or not param:
+                return self._response(command[0], RC_MODIFYPWD, _STA_ERR)
+            self.password = param[1:].decode() if param[0] else None
+            return self._response(command[0], RC_MODIFYPWD, _STA_OK)
+        _LOGGER.debug("Simulated MagicSwitchbot[%s]: Unknown command %s", self.address, command.hex())
+        return None
+
+    @staticmethod
+    def _response(command: int, ret_code: str, param: bytes) -> bytes:
+        """Builds an encrypted response."""
+        plain = bytes((command, hex_to_bytes(ret_code)[0], len(param))) + param
+        return encrypt(plain + os.urandom(FRAME_LENGTH - len(plain)))
+
+
+class SimulatedCharacteristic:
+    """GATT characteristic of a simulated device."""
+
+    def __init__(self, uuid: str, handle: int) -> None:
+        self.uuid = uuid
+        self.handle = handle
+
+    def __repr__(self) -> str:
+        return f"SimulatedCharacteristic({self.uuid}, {self.handle})"
+
+
+class SimulatedServiceCollection:
+    """GATT services of a simulated device."""
+
+    def __init__(self) -> None:
+        self._characteristics = {
+            WRITE_CHAR_HANDLE: SimulatedCharacteristic(UUID_USERWRITE_CHAR, WRITE_CHAR_HANDLE),
+            READ_CHAR_HANDLE: SimulatedCharacteristic(UUID_USERREAD_CHAR, READ_CHAR_HANDLE),
+        }
+
+    def get_characteristic(self, specifier: int | str) -> SimulatedCharacteristic | None:
+        """Returns a characteristic by handle or UUID."""
+        if isinstance(specifier, int):
+            return self._characteristics.get(specifier)
+        for characteristic in self._characteristics.values():
+            if characteristic.uuid == str(specifier).lower():
+                return characteristic
+        return None
+
+
+class SimulatedBleakClient:
+    """Stand-in for BleakClientWithServiceCache connected to a simulated device."""
+
+    def __init__(
+        self,
+        transport: SimulatedTransport,
+        device: SimulatedMagicSwitchbot,
+        disconnected_callback: Callable[[Any], None] | None,
+    ) -> None:
+        self._transport = transport
+        self._device = device
+        self._disconnected_callback = disconnected_callback
+        self._notify_callback: Callable[[int, bytearray], None] | None = None
+        self._connected = True
+        self.services = SimulatedServiceCollection()
+
+    @property
+    def is_connected(self) -> bool:
+        """Returns True while the simulated connection is alive."""
+        return self._connected
+
+    async def get_services(self) -> SimulatedServiceCollection:
+        """Returns the GATT services."""
+        return self.services
+
+    async def start_notify(self, characteristic: Any, callback: Callable[[int, bytearray], None]) -> None:
+        """Subscribes to the notifications of the read characteristic."""
+        self._check_connected()
+        await self._transport._wait_latency()
+        self._notify_callback = callback
+
+    async def write_gatt_char(self, characteristic: Any, data: bytes, response: bool=False) -> None:
+        """Writes a command, scheduling the device's answer as a notification."""
+        self._check_connected()
+        await self._transport._wait_latency()
+        transport = self._transport
+        transport.writes += 1
+        if transport._chance(transport.disconnect_rate):
+            self._drop_connection()
+            raise BleakError("Simulated disconnection")
+        answer = self._device.handle_frame(bytes(data))
+        if answer is None:
+            return
+        if transport._chance(transport.packet_loss):
+            transport.dropped += 1
+            return
+        asyncio.get_running_loop().call_later(transport._get_latency(), self._notify, answer)
+
+    async def disconnect(self) -> bool:
+        """Closes the simulated connection."""
+        if self._connected:
+            self._connected = False
+            self._device.reset_connection()
+            self._transport._connections.pop(self._device.address, None)
+        return True
+
+    def _notify(self, data: bytes) -> None:
+        """Delivers a notification to the subscriber."""
+        if not self._connected or self._notify_callback is None:
+            return
+        self._transport.notifications += 1
+        self._notify_callback(READ_CHAR_HANDLE, bytearray(data))
+
+    def _drop_connection(self) -> None:
+        """Simulates an unexpected disconnection."""
+        self._connected = False
+        self._device.reset_connection()
+        self._transport._connections.pop(self._device.address, None)
+        self._transport.disconnects += 1
+        if self._disconnected_callback is not None:
+            self._disconnected_callback(self)
+
+    def _check_connected(self) -> None:
+        if not self._connected:
+            raise BleakError("Not connected")
+
+
+class SimulatedTransport:
+    """Fake BLE transport that connects clients to simulated devices
+
+    Parameters
+    ----------
+        latency : float
+            Seconds that every write and every notification takes
+        jitter : float
+            Max random seconds added to the latency
+        connect_latency : float
+            Seconds that establishing a connection takes
+        packet_loss : float
+            Probability (0 to 1) that a response notification is lost
+        disconnect_rate : float
+            Probability (0 to 1) that the connection drops when writing a command
+        seed : int
+            Seed for the random generator, to get reproducible runs
+    """
+
+    def __init__(
+        self,
+        latency: float=0.0,
+        jitter: float=0.0,
+        connect_latency: float=0.0,
+        packet_loss: float=0.0,
+        disconnect_rate: float=0.0,
+        seed: int | None=None,
+    ) -> None:
+        """Simulated transport constructor."""
+        self.latency = latency
+        self.jitter = jitter
+        self.connect_latency = connect_latency
+        self.packet_loss = packet_loss
+        self.disconnect_rate = disconnect_rate
+        self._random = random.Random(seed)
+        self._devices: dict[str, SimulatedMagicSwitchbot] = {}
+        self._connections: dict[str, SimulatedBleakClient] = {}
+        self.connects = 0
+        self.writes = 0
+        self.notifications = 0
+        self.dropped = 0
+        self.disconnects = 0
+
+    def add_device(self, device: SimulatedMagicSwitchbot, rssi: int=-60) -> BLEDevice:
+        """Adds a simulated device and returns the BLEDevice to connect to it."""
+        self._devices[device.address] = device
+        return device.ble_device(rssi)
+
+    def get_device(self, address: str) -> SimulatedMagicSwitchbot | None:
+        """Returns the simulated device with the given address."""
+        return self._devices.get(address)
+
+    async def establish_connection(
+        self,
+        client_class: Any,
+        device: BLEDevice,
+        name: str,
+        disconnected_callback: Callable[[Any], None] | None=None,
+        **kwargs: Any,
+    ) -> SimulatedBleakClient:
+        """Connects to a simulated device, with the same signature as bleak_retry_connector's."""
+        simulated = self._devices.get(device.address)
+        if simulated is None:
+            raise BleakNotFoundError(f"{name} - {device.address}: Simulated device not found")
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+        if (previous := self._connections.get(device.address)) is not None:
+            await previous.disconnect()
+        client = SimulatedBleakClient(self, simulated, disconnected_callback)
+        self._connections[device.address] = client
+        self.connects += 1
+        return client
+
+    def disconnect(self, address: str) -> None:
+        """Drops the connection to a device as if it went out of range."""
+        if (client := self._connections.get(address)) is not None:
+            client._drop_connection()
+
+    def _chance(self, probability: float) -> bool:
+        return probability > 0 and self._random.random() < probability
+
+    def _get_latency(self) -> float:
+        if self.jitter:
+            return self.latency + self._random.uniform(0, self.jitter)
+        return self.latency
+
+    async def _wait_latency(self) -> None:
+        if delay := self._get_latency():
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
@@ -0,0 +1,312 @@
+"""The MagicSwitchbot class, that adds the switch commands to the base device."""
+
+import asyncio, logging, time
+from typing import Any
+
+from .consts import *
+from .device import MagicSwitchbotDevice
+from .models import MagicSwitchbotCommandResult
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _SwitchIntent:
+    """Switch command waiting to be sent, that later requests can join
+
+    The request that creates the intent sends it. If that request is cancelled before
+    the command finishes, one of the requests that joined it takes over and sends it.
+    """
+
+    __slots__ = ("parameter", "waiters", "owned", "done", "_changed", "_result", "_error")
+
+    def __init__(self, parameter: str) -> None:
+        self.parameter = parameter
+        '''Requests that joined the intent and wait for its result'''
+        self.waiters = 0
+        '''True while a request is in charge of sending the command'''
+        self.owned = True
+        self.done = False
+        self._changed = asyncio.Event()
+        self._result: bool | None = None
+        self._error: BaseException | None = None
+
+    def set_result(self, result: bool | None) -> None:
+        self._result = result
+        self.done = True
+        self._changed.set()
+
+    def set_error(self, error: BaseException) -> None:
+        self._error = error
+        self.done = True
+        self._changed.set()
+
+    def abandon(self) -> None:
+        """The request sending the command was cancelled: wake up the others to take over."""
+        self.owned = False
+        self._changed.set()
+
+    def claim(self) -> None:
+        """Takes over sending the command."""
+        self.owned = True
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> bool:
+        """Waits until the command is finished (True) or nobody is sending it (False)."""
+        while not self.done:
+            if not self.owned:
+                return False
+            await self._changed.wait()
+        return True
+
+    def result(self) -> bool | None:
+        """Returns the result of the command, or raises its error."""
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class MagicSwitchbot(MagicSwitchbotDevice):
+    """Representation of a MagicSwitchbot."""
+    
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """MagicSwitchbot constructor."""
+        super().__init__(*args, **kwargs)
+        self._switch_lock = asyncio.Lock()
+        self._pending_switch: _SwitchIntent | None = None
+
+    async def update(self, interface: int | None=None) -> None:
+        """Update mode, battery percent and state of device.
+
+        If the device is registered on a running advertisement bus, the cached
+        advertisement data is used right away instead of scanning.
+        """
+        await self.get_device_data(retry=self._retry_count, interface=interface)
+
+    async def turn_on(self, wait_settled: bool=False) -> bool:
+        """Turns the device on
+
+        The method returns as soon as the device acknowledges the command. If `wait_settled`
+        is True, it also waits for the mechanical arm to stop moving.
+        """
+        return await self._switch(PAR_SWITCHON, wait_settled)
+
+    async def turn_off(self, wait_settled: bool=False) -> bool:
+        """Turns the device off
+
+        The method returns as soon as the device acknowledges the command. If `wait_settled`
+        is True, it also waits for the mechanical arm to stop moving.
+        """
+        return await self._switch(PAR_SWITCHOFF, wait_settled)
+      
+    async def push(self, wait_settled: bool=False) -> bool:
+        """Just pushes a button
+
+        The method returns as soon as the device acknowledges the command. If `wait_settled`
+        is True, it also waits for the mechanical arm to retract.
+        """
+        return await self._switch(PAR_SWITCHPUSH, wait_settled)
+
+    async def _switch(self, parameter: str, wait_settled: bool) -> bool:
+        """Queues a switch command, merging it with the pending one when possible
+
+        While a switch command is running, the next on/off request stays pending and
+        later on/off requests are merged into it: the last one wins and every caller
+        gets the result of the command that is finally sent. Pushes are never merged,
+        and a pending push keeps the order of the requests around it.
+
+        Parameters
+        ----------
+            parameter : str
+                One of PAR_SWITCHON, PAR_SWITCHOFF or PAR_SWITCHPUSH
+            wait_settled : bool
+                Wait for the mechanical arm to stop before returning
+
+        Returns
+        -------
+            bool
+                Returns True if the command executed succesfully
+        """
+        intent = self._pending_switch
+        if parameter != PAR_SWITCHPUSH and intent is not None:
+            _LOGGER.debug(
+                "MagicSwitchbot[%s]: Merging switch request %s into pending %s",
+                self._device.address, parameter, intent.parameter
+            )
+            intent.parameter = parameter
+            intent.waiters += 1
+            try:
+                if await intent.wait():
+                    result = intent.result()
+                else:
+                    # The request sending it was cancelled, so we send it ourselves
+                    intent.claim()
+                    result = await self._run_switch_intent(intent)
+            finally:
+                intent.waiters -= 1
+        else:
+            intent = _SwitchIntent(parameter)
+            self._pending_switch = None if parameter == PAR_SWITCHPUSH else intent
+            result = await self._run_switch_intent(intent)
+
+        if result and wait_settled:
+            await self.wait_until_settled()
+        return result
+
+    async def _run_switch_intent(self, intent: _SwitchIntent) -> bool:
+        """Sends a queued switch command once the previous one has finished
+
+        If the caller is cancelled before the command finishes, the intent is handed
+        over to the requests that joined it, or dropped if there are none, so it never
+        blocks the switch commands that come later.
+        """
+        try:
+            async with self._switch_lock:
+                if self._pending_switch is intent:
+                    self._pending_switch = None
+                try:
+                    result = await self._sendCommand(CMD_SWITCH, intent.parameter, self._retry_count)
+                except asyncio.CancelledError:
+                    raise
+                except BaseException as ex:
+                    intent.set_error(ex)
+                    raise
+                intent.set_result(result)
+        finally:
+            if not intent.done:
+                if intent.waiters == 0 and self._pending_switch is intent:
+                    self._pending_switch = None
+                intent.abandon()
+
+        if result and intent.parameter != PAR_SWITCHPUSH:
+            self._override_adv_data = {"isOn": intent.parameter == PAR_SWITCHON}
+
+        _LOGGER.debug(
+            "MagicSwitchbot[%s]: Switch %s result: %s -> %s",
+            self._device.address, intent.parameter, result, self._override_adv_data
+        )
+        self._fire_callbacks()
+        return result
+      
+    async def timed_switch(self, minutes: float, turn_on: bool, disconnect: bool=False) -> bool:
+        """Programs the device to switch on or off after some time
+        
+        The device keeps the timer itself, so once it is programmed we don't need to stay
+        connected or to reconnect when the time comes.
+
+        Parameters
+        ----------
+            minutes : float
+                Minutes from now. The device counts in units of 5 minutes, so it must be a
+                multiple of 5 from 5 to 240
+            turn_on : bool
+                True to switch on when the time comes, False to switch off
+            disconnect : bool
+                Disconnect as soon as the device is programmed
+
+        Returns
+        -------
+            bool
+                Returns True if the device was programmed succesfully
+
+        Raises
+        ------
+            ValueError
+                If the device can't count the given minutes
+        """
+        units = int(minutes // TIMEDSWITCH_UNIT)
+        if units * TIMEDSWITCH_UNIT != minutes or not 1 <= units <= TIMEDSWITCH_MAX_UNITS:
+            raise ValueError(
+                f"minutes must be a multiple of {TIMEDSWITCH_UNIT} from {TIMEDSWITCH_UNIT} "
+                f"to {TIMEDSWITCH_UNIT * TIMEDSWITCH_MAX_UNITS} ({TIMEDSWITCH_UNIT}, "
+                f"{TIMEDSWITCH_UNIT * 2}, ... {TIMEDSWITCH_UNIT * TIMEDSWITCH_MAX_UNITS}), got {minutes}"
+            )
+        parameter = f"{units:02x}{PAR_SWITCHON if turn_on else PAR_SWITCHOFF}"
+        result = await self._sendCommand(CMD_TIMEDSWITCH, parameter, self._retry_count)
+        if result and disconnect:
+            await self.disconnect()
+        return bool(result)
+
+    async def turn_on_in(self, minutes: float, disconnect: bool=False) -> bool:
+        """Programs the device to switch on after some minutes. See `timed_switch()`."""
+        return await self.timed_switch(minutes, True, disconnect)
+
+    async def turn_off_in(self, minutes: float, disconnect: bool=False) -> bool:
+        """Programs the device to switch off after some minutes. See `timed_switch()`."""
+        return await self.timed_switch(minutes, False, disconnect)
+
+    async def send_batch(self, *args: Any, **kwargs: Any) -> list[MagicSwitchbotCommandResult]:
+        """Sends several commands back-to-back in a single transaction
+        
+        See `MagicSwitchbotDevice.send_batch()`. The state of the switch is updated
+        with the last on/off command of the batch that succeeded.
+        """
+        results = await super().send_batch(*args, **kwargs)
+        switched = [
+            r for r in results
+            if r.command == CMD_SWITCH and r.parameter != PAR_SWITCHPUSH and r.success
+        ]
+        if switched:
+            self._override_adv_data = {"isOn": switched[-1].parameter == PAR_SWITCHON}
+            self._fire_callbacks()
+        return results
+
+    async def get_basic_info(self, refresh: bool=False) -> dict[str, Any] | None:
+        """Get device basic settings
+
+        The device information is cached when we get the token, and the battery level is
+        taken from a recent advertisement or reading (newer than `advertisement_ttl`), so
+        unless `refresh` is True the device is only asked for them when we don't know them
+        or the battery level is too old.
+        """
+        battery = None if refresh else self._get_fresh_battery(None, True)
+        if refresh or self._chip_type is None or battery is None:
+            ok = await self._sendCommand(CMD_GETBAT, "01", self._retry_count)
+            if not ok:
+                return None
+            battery = self._battery
+        return {
+            "battery": battery,
+            "firmware": f"{self._ver_major}.{self._ver_minor}",
+            "chip_type": self._chip_type,
+            "device_type": self._dev_type,
+            "password_enabled": self._en_pwd
+        }
+        
+    async def get_battery(self, max_age: float | None=None) -> int | None:
+        """Gets the device's battery level
+        
+        The level advertised by the device is used when the advertisement is newer than
+        `max_age` seconds (the `advertisement_ttl` of the device by default). When `max_age`
+        is given, the last level read from the device is also used if it is newer than that.
+        Otherwise, we connect to the device to ask for it. Use `max_age=0` to always ask the device.
+        Return
+            int
+                Level of the device's battery, from 0 to 100
+        """
+        battery = self._get_fresh_battery(max_age, max_age is not None)
+        if battery is not None:
+            return battery
+        ok = await self._sendCommand(CMD_GETBAT, "01", self._retry_count)
+        if ok:
+            return self._battery
+        else:
+            return None
+
+    def _get_fresh_battery(self, max_age: float | None, readings: bool) -> int | None:
+        """Returns the battery level of a recent advertisement or, if `readings` is True, reading."""
+        if max_age is None:
+            max_age = self._advertisement_ttl
+        advertisement = self.get_fresh_advertisement(max_age)
+        if advertisement is not None and advertisement.battery is not None:
+            if self._battery is None or advertisement.timestamp >= self._battery_time:
+                return advertisement.battery
+        if readings and self._battery is not None and time.monotonic() - self._battery_time <= max_age:
+            return self._battery
+        return None
+
+    def is_on(self) -> bool | None:
+        """Return switch's latest state"""
+        value = self._get_adv_value("isOn")
+        if value is None:
+            return None
+        return value
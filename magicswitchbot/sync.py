@@ -0,0 +1,304 @@
+"""Synchronous, thread-safe access to MagicSwitchbot devices."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING, Any, Coroutine, Iterable, TypeVar
+
+from .consts import DEFAULT_SCAN_TIMEOUT
+from .switchbot import MagicSwitchbot
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+
+    from .models import MagicSwitchbotCommandResult
+
+_LOGGER = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+class MagicSwitchbotSyncClient:
+    """Runs MagicSwitchbot devices on a background event loop, for synchronous code
+
+    The client owns a thread running an asyncio event loop, and every device it creates
+    lives on that loop. Any number of threads can send commands at the same time: they
+    are handed to the loop, so the devices keep their connections, tokens and
+    disconnection timers between calls, as they do in asynchronous code.
+
+    The loop is started on first use (or with `start()`) and stopped by `close()`, which
+    disconnects all the devices first. The client can also be used as a context manager.
+
+    Parameters
+    ----------
+        **device_kwargs
+            Default keyword arguments for the devices created by the client (see the
+            `MagicSwitchbot` constructor)
+    """
+
+    def __init__(self, **device_kwargs: Any) -> None:
+        """Synchronous client constructor."""
+        self._device_kwargs = device_kwargs
+        self._devices: dict[str, MagicSwitchbotSyncDevice] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> MagicSwitchbotSyncClient:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop | None:
+        """Returns the event loop the devices run on, or None if the client isn't running."""
+        return self._loop
+
+    @property
+    def running(self) -> bool:
+        """Returns True if the background loop is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def devices(self) -> dict[str, MagicSwitchbotSyncDevice]:
+        """Returns the devices created by the client, indexed by address."""
+        with self._lock:
+            return dict(self._devices)
+
+    def start(self) -> None:
+        """Starts the background event loop, if it isn't running yet."""
+        with self._lock:
+            if self.running:
+                return
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+            thread = threading.Thread(
+                target=self._run_loop, args=(loop, started), name="magicswitchbot-loop", daemon=True
+            )
+            thread.start()
+            started.wait()
+            self._loop = loop
+            self._thread = thread
+        _LOGGER.debug("MagicSwitchbot sync client: Event loop started")
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop, started: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def close(self, timeout: float | None=None) -> None:
+        """Disconnects all the devices and stops the background event loop
+
+        Parameters
+        ----------
+            timeout : float
+                Max number of seconds to wait for the devices to disconnect
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or thread is None:
+                return
+            self._check_thread(thread)
+            devices = [device.device for device in self._devices.values()]
+            self._devices.clear()
+            self._loop = None
+            self._thread = None
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(devices), loop)
+        try:
+            future.result(timeout)
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.warning("MagicSwitchbot sync client: Error disconnecting the devices: %s", ex)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        _LOGGER.debug("MagicSwitchbot sync client: Event loop stopped")
+
+    @staticmethod
+    async def _shutdown(devices: list[MagicSwitchbot]) -> None:
+        """Disconnects the devices and cancels the tasks left on the loop."""
+        for device in devices:
+            device._cancel_disconnect_timer()
+        await asyncio.gather(*(device._execute_disconnect() for device in devices), return_exceptions=True)
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _check_thread(self, thread: threading.Thread | None=None) -> None:
+        """Blocking calls from the loop thread would wait for themselves forever."""
+        if threading.current_thread() is (thread or self._thread):
+            raise RuntimeError("Blocking MagicSwitchbot calls can't be made from the client's event loop")
+
+    def submit(self, coro: Coroutine[Any, Any, _T]) -> Future[_T]:
+        """Runs a coroutine on the background loop and returns a future with its result."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Coroutine[Any, Any, _T], timeout: float | None=None) -> _T:
+        """Runs a coroutine on the background loop and waits for its result
+
+        Parameters
+        ----------
+            coro : coroutine
+                Coroutine to run
+            timeout : float
+                Max number of seconds to wait. The coroutine is cancelled when it expires
+
+        Raises
+        ------
+            TimeoutError
+                If the coroutine doesn't finish in time
+        """
+        if self._thread is not None:
+            try:
+                self._check_thread()
+            except RuntimeError:
+                coro.close()
+                raise
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def device(
+        self, device: BLEDevice, password: str | None=None, interface: int=0, **kwargs: Any
+    ) -> MagicSwitchbotSyncDevice:
+        """Returns the client's device with the address of `device`, creating it if needed
+
+        Every thread asking for the same address gets the same device, so they share
+        its connection. The keyword arguments are added to the ones given to the client,
+        and are only used when the device is created.
+        """
+        with self._lock:
+            sync_device = self._devices.get(device.address)
+        if sync_device is not None:
+            return sync_device
+        return self.run(self._create_device(device, password, interface, {**self._device_kwargs, **kwargs}))
+
+    async def _create_device(
+        self, device: BLEDevice, password: str | None, interface: int, kwargs: dict[str, Any]
+    ) -> MagicSwitchbotSyncDevice:
+        """Creates the device on the background loop, so it binds to it
+
+        Devices are only created here, so two threads asking for the same address at
+        the same time get the same device.
+        """
+        with self._lock:
+            sync_device = self._devices.get(device.address)
+            if sync_device is None:
+                sync_device = MagicSwitchbotSyncDevice(self, MagicSwitchbot(device, password, interface, **kwargs))
+                self._devices[device.address] = sync_device
+            return sync_device
+
+    def find(
+        self,
+        addresses: Iterable[str],
+        timeout: float=DEFAULT_SCAN_TIMEOUT,
+        interface: int=0,
+        password: str | None=None,
+    ) -> dict[str, MagicSwitchbotSyncDevice]:
+        """Scans for the given addresses and returns a device for each one found, indexed by address."""
+        from .discovery import GetMagicSwitchbotDevices
+
+        found = self.run(GetMagicSwitchbotDevices(interface).find(addresses, timeout))
+        return {
+            address: self.device(advertisement.device, password, interface)
+            for address, advertisement in found.items()
+        }
+
+
+class MagicSwitchbotSyncDevice:
+    """Blocking interface to a MagicSwitchbot device running on a `MagicSwitchbotSyncClient`
+
+    Each method blocks until the command finishes and returns what the asynchronous
+    method returns. To send a command without blocking use `submit()`, which returns a
+    `concurrent.futures.Future`.
+    """
+
+    def __init__(self, client: MagicSwitchbotSyncClient, device: MagicSwitchbot) -> None:
+        """Synchronous device constructor."""
+        self._client = client
+        self._device = device
+
+    @property
+    def device(self) -> MagicSwitchbot:
+        """Returns the asynchronous device, which must only be used on the client's loop."""
+        return self._device
+
+    @property
+    def address(self) -> str:
+        """Returns the MAC address of the device."""
+        return self._device.get_address()
+
+    def submit(self, method: str, *args: Any, **kwargs: Any) -> Future[Any]:
+        """Calls an asynchronous method of the device without blocking
+
+        Parameters
+        ----------
+            method : str
+                Name of the method, for example "turn_on"
+            *args, **kwargs
+                Arguments of the method
+
+        Returns
+        -------
+            Future
+                Future that gets the result of the method
+        """
+        return self._client.submit(getattr(self._device, method)(*args, **kwargs))
+
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        return self._client.run(getattr(self._device, method)(*args, **kwargs))
+
+    def turn_on(self, wait_settled: bool=False) -> bool:
+        """Turns the device on."""
+        return self._call("turn_on", wait_settled)
+
+    def turn_off(self, wait_settled: bool=False) -> bool:
+        """Turns the device off."""
+        return self._call("turn_off", wait_settled)
+
+    def push(self, wait_settled: bool=False) -> bool:
+        """Pushes the button."""
+        return self._call("push", wait_settled)
+
+    def timed_switch(self, minutes: float, turn_on: bool, disconnect: bool=False) -> bool:
+        """Programs the device to switch after some minutes."""
+        return self._call("timed_switch", minutes, turn_on, disconnect)
+
+    def send_batch(
+        self, commands: Iterable[tuple[str, str]], stop_on_failure: bool=False, retries: int | None=None
+    ) -> list[MagicSwitchbotCommandResult]:
+        """Sends several commands on the same connection."""
+        return self._call("send_batch", list(commands), stop_on_failure, retries)
+
+    def get_battery(self, max_age: float | None=None) -> int | None:
+        """Returns the battery level of the device."""
+        return self._call("get_battery", max_age)
+
+    def get_basic_info(self, refresh: bool=False) -> dict[str, Any] | None:
+        """Returns the device information."""
+        return self._call("get_basic_info", refresh)
+
+    def is_reachable(self, max_age: float | None=None) -> bool:
+        """Returns True if the device advertised recently or can be connected."""
+        return self._call("is_reachable", max_age)
+
+    def is_on(self) -> bool | None:
+        """Returns the last known switch state."""
+        return self._device.is_on()
+
+    def disconnect(self) -> None:
+        """Disconnects from the device, unless a command is running."""
+        self._call("disconnect")
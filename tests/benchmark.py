@@ -0,0 +1,294 @@
+'''
+Benchmarks for the MagicSwitchBot devices library
+
+Measures the hot paths of the library and writes the results as JSON, so different
+releases can be compared:
+
+  * Encoding commands (_prepareCommand + _encrypt)
+  * Decoding responses (_decrypt + _processResponse)
+  * Parsing advertisements at a high rate
+  * Full command round trips against the simulated transport (no bluetooth needed)
+  * The time it takes to import the package, checked against a budget
+
+Usage:
+
+    python tests/benchmark.py [--quick] [--output results.json] [--import-budget MS] [--check]
+'''
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from importlib import metadata
+from typing import Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from magicswitchbot import MagicSwitchbot, MagicSwitchbotAdvertisementBus, parse_advertisement_data
+from magicswitchbot.codec import decode_frame, encrypt
+from magicswitchbot.consts import CMD_SWITCH, MANUFACTURER_ID, PAR_SWITCHON
+from magicswitchbot.simulator import SimulatedMagicSwitchbot, SimulatedTransport
+
+'''Max milliseconds that `import magicswitchbot` may take in a fresh interpreter'''
+IMPORT_BUDGET_MS = 50
+'''Modules that must not be loaded until a device is actually used'''
+HEAVY_MODULES = ("bleak", "bleak_retry_connector", "Crypto", "async_timeout")
+
+_IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "t = time.perf_counter()\n"
+    "import magicswitchbot\n"
+    "elapsed = time.perf_counter() - t\n"
+    "print(json.dumps([elapsed, [m for m in {modules!r} if m in sys.modules]]))\n"
+)
+
+
+def _summary(samples: list[float], total: float, operations: int | None=None) -> dict:
+    """Builds the statistics of a list of per-operation durations (in seconds)."""
+    ordered = sorted(samples)
+    if operations is None:
+        operations = len(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1e6
+
+    return {
+        "iterations": operations,
+        "total_s": total,
+        "ops_per_s": operations / total if total else None,
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": percentile(0.50),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "max_us": ordered[-1] * 1e6,
+    }
+
+
+def _time_calls(func, iterations: int, batch: int=100) -> dict:
+    """Times a synchronous function, measuring batches to reduce timer overhead."""
+    samples = []
+    start = time.perf_counter()
+    for _ in range(max(1, iterations // batch)):
+        t = time.perf_counter()
+        for _ in range(batch):
+            func()
+        samples.append((time.perf_counter() - t) / batch)
+    return _summary(samples, time.perf_counter() - start, len(samples) * batch)
+
+
+def _make_device(address: str="AA:BB:CC:DD:EE:FF", **kwargs) -> MagicSwitchbot:
+    return MagicSwitchbot(BLEDevice(address, "MagicSwitchbot", None, -60), **kwargs)
+
+
+def bench_encode(iterations: int) -> dict:
+    """_prepareCommand + _encrypt of a switch command."""
+    device = _make_device()
+    device._token = b"\x01\x02\x03\x04"
+    return _time_calls(lambda: device._prepareCommand(CMD_SWITCH, PAR_SWITCHON), iterations)
+
+
+async def bench_decode(iterations: int) -> dict:
+    """_decrypt + _processResponse of a battery response."""
+    device = _make_device()
+    frame = encrypt(bytes((0x02, 0x02, 0x01, 87)) + bytes(12))
+    batch = 100
+    samples = []
+    start = time.perf_counter()
+    for _ in range(max(1, iterations // batch)):
+        t = time.perf_counter()
+        for _ in range(batch):
+            await device._processResponse(device._decrypt(frame.hex()))
+        samples.append((time.perf_counter() - t) / batch)
+    return _summary(samples, time.perf_counter() - start, len(samples) * batch)
+
+
+def bench_decode_frame(iterations: int) -> dict:
+    """Bytes-native decode_frame of a battery response."""
+    frame = encrypt(bytes((0x02, 0x02, 0x01, 87)) + bytes(12))
+    return _time_calls(lambda: decode_frame(frame), iterations)
+
+
+def _advertisement_stream(devices: int) -> list[tuple[BLEDevice, AdvertisementData]]:
+    """Builds one advertisement for each of many simulated devices."""
+    stream = []
+    for i in range(devices):
+        address = ":".join(f"{b:02X}" for b in i.to_bytes(6, "big"))
+        ble_device = BLEDevice(address, "MagicSwitchbot", None, -60 - i % 30)
+        payload = bytes.fromhex(address.replace(":", "")) + bytes((i % 101, i % 2, 0, 0))
+        advertisement = AdvertisementData(
+            local_name=None,
+            manufacturer_data={MANUFACTURER_ID: payload},
+            service_data={},
+            service_uuids=[],
+            tx_power=None,
+            rssi=-60 - i % 30,
+            platform_data=(),
+        )
+        stream.append((ble_device, advertisement))
+    return stream
+
+
+def bench_advertisements(iterations: int, devices: int=500) -> dict:
+    """parse_advertisement_data over a stream of advertisements from many devices."""
+    stream = _advertisement_stream(devices)
+    position = 0
+
+    def parse_next() -> None:
+        nonlocal position
+        parse_advertisement_data(*stream[position])
+        position = (position + 1) % devices
+
+    return _time_calls(parse_next, iterations)
+
+
+def bench_detection_callback(iterations: int, devices: int=500) -> dict:
+    """Advertisement bus callback over repeated advertisements, half of them from other devices."""
+    stream = _advertisement_stream(devices)
+    for i in range(devices):
+        address = ":".join(f"{b:02X}" for b in (i + devices).to_bytes(6, "big"))
+        stream.append((
+            BLEDevice(address, "Other", None, -70),
+            AdvertisementData(None, {0x004C: bytes(23)}, {}, [], None, -70, ()),
+        ))
+    bus = MagicSwitchbotAdvertisementBus()
+    position = 0
+
+    def callback_next() -> None:
+        nonlocal position
+        bus.detection_callback(*stream[position])
+        position = (position + 1) % len(stream)
+
+    return _time_calls(callback_next, iterations) | bus.filter.stats
+
+
+async def bench_roundtrips(command: str, devices: int, rounds: int, latency: float, **kwargs: Any) -> dict:
+    """Full command round trips against the simulated transport, on several devices at once
+
+    The keyword arguments are passed to the command, for example `max_age=0` so
+    `get_battery` asks the device every time instead of using a cached level.
+    """
+    transport = SimulatedTransport(latency=latency, seed=1)
+    clients = []
+    for i in range(devices):
+        simulated = SimulatedMagicSwitchbot(f"AA:BB:CC:DD:{i // 256:02X}:{i % 256:02X}")
+        clients.append(MagicSwitchbot(
+            transport.add_device(simulated),
+            establish_connection=transport.establish_connection,
+            notify_timeout=1,
+        ))
+    samples: list[float] = []
+    failures = 0
+
+    async def run(client: MagicSwitchbot) -> None:
+        nonlocal failures
+        for _ in range(rounds):
+            t = time.perf_counter()
+            ok = await getattr(client, command)(**kwargs)
+            samples.append(time.perf_counter() - t)
+            if ok is None or ok is False:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(client) for client in clients))
+    total = time.perf_counter() - start
+    for client in clients:
+        await client._execute_disconnect()
+    return _summary(samples, total) | {
+        "devices": devices,
+        "latency_s": latency,
+        "failures": failures,
+        "connects": transport.connects,
+    }
+
+
+def bench_import(runs: int, budget_ms: float=IMPORT_BUDGET_MS) -> dict:
+    """`import magicswitchbot` in fresh interpreters, and the heavy modules it loads."""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    probe = _IMPORT_PROBE.format(modules=HEAVY_MODULES)
+    samples = []
+    loaded: set[str] = set()
+    start = time.perf_counter()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", probe],
+            cwd=root, capture_output=True, text=True, check=True,
+        ).stdout
+        elapsed, heavy = json.loads(output)
+        samples.append(elapsed)
+        loaded.update(heavy)
+    median_ms = statistics.median(samples) * 1e3
+    return _summary(samples, time.perf_counter() - start) | {
+        "median_ms": median_ms,
+        "budget_ms": budget_ms,
+        "heavy_modules": sorted(loaded),
+        "within_budget": median_ms <= budget_ms and not loaded,
+    }
+
+
+async def run_benchmarks(quick: bool, import_budget_ms: float=IMPORT_BUDGET_MS) -> dict:
+    """Runs every benchmark and returns the results."""
+    scale = 1 if quick else 10
+    results = {
+        "import": bench_import(5 if quick else 20, import_budget_ms),
+        "encode_command": bench_encode(2_000 * scale),
+        "decode_response": await bench_decode(2_000 * scale),
+        "decode_frame": bench_decode_frame(2_000 * scale),
+        "parse_advertisement": bench_advertisements(5_000 * scale),
+        "detection_callback": bench_detection_callback(5_000 * scale),
+        "get_battery_roundtrip": await bench_roundtrips("get_battery", 10, 5 * scale, 0.001, max_age=0),
+        "turn_on_roundtrip": await bench_roundtrips("turn_on", 10, 2 if quick else 5, 0.001),
+    }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MagicSwitchbot library benchmarks")
+    parser.add_argument("--quick", action="store_true", help="run fewer iterations")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_MS, metavar="MS",
+                        help=f"max milliseconds to import the package (default {IMPORT_BUDGET_MS})")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with an error if the import budget is exceeded")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    try:
+        version = metadata.version("pyMagicSwitchbot")
+    except metadata.PackageNotFoundError:
+        version = None
+
+    report = {
+        "library_version": version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": asyncio.run(run_benchmarks(args.quick, args.import_budget)),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    import_result = report["results"]["import"]
+    if args.check and not import_result["within_budget"]:
+        print(
+            f"Import budget exceeded: {import_result['median_ms']:.1f} ms (budget {args.import_budget} ms), "
+            f"heavy modules loaded: {', '.join(import_result['heavy_modules']) or 'none'}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Shared fixtures of the tests, that run against the simulated transport (no bluetooth needed)."""
+
+import asyncio
+import inspect
+from typing import Any, Callable
+
+import pytest
+from bleak.backends.scanner import AdvertisementData
+
+from magicswitchbot import MagicSwitchbot
+from magicswitchbot.consts import MANUFACTURER_ID
+from magicswitchbot.simulator import SimulatedMagicSwitchbot, SimulatedTransport
+
+ADDRESS = "AA:BB:CC:DD:EE:01"
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem: pytest.Function) -> bool | None:
+    """Runs the `async def` tests in their own event loop."""
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    kwargs = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    asyncio.run(asyncio.wait_for(pyfuncitem.obj(**kwargs), 30))
+    return True
+
+
+@pytest.fixture
+def transport() -> SimulatedTransport:
+    return SimulatedTransport(latency=0.01, seed=1)
+
+
+@pytest.fixture
+def simulated(transport: SimulatedTransport) -> SimulatedMagicSwitchbot:
+    device = SimulatedMagicSwitchbot(ADDRESS)
+    transport.add_device(device)
+    return device
+
+
+@pytest.fixture
+def make_device(transport: SimulatedTransport, simulated: SimulatedMagicSwitchbot) -> Callable[..., MagicSwitchbot]:
+    """Returns a factory of devices connected to the simulated one. Call it inside the test's loop."""
+
+    def factory(**kwargs: Any) -> MagicSwitchbot:
+        kwargs.setdefault("notify_timeout", 0.5)
+        return MagicSwitchbot(
+            simulated.ble_device(), simulated.password, establish_connection=transport.establish_connection, **kwargs
+        )
+
+    return factory
+
+
+class FakeScanner:
+    """Stand-in for BleakScanner that advertises the simulated devices of `FakeScanner.devices`."""
+
+    devices: list[Any] = []
+    interval = 0.01
+
+    def __init__(self, detection_callback: Callable[..., None] | None=None, adapter: str="hci0") -> None:
+        self._callback = detection_callback
+        self._task: asyncio.Task[None] | None = None
+
+    def register_detection_callback(self, callback: Callable[..., None]) -> None:
+        self._callback = callback
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._advertise())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _advertise(self) -> None:
+        while True:
+            for device in self.devices:
+                await asyncio.sleep(self.interval)
+                payload = bytes.fromhex(device.address.replace(":", "")) + bytes((device.battery, 0, 0, 0))
+                self._callback(
+                    device.ble_device(),
+                    AdvertisementData(None, {MANUFACTURER_ID: payload}, {}, [], None, -60, ()),
+                )
+
+
+@pytest.fixture
+def fake_scanner(monkeypatch: pytest.MonkeyPatch, simulated: SimulatedMagicSwitchbot) -> type[FakeScanner]:
+    """Replaces bleak's scanner with one that advertises the simulated device."""
+    monkeypatch.setattr(FakeScanner, "devices", [simulated])
+    monkeypatch.setattr("magicswitchbot.discovery._scanner_class", lambda: FakeScanner)
+    return FakeScanner
@@ -0,0 +1,81 @@
+"""Choice of the bluetooth adapter for each device when several are available."""
+
+import pytest
+from bleak.backends.device import BLEDevice
+from bleak_retry_connector import BleakNotFoundError
+
+from magicswitchbot import MagicSwitchbot, MagicSwitchbotAdvertisement, MagicSwitchbotMultiAdapterScanner
+
+from conftest import ADDRESS
+
+OTHER = "AA:BB:CC:DD:EE:02"
+
+
+@pytest.fixture
+def scanner(monkeypatch):
+    monkeypatch.setattr("magicswitchbot.discovery._ADVERTISEMENT_BUSES", {})
+    return MagicSwitchbotMultiAdapterScanner([0, 1], max_failures=1)
+
+
+def _hear(scanner, adapter, address, rssi):
+    """Feeds the scanner an advertisement heard on an adapter."""
+    device = BLEDevice(address, "MagicSwitchbot", {"adapter": adapter}, rssi)
+    scanner._on_advertisement(adapter, MagicSwitchbotAdvertisement(address, 100, rssi, False, b"", device))
+
+
+def test_the_adapter_with_the_best_rssi_is_chosen(scanner):
+    assert scanner.select_adapter(ADDRESS) is None
+    _hear(scanner, "hci0", ADDRESS, -80)
+    _hear(scanner, "hci1", ADDRESS, -60)
+    adapter, device = scanner.select_adapter(ADDRESS)
+    assert adapter == "hci1" and device.details == {"adapter": "hci1"}
+    assert scanner.get_rssi(ADDRESS) == {"hci0": -80, "hci1": -60}
+    assert scanner.assignments == {ADDRESS: "hci1"}
+
+
+def test_devices_are_spread_over_the_adapters(scanner):
+    for address in (ADDRESS, OTHER):
+        _hear(scanner, "hci0", address, -60)
+        _hear(scanner, "hci1", address, -62)
+    assert scanner.select_adapter(ADDRESS)[0] == "hci0"
+    # hci0 is 2 dBm better, but it already has a device (3 dBm of penalty)
+    assert scanner.select_adapter(OTHER)[0] == "hci1"
+    scanner.release(ADDRESS)
+    assert scanner.select_adapter(OTHER)[0] == "hci0"
+
+
+def test_failing_adapters_are_skipped_until_they_succeed(scanner):
+    _hear(scanner, "hci0", ADDRESS, -50)
+    _hear(scanner, "hci1", ADDRESS, -70)
+    assert scanner.select_adapter(ADDRESS)[0] == "hci0"
+    scanner.report_failure(ADDRESS, "hci0")
+    assert scanner.select_adapter(ADDRESS)[0] == "hci1"
+    scanner.report_failure(ADDRESS, "hci1")
+    # Every adapter is failing: the one that failed the least is tried
+    scanner.report_failure(ADDRESS, "hci1")
+    assert scanner.select_adapter(ADDRESS)[0] == "hci0"
+    scanner.report_success(ADDRESS, "hci1")
+    scanner.report_failure(ADDRESS, "hci0")
+    assert scanner.select_adapter(ADDRESS)[0] == "hci1"
+
+
+async def test_device_fails_over_to_another_adapter(scanner, transport, simulated):
+    _hear(scanner, "hci0", ADDRESS, -50)
+    _hear(scanner, "hci1", ADDRESS, -70)
+    tried = []
+
+    async def establish_connection(client_class, device, *args, **kwargs):
+        tried.append(device.details["adapter"])
+        if device.details["adapter"] == "hci0":
+            raise BleakNotFoundError("Out of range of hci0")
+        return await transport.establish_connection(client_class, device, *args, **kwargs)
+
+    device = MagicSwitchbot(
+        simulated.ble_device(), simulated.password, establish_connection=establish_connection,
+        adapter_selector=scanner, notify_timeout=0.5,
+    )
+    assert await device.get_battery(max_age=0) == 100
+    assert tried == ["hci0", "hci1"]
+    assert device._interface == "hci1"
+    assert scanner.assignments == {ADDRESS: "hci1"}
+    await device.disconnect()
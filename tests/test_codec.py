@@ -0,0 +1,72 @@
+"""Encoding and decoding of the encrypted protocol frames."""
+
+import pytest
+
+from magicswitchbot.codec import (FRAME_LENGTH,
+    FrameError,
+    MagicSwitchbotResponse,
+    build_frame,
+    decode_frame,
+    decrypt,
+    encode_frame,
+    encrypt,
+    parse_frame)
+from magicswitchbot.consts import CMD_GETBAT, CMD_GETTOKEN
+
+# Known answers of the protocol key: (plain frame, encrypted frame)
+GETBAT_COMMAND = ("02010101010203040000000000000000", "6e140ebd04726784e5f600278e77b051")
+GETBAT_RESPONSE = ("02020164000000000000000000000000", "39251819ed7c442020429377a6e795bf")
+
+
+@pytest.mark.parametrize("plain, encrypted", [GETBAT_COMMAND, GETBAT_RESPONSE])
+def test_known_answers(plain, encrypted):
+    assert encrypt(bytes.fromhex(plain)).hex() == encrypted
+    assert decrypt(bytes.fromhex(encrypted)).hex() == plain
+
+
+def test_command_frame_layout():
+    frame = build_frame(bytes.fromhex(CMD_GETBAT), b"\x01", b"\x01\x02\x03\x04")
+    assert len(frame) == FRAME_LENGTH
+    assert frame[:8] == bytes.fromhex(GETBAT_COMMAND[0])[:8]
+    # Without a token the random fill starts right after the parameter
+    frame = build_frame(bytes.fromhex(CMD_GETTOKEN), b"1234")
+    assert frame[:7] == bytes.fromhex(CMD_GETTOKEN) + b"\x04" + b"1234"
+    assert len(frame) == FRAME_LENGTH
+
+
+def test_encoded_frames_round_trip():
+    command = bytes.fromhex(CMD_GETBAT)
+    encoded = encode_frame(command, b"\x01", b"\xaa\xbb\xcc\xdd")
+    assert len(encoded) == FRAME_LENGTH
+    assert decode_frame(encoded) == MagicSwitchbotResponse(0x02, 0x01, b"\x01")
+    # The random fill makes every encoding of the same command different
+    assert encode_frame(command, b"\x01") != encode_frame(command, b"\x01")
+
+
+def test_responses_are_decoded():
+    response = decode_frame(bytes.fromhex(GETBAT_RESPONSE[1]))
+    assert response == MagicSwitchbotResponse(0x02, 0x02, b"\x64")
+    assert parse_frame(bytearray(bytes.fromhex(GETBAT_RESPONSE[0]))) == response
+    assert str(response) == "Command = 02, Return Code = 02, Length = 1, Params = 64"
+
+
+@pytest.mark.parametrize("length", [0, 15, 17, 32])
+def test_frames_of_the_wrong_length_are_rejected(length):
+    with pytest.raises(FrameError):
+        decode_frame(bytes(length))
+    with pytest.raises(FrameError):
+        parse_frame(bytes(length))
+
+
+def test_parameters_that_dont_fit_are_rejected():
+    command = bytes.fromhex(CMD_GETBAT)
+    assert len(build_frame(command, bytes(9), bytes(4))) == FRAME_LENGTH
+    with pytest.raises(FrameError):
+        build_frame(command, bytes(10), bytes(4))
+    with pytest.raises(FrameError):
+        build_frame(b"\x02", b"\x01")
+
+
+def test_declared_length_is_clamped_to_the_frame():
+    response = parse_frame(bytes((0x02, 0x02, 0xFF)) + bytes(range(13)))
+    assert response.param == bytes(range(13))
@@ -0,0 +1,103 @@
+"""Requests to the control daemon through its Unix socket."""
+
+import asyncio
+import json
+import socket
+
+import pytest
+
+from magicswitchbot import MagicSwitchbotDaemon, MagicSwitchbotDaemonClient, MagicSwitchbotDaemonError
+
+from conftest import ADDRESS
+
+
+@pytest.fixture
+def make_daemon(tmp_path, transport, fake_scanner):
+    """Returns a factory of daemons that reach the simulated device. Call it inside the test's loop."""
+
+    def factory(**kwargs):
+        kwargs.setdefault("notify_timeout", 0.5)
+        return MagicSwitchbotDaemon(
+            str(tmp_path / "daemon.sock"), establish_connection=transport.establish_connection, **kwargs
+        )
+
+    return factory
+
+
+async def test_round_trip(make_daemon, simulated):
+    daemon = make_daemon()
+    await daemon.start()
+    try:
+        async with MagicSwitchbotDaemonClient(daemon.path) as client:
+            assert await client.switch(ADDRESS, on=True)
+            assert simulated.is_on
+            devices = await client.request("devices")
+            assert [device["address"] for device in devices] == [ADDRESS]
+            assert devices[0]["is_on"]
+            with pytest.raises(MagicSwitchbotDaemonError):
+                await client.request("fly", address=ADDRESS)
+    finally:
+        await daemon.stop()
+
+
+async def test_command_finishes_when_the_client_goes_away(make_daemon, simulated):
+    daemon = make_daemon()
+    await daemon.start()
+    try:
+        _, writer = await asyncio.open_unix_connection(daemon.path)
+        writer.write(json.dumps({"id": 1, "method": "switch", "address": ADDRESS, "on": True}).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+        for _ in range(100):
+            if simulated.is_on:
+                break
+            await asyncio.sleep(0.05)
+        assert simulated.is_on
+    finally:
+        await daemon.stop()
+
+
+async def test_start_refuses_a_path_in_use(make_daemon, tmp_path):
+    daemon = make_daemon()
+    await daemon.start()
+    try:
+        with pytest.raises(MagicSwitchbotDaemonError):
+            await make_daemon().start()
+        async with MagicSwitchbotDaemonClient(daemon.path) as client:
+            assert await client.request("devices") == []
+    finally:
+        await daemon.stop()
+
+    other = tmp_path / "other.sock"
+    other.write_text("not a socket")
+    with pytest.raises(MagicSwitchbotDaemonError):
+        await MagicSwitchbotDaemon(str(other)).start()
+    assert other.read_text() == "not a socket"
+
+
+async def test_start_replaces_a_stale_socket(make_daemon):
+    daemon = make_daemon()
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(daemon.path)
+    stale.close()
+    await daemon.start()
+    try:
+        async with MagicSwitchbotDaemonClient(daemon.path) as client:
+            assert await client.request("devices") == []
+    finally:
+        await daemon.stop()
+
+
+async def test_subscribers_get_the_changes_heard_in_advertisements(make_daemon, simulated):
+    daemon = make_daemon()
+    await daemon.start()
+    try:
+        async with MagicSwitchbotDaemonClient(daemon.path) as client:
+            assert await client.battery(ADDRESS) == 100
+            events = client.subscribe(ADDRESS)
+            simulated.battery = 80
+            event = await asyncio.wait_for(events.__anext__(), 2)
+            assert (event["address"], event["battery"]) == (ADDRESS, 80)
+            await events.aclose()
+    finally:
+        await daemon.stop()
@@ -0,0 +1,129 @@
+"""Connection handling of the base device: reconnection and retries."""
+
+import asyncio
+
+import pytest
+from bleak.exc import BleakDBusError
+
+from magicswitchbot import RetryPolicy
+from magicswitchbot.consts import CMD_GETBAT, CMD_SWITCH, CMD_TIMEDSWITCH, PAR_SWITCHON
+from magicswitchbot.simulator import SimulatedBleakClient
+
+from conftest import ADDRESS
+
+
+async def test_reconnects_after_unexpected_disconnect(make_device, transport, simulated):
+    device = make_device()
+    assert await device.get_battery(max_age=0) == 100
+    transport.disconnect(ADDRESS)
+    assert device._token is None
+
+    simulated.battery = 55
+    for _ in range(3):
+        assert await device.get_battery(max_age=0) == 55
+    assert transport.connects == 2
+    await device.disconnect()
+
+
+async def test_prepare_authenticates_again_after_unexpected_disconnect(make_device, transport, simulated):
+    device = make_device()
+    assert await device.prepare() is True
+    transport.disconnect(ADDRESS)
+    assert await device.prepare() is True
+    assert device._token is not None and device._client.is_connected
+    assert await device.turn_on() is True
+    assert simulated.is_on is True
+    await device.disconnect()
+
+
+async def test_disconnect_while_waiting_for_the_response_is_retried(make_device, transport, simulated):
+    device = make_device(notify_timeout=5, retry_policy=RetryPolicy(base_delay=0.01))
+    assert await device.prepare() is True
+    transport.latency = 0.1
+    task = asyncio.create_task(device._sendCommand(CMD_GETBAT, "01"))
+    await asyncio.sleep(0.15)  # The command was written and the response is on its way
+    transport.disconnect(ADDRESS)
+    transport.latency = 0.01
+    # The command fails right away instead of waiting for the notify timeout, and is retried
+    assert await asyncio.wait_for(task, 1) is True
+    assert transport.connects == 2
+    await device.disconnect()
+
+
+async def test_lost_responses_are_retried_with_backoff(make_device, transport, simulated):
+    transport.packet_loss = 0.5
+    device = make_device(notify_timeout=0.1, retry_count=20, retry_policy=RetryPolicy(base_delay=0.01, jitter=0))
+    assert await device.turn_on() is True
+    assert simulated.is_on is True
+    assert transport.dropped > 0
+    await device.disconnect()
+
+
+async def test_retries_stop_at_the_deadline(make_device, transport):
+    transport.packet_loss = 1
+    device = make_device(notify_timeout=0.1, retry_count=100, retry_policy=RetryPolicy(base_delay=0.01, deadline=0.5))
+    start = asyncio.get_running_loop().time()
+    assert not await device.turn_on()
+    assert asyncio.get_running_loop().time() - start < 1
+    await device.disconnect()
+
+
+async def test_batch_uses_one_connection(make_device, transport, simulated):
+    device = make_device()
+    results = await device.send_batch([(CMD_GETBAT, "01"), (CMD_SWITCH, PAR_SWITCHON), (CMD_GETBAT, "01")])
+    assert [(r.name, r.parameter, r.success) for r in results] == [
+        ("CMD_GETBAT", "01", True),
+        ("CMD_SWITCH", PAR_SWITCHON, True),
+        ("CMD_GETBAT", "01", True),
+    ]
+    assert [r.value for r in results] == [100, None, 100]
+    assert all(r.error is None and r.elapsed >= 0 for r in results)
+    assert simulated.is_on is True
+    assert transport.connects == 1
+    # The token is asked for once, then one frame per command
+    assert simulated.commands_received == 4
+    await device.disconnect()
+
+
+async def test_batch_stops_at_the_first_failure(make_device, simulated):
+    device = make_device()
+    batch = [(CMD_GETBAT, "01"), (CMD_TIMEDSWITCH, "0000"), (CMD_SWITCH, PAR_SWITCHON)]
+    results = await device.send_batch(batch, stop_on_failure=True)
+    assert [(r.name, r.success) for r in results] == [("CMD_GETBAT", True), ("CMD_TIMEDSWITCH", False)]
+    assert simulated.is_on is False
+
+    results = await device.send_batch(batch)
+    assert [(r.name, r.success) for r in results] == [
+        ("CMD_GETBAT", True), ("CMD_TIMEDSWITCH", False), ("CMD_SWITCH", True)
+    ]
+    assert simulated.is_on is True
+    await device.disconnect()
+
+
+async def test_batch_rejects_unknown_commands_before_connecting(make_device, transport):
+    device = make_device()
+    with pytest.raises(ValueError):
+        await device.send_batch([(CMD_GETBAT, "01"), ("FFFF", "00")])
+    assert transport.connects == 0
+
+
+async def test_dbus_errors_back_off_as_the_retry_policy_says(make_device, simulated, monkeypatch):
+    errors = [BleakDBusError("org.bluez.Error.InProgress", [])]
+    write = SimulatedBleakClient.write_gatt_char
+
+    async def flaky_write(self, *args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return await write(self, *args, **kwargs)
+
+    monkeypatch.setattr(SimulatedBleakClient, "write_gatt_char", flaky_write)
+    delays = []
+    policy = RetryPolicy(base_delay=0.01, jitter=0)
+    get_delay = policy.get_delay
+    policy.get_delay = lambda retry: delays.append(get_delay(retry)) or delays[-1]
+    device = make_device(retry_policy=policy)
+    start = asyncio.get_running_loop().time()
+    assert await device.turn_on() is True
+    assert delays == [0.01]
+    assert asyncio.get_running_loop().time() - start < 0.2
+    await device.disconnect()
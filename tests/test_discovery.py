@@ -0,0 +1,62 @@
+"""Discovery of devices and filtering of their advertisements."""
+
+from bleak.backends.scanner import AdvertisementData
+
+from magicswitchbot import (GetMagicSwitchbotDevices,
+    MagicSwitchbotAdvertisement,
+    MagicSwitchbotAdvertisementFilter,
+    MagicSwitchbotMultiAdapterScanner,
+    get_advertisement_bus,
+    parse_advertisement_data)
+from magicswitchbot.consts import MANUFACTURER_ID
+
+from conftest import ADDRESS
+
+
+def _advertisement(battery: int=100, manufacturer_id: int=MANUFACTURER_ID) -> AdvertisementData:
+    payload = bytes.fromhex(ADDRESS.replace(":", "")) + bytes((battery, 0, 0, 0))
+    return AdvertisementData(None, {manufacturer_id: payload}, {}, [], None, -60, ())
+
+
+def test_filter_drops_duplicates_and_foreign_advertisements():
+    adv_filter = MagicSwitchbotAdvertisementFilter(keepalive=10)
+    assert adv_filter.accept(ADDRESS, _advertisement())
+    assert not adv_filter.accept(ADDRESS, _advertisement())
+    assert adv_filter.accept(ADDRESS, _advertisement(battery=99))
+    assert not adv_filter.accept(ADDRESS, _advertisement(manufacturer_id=0x004C))
+    assert adv_filter.stats == {"accepted": 2, "foreign": 1, "duplicates": 1, "rate_limited": 0}
+
+
+async def test_find_twice_reports_the_device_both_times(fake_scanner):
+    scanner = GetMagicSwitchbotDevices()
+    assert list(await scanner.find([ADDRESS], timeout=1)) == [ADDRESS]
+    assert list(await scanner.find([ADDRESS], timeout=1)) == [ADDRESS]
+
+
+async def test_discover_twice_reports_the_device_both_times(fake_scanner):
+    scanner = GetMagicSwitchbotDevices()
+    assert ADDRESS in await scanner.discover(scan_timeout=0.1)
+    scanner._adv_data.clear()
+    assert ADDRESS in await scanner.discover(scan_timeout=0.1)
+
+
+def test_advertisement_from_the_dictionary_of_previous_versions(simulated):
+    advertisement = parse_advertisement_data(simulated.ble_device(), _advertisement(battery=42))
+    legacy = MagicSwitchbotAdvertisement.from_dict(ADDRESS, advertisement.data, advertisement.device)
+    assert (legacy.battery, legacy.rssi, legacy.is_encrypted, legacy.raw) == (
+        advertisement.battery, advertisement.rssi, advertisement.is_encrypted, advertisement.raw
+    )
+    assert legacy.data == advertisement.data
+
+
+async def test_multi_adapter_scanner_leaves_the_shared_bus_running(fake_scanner, monkeypatch):
+    monkeypatch.setattr("magicswitchbot.discovery._ADVERTISEMENT_BUSES", {})
+    bus = get_advertisement_bus(0)
+    await bus.start()
+    scanner = MagicSwitchbotMultiAdapterScanner([0])
+    await scanner.start()
+    await scanner.stop()
+    await scanner.stop()
+    assert bus.running
+    await bus.stop()
+    assert not bus.running
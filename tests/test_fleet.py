@@ -0,0 +1,82 @@
+"""Driving many devices at once with a bounded concurrency per adapter."""
+
+import asyncio
+
+import pytest
+
+from magicswitchbot import MagicSwitchbot, MagicSwitchbotFleet
+from magicswitchbot.simulator import SimulatedMagicSwitchbot
+
+
+@pytest.fixture
+def make_fleet(transport):
+    """Returns a factory of fleets of simulated devices, spread over the given adapters."""
+
+    def factory(interfaces, **kwargs):
+        devices = []
+        for n, interface in enumerate(interfaces):
+            simulated = SimulatedMagicSwitchbot(f"AA:BB:CC:DD:EE:{n + 0x10:02X}", battery=50 + n)
+            transport.add_device(simulated)
+            devices.append(MagicSwitchbot(
+                simulated.ble_device(), simulated.password, interface,
+                establish_connection=transport.establish_connection, notify_timeout=0.5,
+            ))
+        return MagicSwitchbotFleet(devices, **kwargs), devices
+
+    return factory
+
+
+def _instrument(device, running, peaks, delay=0.0):
+    """Counts the commands running on the adapter of a device while get_battery runs."""
+    get_battery = device.get_battery
+    adapter = device._interface
+
+    async def instrumented(*args):
+        running[adapter] = running.get(adapter, 0) + 1
+        peaks[adapter] = max(peaks.get(adapter, 0), running[adapter])
+        try:
+            await asyncio.sleep(delay)
+            return await get_battery(*args)
+        finally:
+            running[adapter] -= 1
+
+    device.get_battery = instrumented
+
+
+async def test_concurrency_is_limited_per_adapter(make_fleet):
+    fleet, devices = make_fleet([0] * 5 + [1] * 5, max_concurrency=2)
+    running, peaks = {}, {}
+    for device in devices:
+        _instrument(device, running, peaks, delay=0.02)
+    results = await fleet.get_battery()
+    assert peaks == {"hci0": 2, "hci1": 2}
+    assert {address: result.result for address, result in results.items()} == {
+        device.get_address(): 50 + n for n, device in enumerate(devices)
+    }
+    for device in devices:
+        await device.disconnect()
+
+
+async def test_results_are_yielded_in_completion_order(make_fleet):
+    fleet, devices = make_fleet([0, 1, 2])
+    for device, delay in zip(devices, (0.3, 0.0, 0.15)):
+        _instrument(device, {}, {}, delay)
+    order = [result.address async for result in fleet.as_completed("get_battery")]
+    assert order == [devices[1].get_address(), devices[2].get_address(), devices[0].get_address()]
+    for device in devices:
+        await device.disconnect()
+
+
+async def test_errors_are_reported_per_device(make_fleet):
+    fleet, devices = make_fleet([0, 0])
+    plan = {devices[0].get_address(): (10, True), devices[1].get_address(): (7, True)}
+    results = await fleet.schedule(plan)
+    ok, failed = results[devices[0].get_address()], results[devices[1].get_address()]
+    assert ok.success and ok.error is None and ok.result is True
+    assert not failed.success and isinstance(failed.error, ValueError) and failed.result is None
+    assert failed.command == "timed_switch" and failed.elapsed >= 0
+
+    with pytest.raises(ValueError):
+        await fleet.run("modify_password")
+    with pytest.raises(KeyError):
+        await fleet.turn_on(addresses=["AA:BB:CC:DD:EE:99"])
@@ -0,0 +1,81 @@
+"""Command line interface, driving the simulated device."""
+
+import io
+import json
+
+import pytest
+
+from magicswitchbot import __main__ as cli
+from magicswitchbot.consts import DEFAULT_RETRY_COUNT
+
+from conftest import ADDRESS
+
+
+@pytest.fixture
+def run(monkeypatch, transport, fake_scanner, capsys):
+    """Runs the CLI against the simulated device and returns its exit code and JSON lines."""
+    monkeypatch.setattr("magicswitchbot.device.establish_connection", transport.establish_connection)
+    monkeypatch.setattr("sys.stdin", io.StringIO(""))
+
+    def run(*argv):
+        code = cli.main(["--scan-timeout", "1", *argv])
+        return code, [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    return run
+
+
+def test_parser_defaults_and_options():
+    parser = cli._build_parser()
+    args = parser.parse_args(["on", ADDRESS, "-i", "0", "-i", "1", "-r", "5", "--socket"])
+    assert (args.command, args.addresses, args.interface, args.retries) == ("on", [ADDRESS], [0, 1], 5)
+    assert args.socket == ""
+    args = parser.parse_args(["battery"])
+    assert (args.retries, args.socket, args.interface) == (DEFAULT_RETRY_COUNT, None, None)
+    assert "max attempts" in parser.format_help()
+
+
+def test_command_drives_the_device(run, simulated):
+    code, lines = run("on", ADDRESS.lower())
+    assert code == 0
+    assert simulated.is_on is True
+    assert [(line["address"], line["command"], line["success"]) for line in lines] == [(ADDRESS, "on", True)]
+
+
+def test_devices_not_found_fail(run):
+    code, lines = run("battery", ADDRESS, "AA:BB:CC:DD:EE:99", "--scan-timeout", "0.3")
+    assert code == 1
+    assert {line["address"]: line["success"] for line in lines} == {ADDRESS: True, "AA:BB:CC:DD:EE:99": False}
+    assert [line["error"] for line in lines if not line["success"]] == ["Device not found"]
+
+
+def test_discover_lists_the_devices(run):
+    code, lines = run("discover", "--scan-timeout", "0.2")
+    assert code == 0
+    assert [line["address"] for line in lines] == [ADDRESS]
+
+
+def test_devices_are_read_from_the_file(run, simulated, tmp_path):
+    path = tmp_path / "devices.txt"
+    path.write_text(f"# Living room\n{ADDRESS} {simulated.password or ''}\n")
+    code, lines = run("push", "--file", str(path))
+    assert code == 0
+    assert simulated.pushes == 1
+
+
+def test_missing_devices_are_an_error(run):
+    with pytest.raises(SystemExit):
+        run("on")
+
+
+def test_socket_sends_the_commands_through_the_daemon(run, monkeypatch, tmp_path):
+    calls = []
+
+    async def run_through_daemon(args, targets):
+        calls.append((args.socket, targets))
+        return 0
+
+    monkeypatch.setattr(cli, "run_through_daemon", run_through_daemon)
+    socket = str(tmp_path / "daemon.sock")
+    assert run("off", ADDRESS, "--socket", socket, "--password", "1234")[0] == 0
+    assert run("off", ADDRESS, "--socket")[0] == 0
+    assert calls == [(socket, {ADDRESS: "1234"}), (cli.default_socket_path(), {ADDRESS: None})]
@@ -0,0 +1,104 @@
+"""Latency metrics and trace events of the commands."""
+
+import asyncio
+
+from magicswitchbot import MagicSwitchbot, MagicSwitchbotMetricsRegistry, MagicSwitchbotObserver
+
+from conftest import ADDRESS
+
+
+async def test_prepare_records_the_authentication(make_device):
+    registry = MagicSwitchbotMetricsRegistry()
+    device = make_device(metrics=registry)
+    assert await device.prepare() is True
+    metrics = registry.get_metrics(ADDRESS)
+    assert metrics.histograms["auth"].count == 1
+    assert metrics.counters["auth_failures"] == 0
+    await device.disconnect()
+
+
+async def test_prepare_counts_wrong_passwords(transport, simulated):
+    simulated.password = "1234"
+    registry = MagicSwitchbotMetricsRegistry()
+    device = MagicSwitchbot(
+        simulated.ble_device(), "4321", establish_connection=transport.establish_connection,
+        notify_timeout=0.5, metrics=registry,
+    )
+    assert await device.prepare() is False
+    metrics = registry.get_metrics(ADDRESS)
+    assert metrics.histograms["auth"].count == 1
+    assert metrics.counters["auth_failures"] == 1
+    await device.disconnect()
+
+
+class _Recorder(MagicSwitchbotObserver):
+    def __init__(self) -> None:
+        self.events = []
+
+    def on_auth_start(self, event) -> None:
+        self.events.append(event)
+
+    def on_auth_end(self, event) -> None:
+        self.events.append(event)
+
+    def on_write(self, event) -> None:
+        self.events.append(event)
+
+    def on_notification(self, event) -> None:
+        self.events.append(event)
+
+
+async def test_authentication_events_are_tagged_with_the_token_command(make_device):
+    recorder = _Recorder()
+    device = make_device(observers=[recorder])
+    assert await device.get_battery(max_age=0) == 100
+    assert [(event.kind, event.command) for event in recorder.events] == [
+        ("auth_start", "CMD_GETTOKEN"),
+        ("write", "CMD_GETTOKEN"),
+        ("notification", "CMD_GETTOKEN"),
+        ("auth_end", "CMD_GETTOKEN"),
+        ("write", "CMD_GETBAT"),
+        ("notification", "CMD_GETBAT"),
+    ]
+    await device.disconnect()
+
+
+class _LateObserver(MagicSwitchbotObserver):
+    """Records the connection events it gets."""
+
+    def __init__(self, kinds: list) -> None:
+        self.kinds = kinds
+
+    def on_connect_start(self, event) -> None:
+        self.kinds.append(event.kind)
+
+    def on_connect_end(self, event) -> None:
+        self.kinds.append(event.kind)
+
+
+async def test_observer_added_while_connecting(make_device):
+    first, late = [], []
+    device = make_device()
+
+    class _Adder(_LateObserver):
+        def on_connect_start(self, event) -> None:
+            super().on_connect_start(event)
+            if not late:
+                device.add_observer(_LateObserver(late))
+
+    device.add_observer(_Adder(first))
+    assert await device.get_battery(max_age=0) == 100
+    assert first == ["connect_start", "connect_end"]
+    assert late == ["connect_end"]
+    await device.disconnect()
+
+
+async def test_first_observer_added_while_connecting(make_device, transport):
+    transport.connect_latency = 0.2
+    kinds = []
+    device = make_device()
+    task = asyncio.create_task(device.get_battery(max_age=0))
+    await asyncio.sleep(0.05)
+    device.add_observer(_LateObserver(kinds))
+    assert await task == 100
+    await device.disconnect()
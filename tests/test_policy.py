@@ -0,0 +1,36 @@
+"""Disconnection and retry policies."""
+
+import asyncio
+
+import pytest
+from bleak import BleakError
+from bleak_retry_connector import BleakNotFoundError
+
+from magicswitchbot import DisconnectPolicy, FixedDisconnectPolicy, RetryPolicy
+
+
+def test_disconnect_policy_is_abstract():
+    with pytest.raises(TypeError):
+        DisconnectPolicy()
+
+    class NoDelayPolicy(DisconnectPolicy):
+        pass
+
+    with pytest.raises(TypeError):
+        NoDelayPolicy()
+    assert FixedDisconnectPolicy(5).get_delay("AA:BB:CC:DD:EE:01") == 5
+
+
+def test_retry_backoff_doubles_up_to_the_max_delay():
+    policy = RetryPolicy(base_delay=0.1, max_delay=0.5, jitter=0)
+    assert [policy.get_delay(retry) for retry in range(1, 6)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+    jittered = RetryPolicy(base_delay=0.1, jitter=0.5)
+    assert all(0.1 <= jittered.get_delay(2) <= 0.2 for _ in range(100))
+
+
+def test_retry_policy_tells_transient_from_fatal_errors():
+    policy = RetryPolicy()
+    assert policy.is_transient(BleakError("Busy"))
+    assert policy.is_transient(asyncio.TimeoutError())
+    assert not policy.is_transient(BleakNotFoundError("Gone"))
+    assert not policy.is_transient(ValueError())
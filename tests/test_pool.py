@@ -0,0 +1,29 @@
+"""Sharing the connection slots of an adapter among devices."""
+
+from magicswitchbot import AlwaysConnectedPolicy, MagicSwitchbot, MagicSwitchbotConnectionPool
+from magicswitchbot.simulator import SimulatedMagicSwitchbot
+
+from conftest import ADDRESS
+
+
+async def test_least_recently_used_device_is_evicted(transport, simulated):
+    others = [SimulatedMagicSwitchbot(f"AA:BB:CC:DD:EE:0{n}") for n in (2, 3)]
+    for other in others:
+        transport.add_device(other)
+    pool = MagicSwitchbotConnectionPool(max_connections=2)
+    first, second, third = (
+        MagicSwitchbot(
+            sim.ble_device(), sim.password, establish_connection=transport.establish_connection,
+            connection_pool=pool, disconnect_policy=AlwaysConnectedPolicy(), notify_timeout=0.5,
+        )
+        for sim in (simulated, *others)
+    )
+    assert await first.get_battery(max_age=0) == 100
+    assert await second.get_battery(max_age=0) == 100
+    assert await first.get_battery(max_age=0) == 100  # The second device is now the least recently used
+    assert await third.get_battery(max_age=0) == 100
+    assert set(transport._connections) == {ADDRESS, others[1].address}
+    assert pool.evictions == 1
+    assert pool.stats["connected"] == {"hci0": 2}
+    for device in (first, third):
+        await device.disconnect()
@@ -0,0 +1,82 @@
+"""Devices remembered across restarts in the registry file."""
+
+import asyncio
+import json
+
+from magicswitchbot import MagicSwitchbot, MagicSwitchbotRegistry
+from magicswitchbot.registry import REGISTRY_VERSION
+
+from conftest import ADDRESS
+
+
+def _device(registry, transport, simulated, ble_device=None):
+    return MagicSwitchbot(
+        ble_device or simulated.ble_device(), simulated.password, establish_connection=transport.establish_connection,
+        notify_timeout=0.5, registry=registry,
+    )
+
+
+async def test_devices_are_restored_after_a_restart(tmp_path, transport, simulated):
+    path = str(tmp_path / "registry.json")
+    registry = MagicSwitchbotRegistry(path, autosave_delay=None)
+    device = _device(registry, transport, simulated)
+    assert await device.prepare() is True
+    await device.disconnect()
+    registry.save()
+
+    stored = json.loads((tmp_path / "registry.json").read_text())
+    assert stored["version"] == REGISTRY_VERSION
+    assert set(stored["devices"]) == {ADDRESS}
+    assert "password" not in stored["devices"][ADDRESS] and "token" not in stored["devices"][ADDRESS]
+
+    restarted = MagicSwitchbotRegistry(path, autosave_delay=None)
+    assert restarted.addresses == [ADDRESS]
+    restored = _device(restarted, transport, simulated, restarted.ble_device(ADDRESS))
+    assert restored._char_handles == device._char_handles
+    assert (restored._chip_type, restored._ver_major, restored._ver_minor) == (
+        device._chip_type, device._ver_major, device._ver_minor
+    )
+    assert await restored.turn_on() is True
+    await restored.disconnect()
+
+
+async def test_stale_handles_are_looked_up_again(tmp_path, transport, simulated):
+    registry = MagicSwitchbotRegistry(str(tmp_path / "registry.json"), autosave_delay=None)
+    device = _device(registry, transport, simulated)
+    assert await device.prepare() is True
+    handles = device._char_handles
+    await device.disconnect()
+    registry._devices[ADDRESS]["handles"] = [1000, 1001]
+
+    restored = _device(registry, transport, simulated)
+    assert restored._char_handles == (1000, 1001)
+    assert await restored.get_battery(max_age=0) == 100
+    assert restored._char_handles == handles
+    assert registry.get(ADDRESS)["handles"] == list(handles)
+    await restored.disconnect()
+
+
+async def test_changes_are_saved_after_the_autosave_delay(tmp_path, transport, simulated):
+    path = tmp_path / "registry.json"
+    registry = MagicSwitchbotRegistry(str(path), autosave_delay=0.05)
+    device = _device(registry, transport, simulated)
+    assert await device.prepare() is True
+    assert not path.exists()
+    for _ in range(50):
+        await asyncio.sleep(0.02)
+        if path.exists():
+            break
+    assert ADDRESS in json.loads(path.read_text())["devices"]
+    await device.disconnect()
+
+
+def test_corrupt_or_unknown_files_are_ignored(tmp_path):
+    path = tmp_path / "registry.json"
+    for content in ("{not json", json.dumps([1, 2]), json.dumps({"version": REGISTRY_VERSION + 1, "devices": {}})):
+        path.write_text(content)
+        registry = MagicSwitchbotRegistry(str(path), autosave_delay=None)
+        assert len(registry) == 0
+        registry.save()
+        assert json.loads(path.read_text()) == {"version": REGISTRY_VERSION, "devices": {}}
+
+    assert len(MagicSwitchbotRegistry(str(tmp_path / "missing.json"))) == 0
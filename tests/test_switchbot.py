@@ -0,0 +1,140 @@
+"""Switch commands: coalescing of pending requests, cancellation and timers."""
+
+import asyncio
+
+import pytest
+
+from magicswitchbot.codec import decrypt
+from magicswitchbot.consts import ARM_SETTLE_TIME, CMD_TIMEDSWITCH
+
+
+async def test_pending_requests_are_merged(make_device, transport, simulated):
+    device = make_device()
+    first = asyncio.create_task(device.turn_on())
+    await asyncio.sleep(0)
+    merged = [asyncio.create_task(device.turn_off()), asyncio.create_task(device.turn_on())]
+    await asyncio.sleep(0)
+    merged.append(asyncio.create_task(device.turn_off()))
+
+    assert await first is True
+    assert await asyncio.gather(*merged) == [True, True, True]
+    # The merged requests are sent as a single command, the last one requested
+    assert simulated.is_on is False
+    assert device.is_on() is False
+    assert simulated.commands_received == 3  # Token, first switch and merged switch
+    await device.disconnect()
+
+
+async def test_pushes_are_not_merged(make_device, simulated):
+    device = make_device()
+    await asyncio.gather(device.push(), device.push())
+    assert simulated.pushes == 2
+    await device.disconnect()
+
+
+async def test_cancelled_pending_request_does_not_block_later_ones(make_device, simulated):
+    device = make_device()
+    first = asyncio.create_task(device.turn_on())
+    await asyncio.sleep(0)
+    pending = asyncio.create_task(device.turn_off())
+    await asyncio.sleep(0)
+    pending.cancel()
+    await asyncio.gather(pending, return_exceptions=True)
+
+    assert await first is True
+    assert device._pending_switch is None
+    assert await asyncio.wait_for(device.turn_on(), ARM_SETTLE_TIME + 2) is True
+    await device.disconnect()
+
+
+async def test_merged_request_takes_over_a_cancelled_one(make_device, simulated):
+    device = make_device()
+    first = asyncio.create_task(device.turn_on())
+    await asyncio.sleep(0)
+    owner = asyncio.create_task(device.turn_off())
+    await asyncio.sleep(0)
+    merged = asyncio.create_task(device.turn_off())
+    await asyncio.sleep(0)
+    owner.cancel()
+
+    assert await first is True
+    # The merged request gets its own result, not the cancellation of the other one
+    assert await asyncio.wait_for(merged, ARM_SETTLE_TIME + 2) is True
+    assert simulated.is_on is False
+    assert device._pending_switch is None
+    await device.disconnect()
+
+
+async def test_requests_cancelled_while_connecting_dont_break_the_device(make_device, transport, simulated):
+    device = make_device()
+    transport.latency = 0.2
+    owner = asyncio.create_task(device.turn_on())
+    await asyncio.sleep(0.05)
+    # The first command is being sent: queue a request and merge another one into it
+    second = asyncio.create_task(device.turn_off())
+    await asyncio.sleep(0)
+    merged = asyncio.create_task(device.turn_off())
+    await asyncio.sleep(0)
+    owner.cancel()
+    second.cancel()
+    await asyncio.gather(owner, second, return_exceptions=True)
+
+    transport.latency = 0.01
+    assert await asyncio.wait_for(merged, ARM_SETTLE_TIME + 3) is True
+    assert simulated.is_on is False
+    await device.disconnect()
+
+
+async def test_basic_info_reads_the_battery_again_when_it_is_too_old(make_device, transport, simulated):
+    device = make_device(advertisement_ttl=0.2)
+    assert (await device.get_basic_info())["battery"] == 100
+    simulated.battery = 90
+    writes = transport.writes
+    # Within the TTL the cached level is used
+    assert (await device.get_basic_info())["battery"] == 100
+    assert await device.get_battery(max_age=0.2) == 100
+    assert transport.writes == writes
+
+    await asyncio.sleep(0.25)
+    assert (await device.get_basic_info())["battery"] == 90
+    assert transport.writes == writes + 1
+    await device.disconnect()
+
+
+async def test_get_battery_asks_the_device_by_default(make_device, transport, simulated):
+    device = make_device()
+    assert await device.get_battery() == 100
+    simulated.battery = 90
+    writes = transport.writes
+    # Only advertisements are trusted by default, readings need an explicit max_age
+    assert await device.get_battery(max_age=60) == 100
+    assert transport.writes == writes
+    assert await device.get_battery() == 90
+    assert transport.writes == writes + 1
+    await device.disconnect()
+
+
+async def test_timed_switch_frame(make_device, simulated):
+    frames = []
+    handle_frame = simulated.handle_frame
+
+    def record(frame):
+        frames.append(decrypt(frame))
+        return handle_frame(frame)
+
+    simulated.handle_frame = record
+    device = make_device()
+    assert await device.timed_switch(240, True) is True
+    assert simulated.scheduled == (48, 1)
+    assert frames[-1][:5] == bytes.fromhex(CMD_TIMEDSWITCH) + bytes((2, 48, 1))
+    assert await device.turn_off_in(5.0) is True
+    assert frames[-1][:5] == bytes.fromhex(CMD_TIMEDSWITCH) + bytes((2, 1, 0))
+    await device.disconnect()
+
+
+@pytest.mark.parametrize("minutes", [0, 2.4, 4, 7, 241, 245, -5])
+async def test_timed_switch_rejects_minutes_the_device_cant_count(make_device, transport, minutes):
+    device = make_device()
+    with pytest.raises(ValueError, match="multiple of 5 from 5 to 240"):
+        await device.timed_switch(minutes, True)
+    assert transport.connects == 0
@@ -0,0 +1,67 @@
+"""Blocking access to the devices from other threads."""
+
+import asyncio
+import threading
+
+import pytest
+
+from magicswitchbot import MagicSwitchbotSyncClient
+
+from conftest import ADDRESS
+
+
+@pytest.fixture
+def client(transport):
+    with MagicSwitchbotSyncClient(establish_connection=transport.establish_connection, notify_timeout=0.5) as client:
+        yield client
+
+
+def test_calls_from_other_threads_share_the_device(client, transport, simulated):
+    results = {}
+
+    def worker(n):
+        device = client.device(simulated.ble_device(), simulated.password)
+        results[n] = (device, device.get_battery(max_age=0))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert {battery for _, battery in results.values()} == {100}
+    assert len({id(device) for device, _ in results.values()}) == 1
+    assert list(client.devices) == [ADDRESS]
+    # The connection is kept between the calls
+    assert transport.connects == 1
+
+
+def test_close_disconnects_and_stops_the_loop(transport, simulated):
+    client = MagicSwitchbotSyncClient(establish_connection=transport.establish_connection, notify_timeout=0.5)
+    assert client.device(simulated.ble_device(), simulated.password).turn_on() is True
+    assert simulated.is_on is True
+    loop = client.loop
+    client.close()
+    assert not client.running and client.loop is None
+    assert loop.is_closed()
+    assert not transport._connections
+    client.close()
+
+
+def test_exceptions_reach_the_caller(client, simulated):
+    async def fail():
+        raise KeyError("on the loop")
+
+    with pytest.raises(KeyError):
+        client.run(fail())
+    with pytest.raises(ValueError):
+        client.device(simulated.ble_device(), simulated.password).timed_switch(7, True)
+    with pytest.raises(asyncio.TimeoutError):
+        client.run(asyncio.sleep(1), timeout=0.05)
+
+
+def test_blocking_calls_from_the_loop_are_refused(client):
+    async def nested():
+        return client.run(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError):
+        client.run(nested())